@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+'''
+Benchmarks of the PLIN message and ioctl paths, run against the device emulator.
+
+Usage: python -m benchmarks.bench_plin [--iterations N] [--only NAME ...] [--capture FILE] [--output FILE]
+
+Results are written as JSON: for every benchmark, the operations and frames per second, the latency percentiles of one
+operation in microseconds, and the memory blocks allocated and still alive when one operation returns, its result
+included, and the peak bytes it allocated.
+'''
+import argparse
+import contextlib
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from plin.capture import CaptureReader
+from plin.clock import ClockSync
+from plin.emulator import EmulatedPLIN, PLINEmulator
+from plin.enums import *
+from plin.statistics import BusStatistics
+from plin.structs import *
+
+# A benchmark yields the operation to measure and an optional untimed preparation run before every operation.
+# An operation returning an int processed that many frames, any other operation processed one frame.
+Benchmark = Callable[[List[bytes]], Iterator[Tuple[Callable[[], Any], Optional[Callable[[], None]]]]]
+BENCHMARKS: Dict[str, Benchmark] = {}
+
+
+def benchmark(name: str):
+    def register(function):
+        BENCHMARKS[name] = contextlib.contextmanager(function)
+        return function
+    return register
+
+
+@contextlib.contextmanager
+def emulated_device(mode: PLINMode):
+    plin = EmulatedPLIN(PLINEmulator(time_scale=0, rx_queue_size=8192))
+    plin.start(mode=mode, baudrate=19200)
+    try:
+        yield plin
+    finally:
+        plin.stop()
+
+
+def default_records(count: int = 1024) -> List[bytes]:
+    return [bytes(PLINMessage(type=PLINMessageType.FRAME, id=i % 60, len=8, dir=PLINFrameDirection.SUBSCRIBER,
+                              cs_type=PLINFrameChecksumType.ENHANCED, ts_us=i * 5000, data=bytearray([i & 0x7f] * 8)))
+            for i in range(count)]
+
+
+def _refill(plin: EmulatedPLIN, records: List[bytes], batch: int = 256):
+    '''
+    Returns a preparation function keeping frames queued on the emulated device.
+    '''
+    state = {"queued": 0, "next": 0}
+
+    def prepare():
+        if state["queued"] <= 0:
+            messages = [PLINMessage.from_buffer_copy(records[(state["next"] + i) % len(records)]) for i in range(batch)]
+            state["next"] += batch
+            plin.emulator.inject(messages)
+            state["queued"] = batch
+    return prepare, state
+
+
+@benchmark("read")
+def bench_read(records: List[bytes]):
+    with emulated_device(PLINMode.SLAVE) as plin:
+        prepare, state = _refill(plin, records)
+
+        def op():
+            message = plin.read(timeout_ms=0)
+            # Refill as soon as the device runs dry, e.g. if a recorded frame was invalid.
+            state["queued"] = state["queued"] - 1 if message is not None else 0
+            return message
+        yield op, prepare
+
+
+@benchmark("read_many")
+def bench_read_many(records: List[bytes]):
+    with emulated_device(PLINMode.SLAVE) as plin:
+        prepare, state = _refill(plin, records)
+
+        def op():
+            count = len(plin.read_many(64, timeout_ms=0))
+            state["queued"] = state["queued"] - count if count else 0
+            return count
+        yield op, prepare
+
+
+@benchmark("write")
+def bench_write(records: List[bytes]):
+    with emulated_device(PLINMode.MASTER) as plin:
+        message = PLINMessage(type=PLINMessageType.FRAME, id=0x3c, len=8, dir=PLINFrameDirection.PUBLISHER,
+                              cs_type=PLINFrameChecksumType.CLASSIC, data=bytearray([0x7f] * 8))
+        yield (lambda: plin.write(message)), None
+
+
+@benchmark("write_many")
+def bench_write_many(records: List[bytes]):
+    with emulated_device(PLINMode.MASTER) as plin:
+        message = PLINMessage(type=PLINMessageType.FRAME, id=0x3c, len=8, dir=PLINFrameDirection.PUBLISHER,
+                              cs_type=PLINFrameChecksumType.CLASSIC, data=bytearray([0x7f] * 8))
+        batch = (PLINMessage * 16)(*([message] * 16))
+        yield (lambda: plin.write_many(batch)), None
+
+
+@benchmark("from_buffer_copy")
+def bench_from_buffer_copy(records: List[bytes]):
+    index = iter(range(sys.maxsize))
+    yield (lambda: PLINMessage.from_buffer_copy(records[next(index) % len(records)])), None
+
+
+@benchmark("asdict")
+def bench_asdict(records: List[bytes]):
+    messages = [PLINMessage.from_buffer_copy(record) for record in records]
+    index = iter(range(sys.maxsize))
+    yield (lambda: messages[next(index) % len(messages)]._asdict()), None
+
+
+@benchmark("frame_from_buffer")
+def bench_frame_from_buffer(records: List[bytes]):
+    index = iter(range(sys.maxsize))
+    yield (lambda: PLINFrame.from_buffer(records[next(index) % len(records)])), None
+
+
+@benchmark("frame_iter_buffer")
+def bench_frame_iter_buffer(records: List[bytes]):
+    batch = b''.join(records[:64])
+    yield (lambda: len(list(PLINFrame.iter_buffer(batch)))), None
+
+
+@benchmark("bus_statistics")
+def bench_bus_statistics(records: List[bytes]):
+    statistics = BusStatistics()
+    messages = [PLINMessage.from_buffer_copy(record) for record in records]
+    index = iter(range(sys.maxsize))
+    yield (lambda: statistics.update(messages[next(index) % len(messages)])), None
+
+
+@benchmark("clock_to_host")
+def bench_clock_to_host(records: List[bytes]):
+    sync = ClockSync()
+    batch = b''.join(records[:64])
+    sync.update_batch(batch)
+    timestamps = [frame.ts_us for frame in PLINFrame.iter_buffer(batch)]
+    yield (lambda: len(sync.to_host_array(timestamps))), None
+
+
+@benchmark("set_frame_entry_data")
+def bench_set_frame_entry_data(records: List[bytes]):
+    with emulated_device(PLINMode.SLAVE) as plin:
+        plin.set_frame_entry(0x22, PLINFrameDirection.PUBLISHER, PLINFrameChecksumType.ENHANCED, len=8)
+        data = bytearray(range(8))
+        yield (lambda: plin.set_frame_entry_data(0x22, index=0, data=data, len=8)), None
+
+
+@benchmark("publisher_update")
+def bench_publisher_update(records: List[bytes]):
+    with emulated_device(PLINMode.SLAVE) as plin:
+        plin.set_frame_entry(0x22, PLINFrameDirection.PUBLISHER, PLINFrameChecksumType.ENHANCED, len=8)
+        publisher = plin.publisher(0x22)
+        # A changing signal in the first two bytes, the rest of the frame unchanged.
+        data = [bytes([i & 0xff, i >> 8, 0, 0, 0, 0, 0, 0]) for i in range(256)]
+        index = iter(range(sys.maxsize))
+        yield (lambda: publisher.update(data[next(index) % len(data)])), None
+
+
+@benchmark("block_register_id")
+def bench_block_register_id(records: List[bytes]):
+    with emulated_device(PLINMode.SLAVE) as plin:
+        index = iter(range(sys.maxsize))
+
+        def op():
+            # Alternate so that every call changes the filter.
+            if next(index) % 2:
+                plin.register_id(0x22)
+            else:
+                plin.block_id(0x22)
+        yield op, None
+
+
+@benchmark("get_schedule_slots")
+def bench_get_schedule_slots(records: List[bytes]):
+    with emulated_device(PLINMode.MASTER) as plin:
+        for id in range(8):
+            plin.add_unconditional_schedule_slot(schedule=0, delay_ms=10, id=id)
+        yield (lambda: plin.get_schedule_slots(0)), None
+
+
+def _percentile(ordered: List[int], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] / 1000
+
+
+def run_benchmark(name: str, records: List[bytes], iterations: int) -> Dict[str, object]:
+    '''
+    Runs one benchmark, returning its throughput, latency and allocation figures.
+    '''
+    with BENCHMARKS[name](records) as (op, prepare):
+        for _ in range(min(iterations, 100)):
+            if prepare:
+                prepare()
+            op()
+
+        latencies = []
+        frames = 0
+        elapsed = 0
+        for _ in range(iterations):
+            if prepare:
+                prepare()
+            start = time.perf_counter_ns()
+            count = op()
+            latency = time.perf_counter_ns() - start
+            elapsed += latency
+            latencies.append(latency)
+            frames += count if isinstance(count, int) else 1
+
+        # Allocations of every operation, its result discarded before the next one: the blocks allocated and still
+        # alive when it returns, its result included, and the peak of the bytes it allocated, temporaries included.
+        blocks = 0
+        size = 0
+        tracemalloc.start()
+        for _ in range(iterations):
+            if prepare:
+                prepare()
+            tracemalloc.reset_peak()
+            current = tracemalloc.get_traced_memory()[0]
+            before = sys.getallocatedblocks()
+            result = op()
+            blocks += sys.getallocatedblocks() - before
+            size += tracemalloc.get_traced_memory()[1] - current
+            del result
+        tracemalloc.stop()
+
+    latencies.sort()
+    return {
+        "iterations": iterations,
+        "ops_per_sec": iterations * 1e9 / elapsed if elapsed else None,
+        "frames_per_sec": frames * 1e9 / elapsed if elapsed else None,
+        "latency_us": {
+            "p50": _percentile(latencies, 0.50),
+            "p90": _percentile(latencies, 0.90),
+            "p99": _percentile(latencies, 0.99),
+            "max": latencies[-1] / 1000,
+        },
+        "alloc_blocks_per_op": blocks / iterations,
+        "alloc_peak_bytes_per_op": size / iterations,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> Dict[str, object]:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=10000)
+    parser.add_argument("--only", nargs="+", choices=sorted(BENCHMARKS), help="benchmarks to run")
+    parser.add_argument("--capture", help="capture file providing the frames for the read and decode benchmarks")
+    parser.add_argument("--output", help="JSON output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    if args.capture:
+        with CaptureReader(args.capture) as capture:
+            records = [bytes(capture.records(i, i + 1)) for i in range(min(len(capture), 65536))]
+    else:
+        records = default_records()
+    if not records:
+        parser.error("No frames to benchmark with.")
+
+    report = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": {name: run_benchmark(name, records, args.iterations) for name in (args.only or BENCHMARKS)},
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return report
+
+
+if __name__ == "__main__":
+    main()
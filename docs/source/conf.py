@@ -18,7 +18,7 @@ release = '0.0.1'
 # https://www.sphinx-doc.org/en/master/usage/configuration.html#general-configuration
 
 extensions = ['myst_parser', 'sphinx.ext.todo', 'sphinx.ext.viewcode', 'sphinx.ext.autodoc']
-autodoc_mock_imports = ['ioctl_opt']
+autodoc_mock_imports = ['ioctl_opt', 'numpy']
 
 templates_path = ['_templates']
 
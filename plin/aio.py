@@ -0,0 +1,204 @@
+import asyncio
+import functools
+import os
+from typing import Any, AsyncIterator, Optional, Sequence, Union
+
+from plin.device import PLIN, PLIN_TX_QUEUE_POLL_MS, PLINException
+from plin.enums import *
+from plin.structs import *
+
+
+class AsyncPLIN:
+    '''
+    asyncio adapter for a PLIN device.
+
+    The device file descriptor is registered with the running event loop, so any number of interfaces can be served
+    from one loop without a thread per device. Received messages are buffered in a bounded queue; when it is full the
+    oldest message is dropped and counted in dropped.
+    '''
+
+    def __init__(self, interface: str, max_frames: int = 64, queue_size: int = 1024):
+        self.device = PLIN(interface)
+        self.max_frames = max_frames
+        self.queue_size = queue_size
+        self.dropped = 0
+        # Exception that stopped the reception, e.g. PLINException once the device is unplugged.
+        self.error: Optional[Exception] = None
+        self._loop = None
+        self._queue = None
+
+    async def start(self, mode: PLINMode, baudrate: int = 19200):
+        '''
+        Connects to and configures the PLIN device, then starts receiving messages on the running event loop.
+        '''
+        self.device.start(mode=mode, baudrate=baudrate)
+        self._loop = asyncio.get_running_loop()
+        # One slot more than queue_size is reserved for the end-of-stream sentinel.
+        self._queue = asyncio.Queue(self.queue_size + 1)
+        self._loop.add_reader(self.device.fd, self._on_readable)
+
+    async def stop(self):
+        '''
+        Stops receiving messages and disconnects from the PLIN device. Pending frames() iterators are ended.
+        '''
+        if self._loop is None:
+            raise PLINException("Not connected to PLIN device!")
+        self._loop.remove_reader(self.device.fd)
+        self.device.stop()
+        self._loop = None
+        self._end()
+
+    def _put(self, message: PLINMessage):
+        if self._queue.qsize() >= self.queue_size:
+            self._queue.get_nowait()
+            self.dropped += 1
+        self._queue.put_nowait(message)
+
+    def _end(self):
+        '''
+        Queues the sentinel ending frames() in the reserved slot, without dropping a message.
+        '''
+        if not self._queue.full():
+            self._queue.put_nowait(None)
+
+    def _on_readable(self):
+        try:
+            batch = self.device.read_many(self.max_frames, timeout_ms=0)
+        except (PLINException, OSError) as e:
+            # Stop watching the descriptor rather than being called again for the same error.
+            self.error = e
+            self._loop.remove_reader(self.device.fd)
+            self._end()
+            return
+        # The batch is a view over the device read buffer, so messages are copied before being queued.
+        for message in batch:
+            self._put(PLINMessage.from_buffer_copy(message))
+
+    async def read(self, timeout_ms: Optional[int] = None) -> Union[PLINMessage, None]:
+        '''
+        Reads a PLINMessage from the LIN bus with an optional timeout in milliseconds.
+
+        A timeout of None waits until a message is received. If the timeout is reached before data is read, None is
+        returned.
+        '''
+        if self._queue is None:
+            raise Exception("PLIN not connected!")
+        if timeout_ms is None:
+            return await self._queue.get()
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout_ms / 1000)
+        except asyncio.TimeoutError:
+            return None
+
+    async def frames(self) -> AsyncIterator[PLINMessage]:
+        '''
+        Iterates over received PLINMessages until the device is stopped, raising error if reception failed.
+        '''
+        while True:
+            message = await self.read()
+            if message is None:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield message
+
+    async def write(self, message: PLINMessage):
+        '''
+        Writes a PLINMessage to the LIN bus, waiting on the event loop if the device queue is full.
+        '''
+        if self._loop is None:
+            raise Exception("PLIN not connected!")
+        if message.dir == PLINFrameDirection.PUBLISHER:
+            self.device.block_id(message.id)
+        buffer = bytearray(message)
+        while True:
+            try:
+                os.write(self.device.fd, buffer)
+                return
+            except BlockingIOError:
+                await self._writable()
+
+    async def write_many(self, messages: Union[Sequence[PLINMessage], Any], timeout_ms: Optional[int] = None) -> int:
+        '''
+        Writes several PLINMessages as PLIN.write_many() does, waiting on the event loop while the transmit queue of the
+        device is full. Returns the number of messages written.
+        '''
+        if self._loop is None:
+            raise Exception("PLIN not connected!")
+        data = self.device._prepare_write(messages)
+        length = PLINMessage.buffer_length
+        deadline = None if timeout_ms is None else self._loop.time() + timeout_ms / 1000
+        written = 0
+        credit = 0
+        while written < len(data):
+            if credit == 0:
+                credit = self.device._tx_credit()
+            if credit == 0:
+                if deadline is not None and self._loop.time() >= deadline:
+                    break
+                await asyncio.sleep(PLIN_TX_QUEUE_POLL_MS / 1000)
+                continue
+            # Whole records up to the free space of the queue; a partial write is completed before anything else.
+            end = min(len(data), (written // length + credit) * length)
+            if written % length:
+                end = max(end, written + length - written % length)
+            try:
+                sent = os.write(self.device.fd, data[written:end])
+            except BlockingIOError:
+                try:
+                    await asyncio.wait_for(self._writable(), None if deadline is None else deadline - self._loop.time())
+                except asyncio.TimeoutError:
+                    break
+                continue
+            credit = max(0, credit - ((written + sent) // length - written // length))
+            written += sent
+        return written // length
+
+    async def _writable(self):
+        future = self._loop.create_future()
+        self._loop.add_writer(self.device.fd, future.set_result, None)
+        try:
+            await future
+        finally:
+            self._loop.remove_writer(self.device.fd)
+
+
+def _async_wrapper(name: str):
+    method = getattr(PLIN, name)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return getattr(self.device, name)(*args, **kwargs)
+    return wrapper
+
+
+def _executor_wrapper(name: str):
+    method = getattr(PLIN, name)
+
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(getattr(self.device, name), *args, **kwargs))
+    return wrapper
+
+
+# Configuration ioctls complete without waiting on the bus, so they are run inline on the event loop.
+_INLINE_METHODS = (
+    "reset", "set_frame_entry", "set_frame_entries", "set_frame_entry_data", "get_frame_entry", "get_frame_entries",
+    "publisher", "get_baudrate", "set_id_filter", "get_id_filter", "update_id_filter", "block_id", "register_id",
+    "clear_id_filter", "get_mode", "set_id_string", "get_id_string", "identify", "get_firmware_version",
+    "start_keep_alive", "resume_keep_alive", "suspend_keep_alive", "add_schedule_slot",
+    "add_unconditional_schedule_slot", "add_event_triggered_schedule_slot", "add_sporadic_schedule_slot",
+    "add_diagnostic_schedule_slot", "add_master_request_schedule_slot", "add_slave_response_schedule_slot",
+    "delete_schedule", "get_slot_count", "get_schedule_slots", "set_schedule_breakpoint", "start_schedule",
+    "resume_schedule", "suspend_schedule", "get_status", "reset_tx_queue", "wakeup", "set_response_remap",
+    "get_response_remap", "set_led_state", "get_visual_response_remap",
+)
+# Methods waiting on the bus, run on the default executor so that they do not block the event loop. write() and
+# write_many() wait on the event loop instead, and reading is done by the reader registered with it.
+_EXECUTOR_METHODS = ("start_autobaud",)
+
+for _name in _INLINE_METHODS:
+    setattr(AsyncPLIN, _name, _async_wrapper(_name))
+for _name in _EXECUTOR_METHODS:
+    setattr(AsyncPLIN, _name, _executor_wrapper(_name))
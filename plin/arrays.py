@@ -0,0 +1,59 @@
+'''
+NumPy views of raw PLINMessage records.
+
+Requires the optional numpy dependency (pip install plin-linux[numpy]).
+'''
+import os
+from typing import Any
+
+import numpy as np
+
+from plin.structs import *
+
+# Same layout as PLINMessage: offsets are taken from the ctypes fields so both stay in sync.
+PLIN_MESSAGE_DTYPE = np.dtype({
+    "names": [name for name, _ in PLINMessage._fields_],
+    "formats": [np.dtype(ctype) if not hasattr(ctype, "_length_") else (np.dtype(ctype._type_), ctype._length_)
+                for _, ctype in PLINMessage._fields_],
+    "offsets": [getattr(PLINMessage, name).offset for name, _ in PLINMessage._fields_],
+    "itemsize": PLINMessage.buffer_length,
+})
+
+
+def from_buffer(buffer: Any, offset: int = 0) -> np.ndarray:
+    '''
+    Returns a structured array viewing the PLINMessage records in buffer, without copying.
+
+    buffer may be anything supporting the buffer protocol, such as bytes read from the device or a batch returned by
+    PLIN.read_many(). Trailing bytes that do not form a whole record are ignored.
+    Fields are accessed by name, e.g. array["id"] or array["data"].
+    '''
+    count = (memoryview(buffer).nbytes - offset) // PLINMessage.buffer_length
+    return np.frombuffer(buffer, dtype=PLIN_MESSAGE_DTYPE, count=count, offset=offset)
+
+
+def from_file(path: str, offset: int = 0) -> np.ndarray:
+    '''
+    Returns a structured array of the PLINMessage records stored in a file, memory-mapped read-only.
+
+    offset is the number of bytes preceding the first record, e.g. for a file header.
+    '''
+    count = (os.path.getsize(path) - offset) // PLINMessage.buffer_length
+    if count <= 0:
+        # mmap cannot map an empty range.
+        return np.empty(0, dtype=PLIN_MESSAGE_DTYPE)
+    return np.memmap(path, dtype=PLIN_MESSAGE_DTYPE, mode="r", offset=offset, shape=(count,))
+
+
+def valid_mask(messages: np.ndarray) -> np.ndarray:
+    '''
+    Returns a boolean mask of the records that are not invalid reads (data equal to PLIN_EMPTY_DATA).
+    '''
+    return np.any(messages["data"] != 0xff, axis=1)
+
+
+def to_message(record: np.void) -> PLINMessage:
+    '''
+    Converts one record of a structured array back to a PLINMessage.
+    '''
+    return PLINMessage.from_buffer_copy(record.tobytes())
@@ -0,0 +1,601 @@
+'''
+Frame broker sharing PLIN devices with many local clients over a Unix domain socket.
+
+Usage: plin-broker [--socket PATH] [--mode MODE] --device INTERFACE[:MODE[:BAUDRATE]] [--device ...]
+
+Every message on the socket is a BROKER_HEADER (kind, device index, payload length) followed by its payload:
+FRAMES carries raw 32-byte PLINMessage records, SUBSCRIBE a BROKER_SUBSCRIPTION (ID mask, message type mask),
+WRITE raw records to transmit, acknowledged by WRITTEN with the number of records written, CALL and RESULT a JSON
+request and response for a PLIN method, DROPPED the number of records dropped for a client that did not keep up and
+CLOSED the error that closed a device.
+'''
+import argparse
+import collections
+import json
+import os
+import queue
+import selectors
+import socket
+import stat
+import struct
+from concurrent.futures import Future
+from enum import IntEnum
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple, Union
+
+from plin.command import PLINCommandChannel
+from plin.device import PLIN, PLINException
+from plin.enums import *
+from plin.structs import *
+
+PLIN_BROKER_SOCKET = "/tmp/plin-broker.sock"
+
+# kind, device index, payload length.
+BROKER_HEADER = struct.Struct('<BBxxI')
+# frame IDs (bit n for ID n), message types (bit n for PLINMessageType n).
+BROKER_SUBSCRIPTION = struct.Struct('<QI')
+BROKER_COUNT = struct.Struct('<Q')
+# type and id of a PLINMessage record.
+_RECORD_KEY = struct.Struct('=H2xB27x')
+
+# Largest request payload accepted from a client, e.g. for a WRITE.
+BROKER_MAX_REQUEST = 1 << 20
+
+BROKER_ALL_IDS = (1 << PLIN_USB_RSP_REMAP_ID_LEN) - 1
+BROKER_ALL_TYPES = (1 << 32) - 1
+
+# PLIN methods clients may call.
+BROKER_METHODS = frozenset([
+    "set_frame_entry", "set_frame_entry_data", "get_frame_entry", "get_baudrate", "set_id_filter", "get_id_filter",
+    "update_id_filter", "block_id", "register_id", "clear_id_filter", "get_mode", "set_id_string", "get_id_string",
+    "identify", "get_firmware_version", "start_keep_alive", "resume_keep_alive", "suspend_keep_alive",
+    "add_unconditional_schedule_slot", "add_event_triggered_schedule_slot", "add_sporadic_schedule_slot",
+    "add_master_request_schedule_slot", "add_slave_response_schedule_slot", "delete_schedule", "get_slot_count",
+    "get_schedule_slots", "set_schedule_breakpoint", "start_schedule", "resume_schedule", "suspend_schedule",
+    "get_status", "reset_tx_queue", "wakeup", "get_response_remap", "set_led_state",
+])
+
+
+class BrokerMessage(IntEnum):
+    '''
+    Kinds of broker protocol messages.
+    '''
+    FRAMES = 0                          # broker to client
+    SUBSCRIBE = 1                       # client to broker
+    WRITE = 2                           # client to broker
+    WRITTEN = 3                         # broker to client
+    CALL = 4                            # client to broker
+    RESULT = 5                          # broker to client
+    DROPPED = 6                         # broker to client
+    CLOSED = 7                          # broker to client
+
+
+def _to_json(value: Any) -> Any:
+    if hasattr(value, "_asdict"):
+        return value._asdict()
+    if isinstance(value, (bytes, bytearray)):
+        return list(value)
+    return str(value)
+
+
+def _message(kind: BrokerMessage, device: int, payload: Union[bytes, bytearray, memoryview] = b'') -> bytes:
+    return BROKER_HEADER.pack(kind, device, len(payload)) + payload
+
+
+def _parse_messages(buffer: bytearray) -> List[Tuple[int, int, bytes]]:
+    '''
+    Removes the complete messages from the start of buffer, returning them as (kind, device, payload).
+    '''
+    messages = []
+    offset = 0
+    while len(buffer) - offset >= BROKER_HEADER.size:
+        kind, device, length = BROKER_HEADER.unpack_from(buffer, offset)
+        end = offset + BROKER_HEADER.size + length
+        if end > len(buffer):
+            break
+        messages.append((kind, device, bytes(buffer[offset + BROKER_HEADER.size:end])))
+        offset = end
+    del buffer[:offset]
+    return messages
+
+
+def _remove_stale_socket(path: str):
+    '''
+    Removes the socket at path if no broker listens on it anymore.
+    '''
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise PLINException(f"{path} exists and is not a socket!")
+    except FileNotFoundError:
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    finally:
+        probe.close()
+    raise PLINException(f"A broker is already listening on {path}!")
+
+
+class _Client:
+    '''
+    Connection state of a broker client.
+    '''
+
+    def __init__(self, sock: socket.socket, devices: int):
+        self.sock = sock
+        self.input = bytearray()
+        self.output = bytearray()
+        self.subscriptions: List[Optional[Tuple[int, int]]] = [None] * devices
+        self.dropped = [0] * devices
+        self.writing = False
+
+
+class PLINBroker:
+    '''
+    Serves the traffic of started PLIN devices to clients connected to a Unix domain socket.
+
+    A single thread multiplexes the devices and clients with selectors. Every batch read from a device is filtered for
+    each client by the ID and message type masks it subscribed with, and appended to its output buffer, so the records
+    that arrive while a client is busy are sent in one batch. A client whose buffer reaches max_buffer bytes does not
+    slow down the others: the records it cannot take are dropped and counted in a DROPPED message sent once it catches
+    up. Clients may transmit frames (WRITE) and call the PLIN methods listed in BROKER_METHODS (CALL). These run on a
+    PLINCommandChannel per device, so a slow write or ioctl never delays the reads and fan-out, and the reply is sent
+    when the command completes.
+
+    The socket is created with permissions mode, 0600 by default so that only the user running the broker can connect,
+    as clients may transmit frames and reconfigure the devices; use e.g. 0660 to share it with a group. A stale socket
+    left at path by a broker that exited is replaced, while a path a broker is still listening on raises a
+    PLINException.
+
+    A device whose read fails, e.g. at end of file once it is unplugged, is closed and its error recorded in errors;
+    the clients subscribed to it receive a CLOSED message and the other devices keep being served.
+    '''
+
+    def __init__(self, devices: Sequence[PLIN], path: str = PLIN_BROKER_SOCKET, max_buffer: int = 1 << 20,
+                 max_frames: int = 256, write_timeout_ms: int = 100, mode: int = 0o600):
+        self.devices = list(devices)
+        self.path = path
+        self.max_buffer = max_buffer
+        self.max_frames = max_frames
+        self.write_timeout_ms = write_timeout_ms
+        self._clients: Dict[socket.socket, _Client] = {}
+        self._selector = selectors.DefaultSelector()
+        self._running = False
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        self._channels = [PLINCommandChannel(plin) for plin in self.devices]
+        # Exception that closed each device, None while it is served.
+        self.errors: List[Optional[Exception]] = [None] * len(self.devices)
+        # Replies of completed commands, sent by the selector thread.
+        self._replies: "queue.SimpleQueue[Tuple[_Client, bytes]]" = queue.SimpleQueue()
+
+        _remove_stale_socket(path)
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(path)
+        # Connections are refused until listen(), so no client can connect before the permissions are set.
+        os.chmod(path, mode)
+        self._server.listen()
+        self._server.setblocking(False)
+        self._selector.register(self._server, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wake_r, selectors.EVENT_READ, self._wake)
+        for index, plin in enumerate(self.devices):
+            self._selector.register(plin.fd, selectors.EVENT_READ,
+                                    lambda key, events, index=index: self._read_device(index))
+
+    def serve_forever(self):
+        '''
+        Serves clients until stop() is called.
+        '''
+        self._running = True
+        for channel in self._channels:
+            channel.start()
+        try:
+            while self._running:
+                for key, events in self._selector.select():
+                    key.data(key, events)
+        finally:
+            for channel, error in zip(self._channels, self.errors):
+                if error is None:
+                    channel.stop(cancel=True)
+
+    def stop(self):
+        '''
+        Makes serve_forever() return, from any thread.
+        '''
+        self._running = False
+        self._notify()
+
+    def _notify(self):
+        try:
+            self._wake_w.send(b'\x00')
+        except BlockingIOError:
+            # The selector thread is already due to wake up.
+            pass
+
+    def _wake(self, key, events):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        while True:
+            try:
+                client, message = self._replies.get_nowait()
+            except queue.Empty:
+                return
+            if client.sock in self._clients:
+                self._send(client, message)
+
+    def _reply(self, client: _Client, future: Future, encode: Callable[[Future], bytes]):
+        '''
+        Sends the reply to a command once its future completes, from the selector thread.
+        '''
+        def done(future: Future):
+            self._replies.put((client, encode(future)))
+            self._notify()
+        future.add_done_callback(done)
+
+    def close(self):
+        '''
+        Disconnects all clients and removes the socket. The devices are left open, except those closed on an error.
+        '''
+        for client in list(self._clients.values()):
+            self._disconnect(client)
+        self._selector.close()
+        self._server.close()
+        self._wake_r.close()
+        self._wake_w.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def _accept(self, key, events):
+        try:
+            sock, _ = self._server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client = _Client(sock, len(self.devices))
+        self._clients[sock] = client
+        self._selector.register(sock, selectors.EVENT_READ, lambda key, events: self._service(client, events))
+
+    def _disconnect(self, client: _Client):
+        self._selector.unregister(client.sock)
+        del self._clients[client.sock]
+        client.sock.close()
+
+    def _service(self, client: _Client, events: int):
+        if events & selectors.EVENT_WRITE:
+            self._flush(client)
+        if events & selectors.EVENT_READ and client.sock in self._clients:
+            try:
+                data = client.sock.recv(65536)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                data = b''
+            if not data:
+                self._disconnect(client)
+                return
+            client.input += data
+            for kind, device, payload in _parse_messages(client.input):
+                if client.sock not in self._clients:
+                    return
+                if not self._handle(client, kind, device, payload):
+                    self._disconnect(client)
+                    return
+            if len(client.input) >= BROKER_HEADER.size and \
+                    BROKER_HEADER.unpack_from(client.input)[2] > BROKER_MAX_REQUEST:
+                self._disconnect(client)
+
+    def _handle(self, client: _Client, kind: int, device: int, payload: bytes) -> bool:
+        '''
+        Handles a request, returning False if it is malformed.
+        '''
+        plin = self.devices[device] if device < len(self.devices) and self.errors[device] is None else None
+        if kind == BrokerMessage.SUBSCRIBE:
+            if len(payload) not in (0, BROKER_SUBSCRIPTION.size):
+                return False
+            if plin is not None:
+                client.subscriptions[device] = BROKER_SUBSCRIPTION.unpack(payload) if payload else None
+            elif device < len(self.devices) and payload:
+                self._send(client, _message(BrokerMessage.CLOSED, device, str(self.errors[device]).encode()))
+        elif kind == BrokerMessage.WRITE:
+            if len(payload) % PLINMessage.buffer_length:
+                return False
+
+            def written(future: Future) -> bytes:
+                count = 0 if future.cancelled() or future.exception() is not None else future.result()
+                return _message(BrokerMessage.WRITTEN, device, BROKER_COUNT.pack(count))
+            if plin is None:
+                self._send(client, _message(BrokerMessage.WRITTEN, device, BROKER_COUNT.pack(0)))
+            else:
+                self._reply(client, self._channels[device].submit("write_many", payload,
+                                                                  timeout_ms=self.write_timeout_ms), written)
+        elif kind == BrokerMessage.CALL:
+            self._call(client, device, payload)
+        else:
+            return False
+        return True
+
+    def _call(self, client: _Client, device: int, payload: bytes):
+        response: Dict[str, Any] = {}
+        try:
+            request = json.loads(payload)
+            response["id"] = request.get("id")
+            method = request["method"]
+            if device >= len(self.devices):
+                raise PLINException(f"Unknown device {device}.")
+            if self.errors[device] is not None:
+                raise PLINException(f"Device {device} closed: {self.errors[device]}")
+            if method not in BROKER_METHODS:
+                raise PLINException(f"Method {method} not allowed.")
+            future = self._channels[device].submit(method, *request.get("args", []), **request.get("kwargs", {}))
+        except Exception as e:
+            response["error"] = f"{type(e).__name__}: {e}"
+            self._send(client, _message(BrokerMessage.RESULT, device, json.dumps(response).encode()))
+            return
+
+        def result(future: Future) -> bytes:
+            if future.cancelled():
+                response["error"] = "Cancelled."
+            elif future.exception() is not None:
+                e = future.exception()
+                response["error"] = f"{type(e).__name__}: {e}"
+            else:
+                response["result"] = future.result()
+            try:
+                return _message(BrokerMessage.RESULT, device, json.dumps(response, default=_to_json).encode())
+            except (TypeError, ValueError) as e:
+                return _message(BrokerMessage.RESULT, device, json.dumps(
+                    {"id": response["id"], "error": f"{type(e).__name__}: {e}"}).encode())
+        self._reply(client, future, result)
+
+    def _read_device(self, index: int):
+        try:
+            batch = self.devices[index].read_many(self.max_frames, timeout_ms=0)
+        except (PLINException, OSError) as e:
+            self._close_device(index, e)
+            return
+        if not batch:
+            return
+        data = memoryview(batch).cast('B')
+        length = PLINMessage.buffer_length
+        keys = None
+        for client in list(self._clients.values()):
+            subscription = client.subscriptions[index]
+            if subscription is None:
+                continue
+            id_mask, type_mask = subscription
+            if id_mask == BROKER_ALL_IDS and type_mask == BROKER_ALL_TYPES:
+                selected = data
+            else:
+                if keys is None:
+                    keys = list(_RECORD_KEY.iter_unpack(data))
+                selected = b''.join(data[i * length:(i + 1) * length] for i, (type, id) in enumerate(keys)
+                                    if type_mask >> type & 1 and (type != PLINMessageType.FRAME or id_mask >> id & 1))
+            if selected:
+                self._queue_frames(client, index, selected)
+
+    def _close_device(self, index: int, error: Exception):
+        '''
+        Stops serving a device after a read error, closes it and notifies the clients subscribed to it.
+        '''
+        plin = self.devices[index]
+        self.errors[index] = error
+        self._selector.unregister(plin.fd)
+        # Pending commands are cancelled and replied to; the one running completes before the device is closed.
+        self._channels[index].stop(cancel=True)
+        try:
+            plin.stop()
+        except (PLINException, OSError):
+            pass
+        message = _message(BrokerMessage.CLOSED, index, str(error).encode())
+        for client in list(self._clients.values()):
+            if client.subscriptions[index] is not None:
+                client.subscriptions[index] = None
+                self._send(client, message)
+
+    def _queue_frames(self, client: _Client, device: int, records: Union[bytes, memoryview]):
+        # Whole records up to max_buffer, the rest is dropped.
+        length = PLINMessage.buffer_length
+        fit = max(0, self.max_buffer - len(client.output) - BROKER_HEADER.size) // length
+        if fit < len(records) // length:
+            client.dropped[device] += len(records) // length - fit
+            records = records[:fit * length]
+        if not records:
+            return
+        self._report_dropped(client)
+        self._send(client, _message(BrokerMessage.FRAMES, device, records))
+
+    def _report_dropped(self, client: _Client):
+        # Precedes the frames that follow the gap.
+        for device, count in enumerate(client.dropped):
+            if count:
+                client.output += _message(BrokerMessage.DROPPED, device, BROKER_COUNT.pack(count))
+                client.dropped[device] = 0
+
+    def _send(self, client: _Client, message: bytes):
+        client.output += message
+        if not client.writing:
+            self._flush(client)
+
+    def _flush(self, client: _Client):
+        if client.sock not in self._clients:
+            return
+        try:
+            sent = client.sock.send(client.output)
+        except (BlockingIOError, InterruptedError):
+            sent = 0
+        except OSError:
+            self._disconnect(client)
+            return
+        del client.output[:sent]
+        if not client.output and any(client.dropped):
+            self._report_dropped(client)
+        writing = bool(client.output)
+        if writing != client.writing:
+            client.writing = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self._selector.modify(client.sock, events, lambda key, events: self._service(client, events))
+
+
+class BrokerClient:
+    '''
+    Blocking client of a PLINBroker.
+
+    read() returns the frames of the subscribed devices, as (device index, ctypes array of PLINMessage). Frames that
+    arrive while waiting for the response to write() or call() are kept for read(). dropped counts the records the
+    broker dropped for this client, by device, and closed holds the error of the subscribed devices the broker closed.
+    '''
+
+    def __init__(self, path: str = PLIN_BROKER_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.dropped: Dict[int, int] = collections.defaultdict(int)
+        self.closed: Dict[int, str] = {}
+        self._input = bytearray()
+        self._messages: Deque[Tuple[int, int, bytes]] = collections.deque()
+        self._frames: Deque[Tuple[int, bytes]] = collections.deque()
+        self._next_id = 0
+
+    def __enter__(self) -> "BrokerClient":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self.sock.close()
+
+    def _send(self, kind: BrokerMessage, device: int, payload: bytes = b''):
+        try:
+            self.sock.sendall(_message(kind, device, payload))
+        except (BrokenPipeError, ConnectionResetError) as e:
+            raise PLINException("Broker disconnected!") from e
+
+    def _receive(self, timeout: Optional[float]) -> Optional[Tuple[int, int, bytes]]:
+        while not self._messages:
+            self.sock.settimeout(timeout)
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                return None
+            except ConnectionResetError:
+                data = b''
+            if not data:
+                raise PLINException("Broker disconnected!")
+            self._input += data
+            self._messages.extend(_parse_messages(self._input))
+        return self._messages.popleft()
+
+    def _wait(self, kind: BrokerMessage, device: int) -> bytes:
+        while True:
+            message = self._receive(None)
+            if message[0] == kind and message[1] == device:
+                return message[2]
+            self._keep(message)
+
+    def _keep(self, message: Tuple[int, int, bytes]):
+        kind, device, payload = message
+        if kind == BrokerMessage.FRAMES:
+            self._frames.append((device, payload))
+        elif kind == BrokerMessage.DROPPED:
+            self.dropped[device] += BROKER_COUNT.unpack(payload)[0]
+        elif kind == BrokerMessage.CLOSED:
+            self.closed[device] = payload.decode(errors="replace")
+
+    def subscribe(self, device: int = 0, ids: Optional[Sequence[int]] = None,
+                  types: Optional[Sequence[PLINMessageType]] = None):
+        '''
+        Subscribes to the frames with the specified IDs and the messages of the specified types of a device, all if
+        None. The subscription replaces the previous one for the device.
+        '''
+        id_mask = BROKER_ALL_IDS if ids is None else sum(1 << id for id in set(ids))
+        type_mask = BROKER_ALL_TYPES if types is None else sum(1 << type for type in set(types))
+        self._send(BrokerMessage.SUBSCRIBE, device, BROKER_SUBSCRIPTION.pack(id_mask, type_mask))
+
+    def unsubscribe(self, device: int = 0):
+        '''
+        Stops receiving the messages of a device.
+        '''
+        self._send(BrokerMessage.SUBSCRIBE, device)
+
+    def read(self, timeout: Optional[float] = None) -> Optional[Tuple[int, Any]]:
+        '''
+        Returns the next batch of messages as (device index, array of PLINMessage), or None after timeout seconds.
+        '''
+        while not self._frames:
+            message = self._receive(timeout)
+            if message is None:
+                return None
+            self._keep(message)
+        device, payload = self._frames.popleft()
+        return device, (PLINMessage * (len(payload) // PLINMessage.buffer_length)).from_buffer_copy(payload)
+
+    def write(self, messages: Union[Sequence[PLINMessage], Any], device: int = 0) -> int:
+        '''
+        Transmits messages through a device, returning the number written (see PLIN.write_many()).
+        '''
+        try:
+            data = memoryview(messages).cast('B')
+        except TypeError:
+            data = b''.join(bytes(message) for message in messages)
+        self._send(BrokerMessage.WRITE, device, bytes(data))
+        return BROKER_COUNT.unpack(self._wait(BrokerMessage.WRITTEN, device))[0]
+
+    def call(self, method: str, *args, device: int = 0, **kwargs) -> Any:
+        '''
+        Calls a PLIN method of a device, returning its result decoded from JSON.
+        '''
+        self._next_id += 1
+        self._send(BrokerMessage.CALL, device, json.dumps(
+            {"id": self._next_id, "method": method, "args": args, "kwargs": kwargs}, default=_to_json).encode())
+        while True:
+            response = json.loads(self._wait(BrokerMessage.RESULT, device))
+            if response.get("id") in (self._next_id, None):
+                break
+        if "error" in response:
+            raise PLINException(response["error"])
+        return response["result"]
+
+
+def parse_device(spec: str) -> Tuple[str, PLINMode, int]:
+    '''
+    Parses an INTERFACE[:MODE[:BAUDRATE]] device specification, e.g. /dev/plin0:master:19200.
+    '''
+    interface, _, rest = spec.partition(':')
+    mode, _, baudrate = rest.partition(':')
+    return interface, PLINMode[mode.upper()] if mode else PLINMode.SLAVE, int(baudrate) if baudrate else 19200
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(prog="plin-broker", description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--socket", default=PLIN_BROKER_SOCKET, help="Unix domain socket to listen on.")
+    parser.add_argument("--mode", default=0o600, type=lambda mode: int(mode, 8),
+                        help="Permissions of the socket in octal, 0600 (owner only) by default.")
+    parser.add_argument("--device", action="append", required=True, type=parse_device,
+                        help="Device to serve as INTERFACE[:MODE[:BAUDRATE]], e.g. /dev/plin0:master:19200.")
+    args = parser.parse_args(argv)
+
+    devices = []
+    for interface, mode, baudrate in args.device:
+        plin = PLIN(interface)
+        plin.start(mode=mode, baudrate=baudrate)
+        devices.append(plin)
+    broker = PLINBroker(devices, args.socket, mode=args.mode)
+    try:
+        broker.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        broker.close()
+        for plin, error in zip(devices, broker.errors):
+            if error is None:
+                plin.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+import mmap
+import os
+import struct
+import time
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+from plin.enums import *
+from plin.structs import *
+
+PLIN_CAPTURE_MAGIC = b'PLINCAP\x00'
+PLIN_CAPTURE_INDEX_MAGIC = b'PLINIDX\x00'
+PLIN_CAPTURE_VERSION = 1
+PLIN_CAPTURE_INDEX_SUFFIX = ".idx"
+PLIN_CAPTURE_CLOCK_MAGIC = b'PLINCLK\x00'
+PLIN_CAPTURE_CLOCK_SUFFIX = ".clk"
+
+# magic, version, record length, bucket width (us), host wall time (ns) and ts_us of the first record, padding.
+CAPTURE_HEADER = struct.Struct('<8sHHIQQ32x')
+# magic, version, entry length, bucket width (us).
+CAPTURE_INDEX_HEADER = struct.Struct('<8sHHI')
+# first record, record count, mask of frame IDs present, lowest and highest ts_us.
+CAPTURE_INDEX_ENTRY = struct.Struct('<QQQQQ')
+# magic, version, entry length.
+CAPTURE_CLOCK_HEADER = struct.Struct('<8sHH')
+# record index, host wall time (ns) and ts_us of the record.
+CAPTURE_CLOCK_ENTRY = struct.Struct('<QQQ')
+# id and ts_us of a PLINMessage record.
+_RECORD_KEY = struct.Struct('<4xB3xQ16x')
+
+
+class CaptureBucket(NamedTuple):
+    '''
+    Index entry covering a contiguous run of records within one time bucket.
+    '''
+    first: int
+    count: int
+    id_mask: int
+    ts_min: int
+    ts_max: int
+
+
+class CaptureAnchor(NamedTuple):
+    '''
+    Host wall time at which the record with the specified index and device timestamp was received.
+    '''
+    index: int
+    wall_ns: int
+    ts_us: int
+
+
+def _index_records(data: memoryview, first: int, bucket: Optional[list], bucket_us: int,
+                   resets: Optional[list] = None):
+    '''
+    Extends the open bucket with the records in data, the first of which has index first.
+
+    Returns the buckets completed along the way and the bucket left open. The index and ts_us of the records at which
+    the device clock went backwards are appended to resets.
+    '''
+    buckets = []
+    for index, (id, ts_us) in enumerate(_RECORD_KEY.iter_unpack(data), first):
+        if resets is not None and bucket is not None and ts_us < bucket[4]:
+            resets.append((index, ts_us))
+        # A new time bucket, or the device clock went backwards (e.g. after a reset).
+        if bucket is None or ts_us // bucket_us != bucket[4] // bucket_us or ts_us < bucket[4]:
+            if bucket is not None:
+                buckets.append(CaptureBucket(*bucket))
+            bucket = [index, 0, 0, ts_us, ts_us]
+        bucket[1] += 1
+        bucket[2] |= 1 << (id & PLINFrameID.MAX)
+        bucket[4] = ts_us
+    return buckets, bucket
+
+
+class CaptureWriter:
+    '''
+    Writes PLINMessage records to an append-only capture file.
+
+    The file is a CAPTURE_HEADER followed by raw 32-byte PLINMessage records. A sidecar index (path + ".idx") lists the
+    records of every bucket_us wide time bucket along with the frame IDs they contain, so CaptureReader can answer
+    queries without scanning the whole capture. Each call to write() issues a single write for the whole batch.
+
+    The header anchors the first record to the host wall time. Another sidecar (path + ".clk") lists CaptureAnchors: the
+    last record of the first batch, then a record whenever the device clock advanced anchor_us since the last anchor and
+    every record where it went backwards (e.g. after the device was reset), so the device timestamps can be mapped to
+    host time despite drift and resets.
+    '''
+
+    def __init__(self, path: str, bucket_us: int = 1000000, anchor_us: int = 10000000):
+        if bucket_us < 1:
+            raise ValueError(f"bucket_us {bucket_us} must be at least 1.")
+        self.path = path
+        self.bucket_us = bucket_us
+        self.anchor_us = anchor_us
+        self.count = 0
+        self._file = open(path, 'wb', buffering=0)
+        self._file.write(CAPTURE_HEADER.pack(PLIN_CAPTURE_MAGIC, PLIN_CAPTURE_VERSION,
+                                             PLINMessage.buffer_length, bucket_us, 0, 0))
+        self._index = open(path + PLIN_CAPTURE_INDEX_SUFFIX, 'wb', buffering=0)
+        self._index.write(CAPTURE_INDEX_HEADER.pack(PLIN_CAPTURE_INDEX_MAGIC, PLIN_CAPTURE_VERSION,
+                                                    CAPTURE_INDEX_ENTRY.size, bucket_us))
+        self._clock = open(path + PLIN_CAPTURE_CLOCK_SUFFIX, 'wb', buffering=0)
+        self._clock.write(CAPTURE_CLOCK_HEADER.pack(PLIN_CAPTURE_CLOCK_MAGIC, PLIN_CAPTURE_VERSION,
+                                                    CAPTURE_CLOCK_ENTRY.size))
+        self._bucket = None
+        # ts_us of the last anchor.
+        self._anchor_ts = None
+
+    def __enter__(self) -> "CaptureWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, messages: Union[Any, Iterable[PLINMessage]]):
+        '''
+        Appends a batch of messages, either a buffer of raw records (e.g. a batch from PLIN.read_many()) or PLINMessages.
+        '''
+        try:
+            data = memoryview(messages).cast('B')
+        except TypeError:
+            data = memoryview(b''.join(bytes(message) for message in messages))
+        data = data[:len(data) - len(data) % PLINMessage.buffer_length]
+        if not data:
+            return
+
+        # The batch was just read, so its last record was received about now.
+        wall_ns = time.time_ns()
+        if self.count == 0:
+            # Anchor the device clock to host wall time for aligning captures from several devices. The first record
+            # was received before the end of the batch by the device time elapsed since.
+            _, self._anchor_ts = _RECORD_KEY.unpack_from(data)
+            _, last_ts = _RECORD_KEY.unpack_from(data, len(data) - PLINMessage.buffer_length)
+            first_ns = wall_ns - max(0, last_ts - self._anchor_ts) * 1000
+            os.pwrite(self._file.fileno(), struct.pack('<QQ', first_ns, self._anchor_ts), 16)
+
+        written = 0
+        while written < len(data):
+            written += self._file.write(data[written:])
+        # Indexed after the records are written, so the index never refers to missing records.
+        self._update_index(data, wall_ns)
+
+    def _update_index(self, data: memoryview, wall_ns: int):
+        resets = []
+        buckets, self._bucket = _index_records(data, self.count, self._bucket, self.bucket_us, resets)
+        self.count += len(data) // PLINMessage.buffer_length
+        if buckets:
+            self._index.write(b''.join(CAPTURE_INDEX_ENTRY.pack(*bucket) for bucket in buckets))
+
+        first = self.count - len(data) // PLINMessage.buffer_length
+        _, ts_us = _RECORD_KEY.unpack_from(data, len(data) - PLINMessage.buffer_length)
+        anchors = []
+        for n, (index, reset_ts) in enumerate(resets):
+            # Received before the end of the batch by the device time elapsed until the next reset, if any.
+            end = resets[n + 1][0] - 1 if n + 1 < len(resets) else self.count - 1
+            _, end_ts = _RECORD_KEY.unpack_from(data, (end - first) * PLINMessage.buffer_length)
+            anchors.append(CaptureAnchor(index, wall_ns - (end_ts - reset_ts) * 1000, reset_ts))
+        if resets:
+            self._anchor_ts = resets[-1][1]
+        if first == 0 or ts_us - self._anchor_ts >= self.anchor_us:
+            anchors.append(CaptureAnchor(self.count - 1, wall_ns, ts_us))
+            self._anchor_ts = ts_us
+        if anchors:
+            self._clock.write(b''.join(CAPTURE_CLOCK_ENTRY.pack(*anchor) for anchor in anchors))
+
+    def close(self):
+        '''
+        Writes the index entry of the last bucket and closes the capture.
+        '''
+        if self._bucket is not None:
+            self._index.write(CAPTURE_INDEX_ENTRY.pack(*self._bucket))
+            self._bucket = None
+        self._index.close()
+        self._clock.close()
+        self._file.close()
+
+
+class CaptureReader:
+    '''
+    Reads a capture written by CaptureWriter through a read-only memory map.
+
+    Queries use the sidecar index to only touch the records of the time buckets that can match. Records written after
+    the last index entry (e.g. when the writer was not closed) are indexed on open by scanning them.
+    For vectorized analysis, the records can also be loaded with plin.arrays.from_file(path, offset=CAPTURE_HEADER.size).
+
+    anchors lists the CaptureAnchors of the capture in record order, or only the one of the header for a capture
+    without its ".clk" sidecar.
+    '''
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, length, self.bucket_us, self.wall_ns, self.ts_us = CAPTURE_HEADER.unpack_from(self._mmap)
+        if magic != PLIN_CAPTURE_MAGIC or length != PLINMessage.buffer_length:
+            raise ValueError(f"{path} is not a PLIN capture.")
+        if version > PLIN_CAPTURE_VERSION:
+            raise ValueError(f"Unsupported capture version {version}.")
+        self.count = (len(self._mmap) - CAPTURE_HEADER.size) // PLINMessage.buffer_length
+        self.buckets = self._load_index()
+        self.anchors = self._load_anchors()
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, index: int) -> PLINMessage:
+        if index < 0:
+            index += self.count
+        if index < 0 or index >= self.count:
+            raise IndexError("Capture record index out of range.")
+        return PLINMessage.from_buffer_copy(self._mmap, self._offset(index))
+
+    def _offset(self, index: int) -> int:
+        return CAPTURE_HEADER.size + index * PLINMessage.buffer_length
+
+    def _load_index(self) -> List[CaptureBucket]:
+        buckets = []
+        try:
+            with open(self.path + PLIN_CAPTURE_INDEX_SUFFIX, 'rb') as index:
+                data = index.read()
+            magic, _, length, _ = CAPTURE_INDEX_HEADER.unpack_from(data)
+            if magic == PLIN_CAPTURE_INDEX_MAGIC and length == CAPTURE_INDEX_ENTRY.size:
+                end = len(data) - (len(data) - CAPTURE_INDEX_HEADER.size) % length
+                buckets = [CaptureBucket(*entry) for entry in
+                           CAPTURE_INDEX_ENTRY.iter_unpack(data[CAPTURE_INDEX_HEADER.size:end])]
+        except (OSError, struct.error):
+            pass
+        buckets = [bucket for bucket in buckets if bucket.first + bucket.count <= self.count]
+
+        indexed = buckets[-1].first + buckets[-1].count if buckets else 0
+        if indexed < self.count:
+            buckets.extend(self._scan(indexed, self.count))
+        return buckets
+
+    def _load_anchors(self) -> List[CaptureAnchor]:
+        anchors = []
+        try:
+            with open(self.path + PLIN_CAPTURE_CLOCK_SUFFIX, 'rb') as clock:
+                data = clock.read()
+            magic, _, length = CAPTURE_CLOCK_HEADER.unpack_from(data)
+            if magic == PLIN_CAPTURE_CLOCK_MAGIC and length == CAPTURE_CLOCK_ENTRY.size:
+                end = len(data) - (len(data) - CAPTURE_CLOCK_HEADER.size) % length
+                anchors += [CaptureAnchor(*entry) for entry in
+                            CAPTURE_CLOCK_ENTRY.iter_unpack(data[CAPTURE_CLOCK_HEADER.size:end])]
+        except (OSError, struct.error):
+            pass
+        anchors = [anchor for anchor in anchors if anchor.index < self.count]
+        if not anchors and self.count:
+            anchors.append(CaptureAnchor(0, self.wall_ns, self.ts_us))
+        return anchors
+
+    def _scan(self, start: int, stop: int) -> List[CaptureBucket]:
+        records = memoryview(self._mmap)[self._offset(start):self._offset(stop)]
+        buckets, bucket = _index_records(records, start, None, self.bucket_us)
+        records.release()
+        return buckets + [CaptureBucket(*bucket)]
+
+    def records(self, start: int = 0, stop: Optional[int] = None) -> memoryview:
+        '''
+        Returns a read-only view of the raw records in [start, stop) without copying.
+        '''
+        stop = self.count if stop is None else min(stop, self.count)
+        return memoryview(self._mmap)[self._offset(start):self._offset(max(start, stop))]
+
+    def query(self, id: Optional[int] = None, t0: Optional[int] = None, t1: Optional[int] = None) -> Iterator[PLINMessage]:
+        '''
+        Iterates over the messages with the specified frame ID (any ID if None) and t0 <= ts_us <= t1.
+
+        Only the buckets whose time range and frame IDs can match are read from the capture.
+        '''
+        id_mask = ~0 if id is None else 1 << id
+        for bucket in self.buckets:
+            if not bucket.id_mask & id_mask:
+                continue
+            if (t0 is not None and bucket.ts_max < t0) or (t1 is not None and bucket.ts_min > t1):
+                continue
+            offset = self._offset(bucket.first)
+            for _ in range(bucket.count):
+                record_id, ts_us = _RECORD_KEY.unpack_from(self._mmap, offset)
+                if (id is None or record_id == id) and (t0 is None or ts_us >= t0) and (t1 is None or ts_us <= t1):
+                    yield PLINMessage.from_buffer_copy(self._mmap, offset)
+                offset += PLINMessage.buffer_length
+
+    def close(self):
+        '''
+        Closes the capture.
+        '''
+        self._mmap.close()
+        self._file.close()
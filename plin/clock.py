@@ -0,0 +1,152 @@
+import math
+import struct
+import time
+from typing import Any, Callable, List, Optional, Sequence, Union
+
+from plin.structs import *
+
+# Nominal host nanoseconds per device microsecond, used until a rate can be estimated.
+CLOCK_NOMINAL_RATE = 1000.0
+_TS_US = struct.Struct('=Q')
+
+
+class ClockSync:
+    '''
+    Online mapping of the device timestamps (PLINMessage.ts_us) to a host clock in nanoseconds.
+
+    Every observation pairs a device timestamp with the host time it was received at, e.g. the last record of a batch
+    returned by PLIN.read_many() with the time the read returned (update_batch()). The offset and the drift of the
+    device clock are fitted by least squares over the observations, updated in constant time: the sums are weighted
+    exponentially by decay per observation so the fit follows slow drift, e.g. 0.999 weighs about the last thousand
+    batches. Host times include the USB and scheduling latency of the reads, which shifts the offset by its average
+    and adds to error_ns.
+    The fit restarts when the device clock goes backwards, e.g. after the device was reset.
+
+    clock is the host clock, time.monotonic_ns by default or time.time_ns for wall time.
+    '''
+
+    def __init__(self, decay: float = 0.999, clock: Callable[[], int] = time.monotonic_ns):
+        if not 0 < decay <= 1:
+            raise ValueError(f"decay {decay} out of range (0..1].")
+        self.decay = decay
+        self.clock = clock
+        # Number of times the fit restarted because the device clock went backwards.
+        self.resets = 0
+        self.reset()
+
+    def reset(self):
+        '''
+        Discards every observation.
+        '''
+        self.observations = 0
+        self._last_ts_us = None
+        # Observations are taken relative to the first one, keeping the sums precise in floating point.
+        self._ts_ref = 0
+        self._host_ref = 0
+        self._weight = 0.0
+        self._mean_ts = 0.0
+        self._mean_host = 0.0
+        self._c_ts = 0.0
+        self._c_ts_host = 0.0
+        self._c_host = 0.0
+
+    def update(self, ts_us: int, host_ns: Optional[int] = None):
+        '''
+        Adds an observation: device timestamp ts_us received at host time host_ns (now if None).
+        '''
+        if host_ns is None:
+            host_ns = self.clock()
+        if self._last_ts_us is not None and ts_us < self._last_ts_us:
+            self.resets += 1
+            self.reset()
+        if self._last_ts_us is None:
+            self._ts_ref = ts_us
+            self._host_ref = host_ns
+        self._last_ts_us = ts_us
+        self.observations += 1
+
+        x = float(ts_us - self._ts_ref)
+        y = float(host_ns - self._host_ref)
+        self._weight = self._weight * self.decay + 1
+        self._c_ts *= self.decay
+        self._c_ts_host *= self.decay
+        self._c_host *= self.decay
+        dx = x - self._mean_ts
+        dy = y - self._mean_host
+        self._mean_ts += dx / self._weight
+        self._mean_host += dy / self._weight
+        self._c_ts += dx * (x - self._mean_ts)
+        self._c_ts_host += dx * (y - self._mean_host)
+        self._c_host += dy * (y - self._mean_host)
+
+    def update_batch(self, messages: Any, host_ns: Optional[int] = None):
+        '''
+        Adds the last record of a batch of raw PLINMessage records (e.g. from PLIN.read_many()) read at host_ns, now if
+        None. The last record is the one received closest to the end of the read.
+        '''
+        data = memoryview(messages).cast('B')
+        count = len(data) // PLINMessage.buffer_length
+        if count:
+            if host_ns is None:
+                host_ns = self.clock()
+            offset = (count - 1) * PLINMessage.buffer_length + PLINMessage.ts_us.offset
+            self.update(_TS_US.unpack_from(data, offset)[0], host_ns)
+
+    @property
+    def rate(self) -> float:
+        '''
+        Host nanoseconds per device microsecond, CLOCK_NOMINAL_RATE until the observations span some time.
+        '''
+        if self._c_ts <= 0:
+            return CLOCK_NOMINAL_RATE
+        return self._c_ts_host / self._c_ts
+
+    @property
+    def drift_ppm(self) -> float:
+        '''
+        Drift of the device clock relative to the host clock in parts per million, positive if the device is slow.
+        '''
+        return (self.rate / CLOCK_NOMINAL_RATE - 1) * 1e6
+
+    @property
+    def error_ns(self) -> float:
+        '''
+        Standard deviation of the observations around the fit, in nanoseconds.
+        '''
+        if self._weight <= 0 or self._c_ts <= 0:
+            return 0.0
+        variance = (self._c_host - self._c_ts_host ** 2 / self._c_ts) / self._weight
+        return math.sqrt(max(0.0, variance))
+
+    @property
+    def synchronized(self) -> bool:
+        '''
+        Whether at least one observation was made, so that timestamps can be converted.
+        '''
+        return self._last_ts_us is not None
+
+    def _base(self):
+        if not self.synchronized:
+            raise ValueError("No observation to convert timestamps with.")
+        # Host time of device timestamp ts_ref: the fit passes through the weighted means.
+        rate = self.rate
+        return self._host_ref + round(self._mean_host - rate * self._mean_ts), rate
+
+    def to_host(self, ts_us: int) -> int:
+        '''
+        Converts a device timestamp to host nanoseconds.
+        '''
+        base, rate = self._base()
+        return base + round(rate * (ts_us - self._ts_ref))
+
+    def to_host_array(self, ts_us: Union[Sequence[int], Any]) -> Union[List[int], Any]:
+        '''
+        Converts many device timestamps to host nanoseconds at once.
+
+        With a NumPy array, e.g. plin.arrays.from_buffer(batch)["ts_us"], the conversion is vectorized and returns an
+        int64 array; other sequences return a list.
+        '''
+        base, rate = self._base()
+        if hasattr(ts_us, "astype"):
+            return ((ts_us.astype('int64') - self._ts_ref) * rate).round().astype('int64') + base
+        return [base + round(rate * (ts - self._ts_ref)) for ts in ts_us]
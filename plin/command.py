@@ -0,0 +1,254 @@
+import collections
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Deque, Dict, Hashable, Iterable, Optional, Tuple
+
+from plin.device import PLIN, PLINException
+from plin.enums import *
+from plin.structs import *
+
+# Returns the method, args and kwargs of a pending command merged with a new one, or None if they cannot be merged.
+Merge = Callable[["_Command"], Optional[Tuple[str, tuple, dict]]]
+
+
+class _Command:
+    __slots__ = ("method", "args", "kwargs", "resource", "future")
+
+    def __init__(self, method: str, args: tuple, kwargs: dict, resource: Optional[Hashable]):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.resource = resource
+        self.future = Future()
+
+
+def _check_ids(ids: Iterable[int]) -> frozenset:
+    ids = frozenset(ids)
+    for id in ids:
+        if id > PLINFrameID.MAX or id < PLINFrameID.MIN:
+            raise ValueError(f"ID {id} out of range [{PLINFrameID.MIN}..{PLINFrameID.MAX}].")
+    return ids
+
+
+def _freeze(value: Any) -> Hashable:
+    '''
+    Returns a hashable equivalent of a command argument for comparing queries, e.g. a tuple for a list.
+    '''
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, (bytearray, memoryview)):
+        return bytes(value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, set):
+        return frozenset(_freeze(item) for item in value)
+    return value
+
+
+class PLINCommandChannel:
+    '''
+    Thread-safe facade running the commands of a PLIN on a single worker thread, returning futures.
+
+    PLIN is not thread-safe: its ioctls and its local copies of the frame table and ID filter must not be used from
+    several threads at once. The channel queues commands from any thread and runs them in submission order on its
+    worker. Reading (PLIN.read(), PLIN.read_many() or a PLINReceiver) takes no lock and never waits for a command.
+
+    A command is coalesced with the last pending command for the same resource when both can be merged, unless a call
+    queued through submit() or query() follows it, as such calls may depend on or change any resource. Commands on
+    different resources commute, so the device ends in the same state as if every command had run in order.
+    Bursts from control threads therefore cost one ioctl: data updates of a frame merge into one update when their
+    byte ranges overlap or touch, ID filter sets and updates fold into one filter, frame entries and the LED state keep
+    the last value, and a query identical to the last queued command shares its call. Coalesced commands share a
+    future, which completes with the result of the merged command; coalesced counts them.
+    '''
+
+    def __init__(self, plin: PLIN):
+        self.plin = plin
+        self.coalesced = 0
+        self._queue: Deque[_Command] = collections.deque()
+        # Last pending command of each resource.
+        self._last: Dict[Hashable, _Command] = {}
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    @property
+    def pending(self) -> int:
+        '''
+        Number of commands queued and not started yet.
+        '''
+        with self._condition:
+            return len(self._queue)
+
+    def start(self):
+        '''
+        Starts the worker thread.
+        '''
+        if self._running:
+            raise PLINException("Command channel already started!")
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"{self.plin.interface}-commands", daemon=True)
+        self._thread.start()
+
+    def stop(self, cancel: bool = False):
+        '''
+        Stops the worker thread once the queued commands are done, or after the current one if cancel is set, in which
+        case the futures of the commands not started are cancelled.
+        '''
+        if not self._running:
+            raise PLINException("Command channel not started!")
+        with self._condition:
+            if cancel:
+                for command in self._queue:
+                    command.future.cancel()
+                self._queue.clear()
+                self._last.clear()
+            self._running = False
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+
+    def submit(self, method: str, *args, **kwargs) -> Future:
+        '''
+        Queues a call to any PLIN method, never coalesced. Pending commands are not coalesced with later ones either.
+        '''
+        return self._submit(method, args, kwargs, barrier=True)
+
+    def query(self, method: str, *args, **kwargs) -> Future:
+        '''
+        Queues a call to a PLIN method without side effects, e.g. get_status, sharing the call with an identical query
+        if it is the last queued command. Queries with arguments that cannot be compared are never shared.
+        '''
+        def merge(pending: _Command) -> Optional[Tuple[str, tuple, dict]]:
+            return (method, args, kwargs) if self._queue and self._queue[-1] is pending else None
+        resource = ("query", method, _freeze(args), _freeze(kwargs))
+        try:
+            hash(resource)
+        except TypeError:
+            return self._submit(method, args, kwargs, barrier=True)
+        return self._submit(method, args, kwargs, resource, merge, barrier=True)
+
+    def get_status(self) -> Future:
+        '''
+        Queues PLIN.get_status() as a query.
+        '''
+        return self.query("get_status")
+
+    def set_frame_entry(self,
+                        id: int,
+                        direction: PLINFrameDirection,
+                        checksum_type: PLINFrameChecksumType,
+                        flags: PLINFrameFlag = PLINFrameFlag.NONE,
+                        data: bytearray = None,
+                        len: int = 0) -> Future:
+        '''
+        Queues PLIN.set_frame_entry(), replacing a pending frame entry of the same ID not followed by a data update.
+        '''
+        _check_ids((id,))
+        args = (id, direction, checksum_type, flags, data, len)
+
+        def merge(pending: _Command) -> Optional[Tuple[str, tuple, dict]]:
+            return ("set_frame_entry", args, {}) if pending.method == "set_frame_entry" else None
+        return self._submit("set_frame_entry", args, {}, ("frame", id), merge)
+
+    def set_frame_entry_data(self, id: int, index: int, data: bytearray, len: int) -> Future:
+        '''
+        Queues PLIN.set_frame_entry_data(), merged with a pending data update of the same ID whose byte range overlaps
+        or touches this one; bytes written by both take the new value.
+        '''
+        _check_ids((id,))
+        if index < 0 or len < 0 or index + len > PLIN_DAT_LEN:
+            raise ValueError(f"Data range [{index}..{index + len}) out of range [0..{PLIN_DAT_LEN}].")
+        data = bytes(data[:len]).ljust(len, b'\x00')
+
+        def merge(pending: _Command) -> Optional[Tuple[str, tuple, dict]]:
+            if pending.method != "set_frame_entry_data":
+                return None
+            _, pending_index, pending_data, pending_len = pending.args
+            start = min(index, pending_index)
+            end = max(index + len, pending_index + pending_len)
+            if index > pending_index + pending_len or pending_index > index + len or end - start > PLIN_DAT_LEN:
+                return None
+            merged = bytearray(end - start)
+            merged[pending_index - start:pending_index - start + pending_len] = pending_data
+            merged[index - start:index - start + len] = data
+            return "set_frame_entry_data", (id, start, bytes(merged), end - start), {}
+        return self._submit("set_frame_entry_data", (id, index, data, len), {}, ("frame", id), merge)
+
+    def set_id_filter(self, filter: bytearray) -> Future:
+        '''
+        Queues PLIN.set_id_filter(), replacing a pending ID filter set or update.
+        '''
+        filter = bytes(filter).ljust(PLIN_USB_FILTER_LEN, b'\x00')
+        return self._submit("set_id_filter", (filter,), {}, "id_filter",
+                            lambda pending: ("set_id_filter", (filter,), {}))
+
+    def update_id_filter(self, allow: Iterable[int] = (), block: Iterable[int] = ()) -> Future:
+        '''
+        Queues PLIN.update_id_filter(), folded into a pending ID filter set or update.
+        '''
+        allow = _check_ids(allow)
+        block = _check_ids(block)
+
+        def merge(pending: _Command) -> Optional[Tuple[str, tuple, dict]]:
+            if pending.method == "set_id_filter":
+                id_filter = int.from_bytes(pending.args[0], 'little')
+                for id in allow:
+                    id_filter |= 1 << id
+                for id in block:
+                    id_filter &= ~(1 << id)
+                return "set_id_filter", (id_filter.to_bytes(PLIN_USB_FILTER_LEN, 'little'),), {}
+            pending_allow, pending_block = pending.args
+            return "update_id_filter", ((pending_allow - block) | allow, (pending_block - allow) | block), {}
+        return self._submit("update_id_filter", (allow, block), {}, "id_filter", merge)
+
+    def set_led_state(self, enable: bool) -> Future:
+        '''
+        Queues PLIN.set_led_state(), replacing a pending LED state.
+        '''
+        return self._submit("set_led_state", (enable,), {}, "led", lambda pending: ("set_led_state", (enable,), {}))
+
+    def _submit(self, method: str, args: tuple, kwargs: dict, resource: Optional[Hashable] = None,
+                merge: Optional[Merge] = None, barrier: bool = False) -> Future:
+        with self._condition:
+            pending = self._last.get(resource) if resource is not None else None
+            if pending is not None and merge is not None and not pending.future.cancelled():
+                merged = merge(pending)
+                if merged is not None:
+                    pending.method, pending.args, pending.kwargs = merged
+                    self.coalesced += 1
+                    return pending.future
+            command = _Command(method, args, kwargs, resource)
+            self._queue.append(command)
+            if barrier:
+                # Commands queued before cannot be moved past this one.
+                self._last.clear()
+            if resource is not None:
+                self._last[resource] = command
+            self._condition.notify()
+        return command.future
+
+    def _next_command(self) -> Optional[_Command]:
+        with self._condition:
+            while not self._queue:
+                if not self._running:
+                    return None
+                self._condition.wait()
+            command = self._queue.popleft()
+            if command.resource is not None and self._last.get(command.resource) is command:
+                del self._last[command.resource]
+            return command
+
+    def _run(self):
+        while True:
+            command = self._next_command()
+            if command is None:
+                return
+            if not command.future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = getattr(self.plin, command.method)(*command.args, **command.kwargs)
+            except Exception as e:
+                command.future.set_exception(e)
+            else:
+                command.future.set_result(result)
@@ -1,12 +1,15 @@
 import fcntl
 import math
 import os
+import select
+import time
 from ctypes import *
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Union
 
 from ioctl_opt import IO, IOW, IOWR
 
 from plin.enums import *
+from plin.instrumentation import PLINInstrumentation
 from plin.structs import *
 
 PLIOHWINIT = IOW(ord('u'), 0, PLINUSBInitHardware)
@@ -40,34 +43,152 @@ PLIOXMTWAKEUP = IO(ord('u'), 33)
 PLIOSETGETRSPMAP = IOWR(ord('u'), 39, PLINUSBResponseRemap)
 PLIOSETLEDSTATE = IOW(ord('u'), 40, PLINUSBLEDState)
 
+IOCTL_NAMES = {value: name for name, value in list(globals().items()) if name.startswith("PLIO")}
+
+# PLIN_EMPTY_DATA as the native 64-bit word found at the data offset of an invalid record.
+PLIN_EMPTY_DATA_WORD = int.from_bytes(PLIN_EMPTY_DATA, 'little')
+# Interval at which write_many() polls the transmit queue of the device while it is full.
+PLIN_TX_QUEUE_POLL_MS = 1
+
 
 class PLINException(Exception):
     pass
 
 
+class PLINIoctlError(PLINException):
+    '''
+    Raised when the device rejects an ioctl, carrying the ioctl code and name and the errno.
+    '''
+
+    def __init__(self, request: int, errno: int, strerror: Optional[str] = None):
+        self.request = request
+        self.name = IOCTL_NAMES.get(request, hex(request))
+        self.errno = errno
+        self.strerror = strerror or os.strerror(errno)
+        super().__init__(f"{self.name} failed: [Errno {errno}] {self.strerror}")
+
+
+def _check_id(id: int):
+    if id > PLINFrameID.MAX or id < PLINFrameID.MIN:
+        raise ValueError(f"ID {id} out of range [{PLINFrameID.MIN}..{PLINFrameID.MAX}].")
+
+
 class PLIN:
     def __init__(self, interface: str):
         self.interface = interface
         self.response_remap = [-1] * PLIN_USB_RSP_REMAP_ID_LEN
         self.fd = None
+        # Local copy of the hardware ID filter (bit n set allows ID n), None until read from the device.
+        self._id_filter = None
+        # Local copy of the frame table, entries are None until set or read from the device.
+        self._frame_entries: List[Optional[PLINUSBFrameEntry]] = [None] * (PLINFrameID.MAX + 1)
+        self._poll = None
+        self._write_poll = None
+        self._read_buffer = bytearray()
+        self._read_frames = 0
+        # Status buffer reused by write_many() to read the free space of the transmit queue.
+        self._tx_status = PLINUSBGetStatus()
+        # PLINInstrumentation recording every ioctl, or None.
+        self.instrumentation: Optional[PLINInstrumentation] = None
 
-    def _ioctl(self, *args, **kwargs):
+    def _open(self) -> int:
         '''
-        Generic ioctl function to wrap open/closing the file descriptor.
+        Opens the device file descriptor.
         '''
-        if self.fd:
-            try:
-                fcntl.ioctl(self.fd, *args, **kwargs)
-            except:
-                print("File descriptor busy!")
-        else:
+        # The descriptor stays non-blocking for its whole life, reads wait for data with poll().
+        return os.open(self.interface, os.O_RDWR | os.O_NONBLOCK)
+
+    def _device_ioctl(self, *args, **kwargs):
+        '''
+        Issues an ioctl on the device file descriptor.
+        '''
+        return fcntl.ioctl(self.fd, *args, **kwargs)
+
+    def _ioctl(self, request: int, *args):
+        '''
+        Issues an ioctl through the instrumentation if set, raising PLINIoctlError if the device rejects it.
+        '''
+        if not self.fd:
+            raise Exception("PLIN not connected!")
+        try:
+            if self.instrumentation is None:
+                return self._device_ioctl(request, *args)
+            return self.instrumentation.call(IOCTL_NAMES.get(request, hex(request)), self._device_ioctl, request, *args)
+        except OSError as e:
+            raise PLINIoctlError(request, e.errno, e.strerror) from e
+
+    def write_many(self, messages: Union[Sequence[PLINMessage], Any], timeout_ms: Optional[int] = None) -> int:
+        '''
+        Writes several PLINMessages to the LIN bus with as few syscalls as possible.
+
+        messages is a sequence of PLINMessages or a buffer of raw records, e.g. a ctypes array of PLINMessage. The IDs of
+        all publisher frames are blocked with at most one ioctl, then the records are written in chunks sized to the free
+        space of the transmit queue of the device (tx_qfree), so frames are not dropped by a full queue. While the queue
+        is full it is polled every PLIN_TX_QUEUE_POLL_MS milliseconds.
+        Returns the number of messages written, fewer than given if timeout_ms milliseconds elapsed first (None waits
+        indefinitely).
+        '''
+        if not self.fd:
             raise Exception("PLIN not connected!")
+        data = self._prepare_write(messages)
+        length = PLINMessage.buffer_length
+        deadline = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000
+        written = 0
+        credit = 0
+        while written < len(data):
+            if credit == 0:
+                credit = self._tx_credit()
+            if credit == 0:
+                if deadline is not None and time.monotonic() >= deadline:
+                    break
+                time.sleep(PLIN_TX_QUEUE_POLL_MS / 1000)
+                continue
+            # Whole records up to the free space of the queue; a partial write is completed before anything else.
+            end = min(len(data), (written // length + credit) * length)
+            if written % length:
+                end = max(end, written + length - written % length)
+            try:
+                sent = os.write(self.fd, data[written:end])
+            except BlockingIOError:
+                remaining_ms = None if deadline is None else max(0, math.ceil((deadline - time.monotonic()) * 1000))
+                if remaining_ms == 0 or not self._wait_writable(remaining_ms):
+                    break
+                continue
+            credit = max(0, credit - ((written + sent) // length - written // length))
+            written += sent
+        return written // length
+
+    def _prepare_write(self, messages: Union[Sequence[PLINMessage], Any]) -> memoryview:
+        '''
+        Returns the whole raw records of messages, after blocking the IDs of their publisher frames with one ioctl.
+        '''
+        length = PLINMessage.buffer_length
+        try:
+            data = memoryview(messages).cast('B')
+        except TypeError:
+            data = memoryview(b''.join(bytes(message) for message in messages))
+        data = data[:len(data) - len(data) % length]
+        ids = bytes(data[PLINMessage.id.offset::length])
+        dirs = bytes(data[PLINMessage.dir.offset::length])
+        publishers = {id for id, dir in zip(ids, dirs) if dir == PLINFrameDirection.PUBLISHER}
+        if publishers:
+            self.update_id_filter(block=publishers)
+        return data
+
+    def _tx_credit(self) -> int:
+        '''
+        Returns the free space of the transmit queue of the device, in messages.
+        '''
+        self._ioctl(PLIOGETSTATUS, self._tx_status)
+        return self._tx_status.tx_qfree
 
     def reset(self):
         '''
         Resets the PLIN device.
         '''
         self._ioctl(PLIORSTHW)
+        self._id_filter = None
+        self._frame_entries = [None] * (PLINFrameID.MAX + 1)
 
     def start(self, mode: PLINMode, baudrate: int = 19200):
         '''
@@ -79,10 +200,11 @@ class PLIN:
         if self.fd:
             raise PLINException("Already connected to PLIN device!")
         else:
-            self.fd = os.open(self.interface, os.O_RDWR)
+            self.fd = self._open()
             self.reset()
             buffer = PLINUSBInitHardware(self.baudrate, self.mode, 0)
             self._ioctl(PLIOHWINIT, buffer)
+            self.get_id_filter()
 
     def stop(self):
         '''
@@ -91,6 +213,8 @@ class PLIN:
         if self.fd:
             os.close(self.fd)
             self.fd = None
+            self._poll = None
+            self._write_poll = None
         else:
             raise PLINException("Not connected to PLIN device!")
 
@@ -107,31 +231,82 @@ class PLIN:
         IMPORTANT NOTE: For a publisher frame, the flag PLINFrameFlag.RSP_ENABLE must be set in order to allow a slave response.
         This flag is set by default if the frame direction is publisher for convenience.
         '''
-        if direction == PLINFrameDirection.PUBLISHER:
-            flags |= PLINFrameFlag.RSP_ENABLE
-
         buffer = PLINUSBFrameEntry(
             id=id, direction=direction, checksum=checksum_type, flags=flags)
         if data:
             buffer.d = data
         if len > 0:
             buffer.len = len
+        self._set_frame_entry(buffer)
+
+    def _set_frame_entry(self, buffer: PLINUSBFrameEntry):
+        '''
+        Sets a frame entry and records it in the local frame table.
+        '''
+        if buffer.direction == PLINFrameDirection.PUBLISHER:
+            buffer.flags |= PLINFrameFlag.RSP_ENABLE
+        _check_id(buffer.id)
         self._ioctl(PLIOSETFRMENTRY, buffer)
+        self._frame_entries[buffer.id] = PLINUSBFrameEntry.from_buffer_copy(buffer)
+
+    def set_frame_entries(self, entries: Iterable[PLINUSBFrameEntry]) -> int:
+        '''
+        Sets several frame entries, only issuing an ioctl for the entries that differ from the local frame table.
+
+        As with set_frame_entry(), PLINFrameFlag.RSP_ENABLE is set on publisher entries.
+        Returns the number of entries written to the device.
+        '''
+        written = 0
+        for entry in entries:
+            buffer = PLINUSBFrameEntry.from_buffer_copy(entry)
+            if buffer.direction == PLINFrameDirection.PUBLISHER:
+                buffer.flags |= PLINFrameFlag.RSP_ENABLE
+            _check_id(buffer.id)
+            current = self._frame_entries[buffer.id]
+            if current is None or bytes(current) != bytes(buffer):
+                self._set_frame_entry(buffer)
+                written += 1
+        return written
 
     def set_frame_entry_data(self, id: int, index: int, data: bytearray, len: int):
         '''
         Sets or updates the data for the frame entry corresponding to the specified ID.
         '''
+        _check_id(id)
+        if index < 0 or len < 0 or index + len > PLIN_DAT_LEN:
+            raise ValueError(f"Data range [{index}..{index + len}) out of range [0..{PLIN_DAT_LEN}].")
         buffer = PLINUSBUpdateData(id=id, idx=index, d=data, len=len)
         self._ioctl(PLIOCHGBYTEARRAY, buffer)
+        entry = self._frame_entries[id]
+        if entry is not None:
+            entry.d[index:index + len] = buffer.d[:len]
 
-    def get_frame_entry(self, id: int) -> PLINUSBFrameEntry:
+    def publisher(self, id: int) -> "PLINPublisher":
+        '''
+        Returns a prepared handle for updating the data of the publisher frame entry with the specified ID.
+        '''
+        _check_id(id)
+        return PLINPublisher(self, id)
+
+    def get_frame_entry(self, id: int, refresh: bool = False) -> PLINUSBFrameEntry:
         '''
         Gets the frame entry corresponding to the specified ID.
+
+        The entry is served from the local frame table when known, unless refresh is set.
         '''
-        buffer = PLINUSBFrameEntry(id=id)
-        self._ioctl(PLIOGETFRMENTRY, buffer)
-        return buffer
+        _check_id(id)
+        entry = self._frame_entries[id]
+        if entry is None or refresh:
+            entry = PLINUSBFrameEntry(id=id)
+            self._ioctl(PLIOGETFRMENTRY, entry)
+            self._frame_entries[id] = entry
+        return PLINUSBFrameEntry.from_buffer_copy(entry)
+
+    def get_frame_entries(self, refresh: bool = False) -> List[PLINUSBFrameEntry]:
+        '''
+        Gets the frame entries of all IDs, only reading the entries missing from the local frame table unless refresh is set.
+        '''
+        return [self.get_frame_entry(id, refresh=refresh) for id in range(PLINFrameID.MIN, PLINFrameID.MAX + 1)]
 
     def start_autobaud(self, timeout: int) -> int:
         '''
@@ -155,53 +330,65 @@ class PLIN:
         '''
         Sets the ID filter.
         '''
+        filter = bytes(filter).ljust(PLIN_USB_FILTER_LEN, b'\x00')
         buffer = PLINUSBIDFilter()
-        buffer.id_mask = (c_ubyte * PLIN_USB_FILTER_LEN)(*
-                                                         filter.ljust(PLIN_USB_FILTER_LEN, b'\x00'))
+        buffer.id_mask = (c_ubyte * PLIN_USB_FILTER_LEN)(*filter)
         self._ioctl(PLIOSETIDFILTER, buffer)
+        self._id_filter = int.from_bytes(filter, 'little')
 
     def get_id_filter(self) -> bytearray:
         '''
-        Gets the ID filter.
+        Gets the ID filter from the device, refreshing the local copy used by block_id, register_id and update_id_filter.
         '''
         buffer = PLINUSBIDFilter()
         self._ioctl(PLIOGETIDFILTER, buffer)
+        self._id_filter = int.from_bytes(buffer.id_mask, 'little')
         return bytearray(buffer.id_mask)
 
+    def _apply_id_filter(self, id_filter: int):
+        '''
+        Sets the ID filter from an integer mask, unless the device already has that filter.
+        '''
+        if id_filter != self._id_filter:
+            self.set_id_filter(id_filter.to_bytes(PLIN_USB_FILTER_LEN, 'little'))
+
+    def update_id_filter(self, allow: Iterable[int] = (), block: Iterable[int] = ()):
+        '''
+        Allows and blocks several IDs with at most one ioctl, or none if the filter is already in the requested state.
+
+        The filter is edited from the local copy, which is only read from the device if it is not known yet.
+        '''
+        if self._id_filter is None:
+            self.get_id_filter()
+        id_filter = self._id_filter
+        for id in allow:
+            _check_id(id)
+            id_filter |= 1 << id
+        for id in block:
+            _check_id(id)
+            id_filter &= ~(1 << id)
+        self._apply_id_filter(id_filter)
+
     def block_id(self, id: int):
         '''
         Add ID to filter (block ID).
         '''
-        if id > PLINFrameID.MAX or id < PLINFrameID.MIN:
-            raise ValueError(
-                f"ID {id} out of range [{PLINFrameID.MIN}..{PLINFrameID.MAX}].")
-        current_filter = int.from_bytes(self.get_id_filter(), 'little')
-        mask = ~(1 << id)
-        current_filter &= mask
-        self.set_id_filter(current_filter.to_bytes(
-            PLIN_USB_FILTER_LEN, 'little'))
+        self.update_id_filter(block=(id,))
 
     def register_id(self, id: int):
         '''
         Remove ID from filter (allow ID through).
         '''
-        if id > PLINFrameID.MAX or id < PLINFrameID.MIN:
-            raise ValueError(
-                f"ID {id} out of range [{PLINFrameID.MIN}..{PLINFrameID.MAX}].")
-        current_filter = int.from_bytes(self.get_id_filter(), 'little')
-        mask = (1 << id)
-        current_filter |= mask
-        self.set_id_filter(current_filter.to_bytes(
-            PLIN_USB_FILTER_LEN, 'little'))
+        self.update_id_filter(allow=(id,))
 
     def clear_id_filter(self, allow_all=True):
         '''
         Clear ID filter to either allow all IDs or disallow all IDs.
         '''
         if allow_all:
-            self.set_id_filter(bytearray([0xff] * PLIN_USB_FILTER_LEN))
+            self._apply_id_filter((1 << (PLIN_USB_FILTER_LEN * 8)) - 1)
         else:
-            self.set_id_filter(bytearray([0] * PLIN_USB_FILTER_LEN))
+            self._apply_id_filter(0)
 
     def get_mode(self) -> PLINMode:
         '''
@@ -265,78 +452,70 @@ class PLIN:
         self._ioctl(PLIOPAUSEHB, buffer)
         return buffer.err
 
-    def add_unconditional_schedule_slot(self, schedule: int, delay_ms: int, id: int) -> int:
+    def add_schedule_slot(self,
+                          schedule: int,
+                          type: PLINUSBSlotType,
+                          delay_ms: int,
+                          ids: Sequence[int] = (),
+                          count_resolve: int = 0) -> PLINUSBAddScheduleSlot:
         '''
-        Adds an unconditional schedule slot for the specified ID.
+        Generic function for adding a schedule slot of any type.
+
+        Unconditional and event-triggered slots take a single ID, sporadic slots take 1 to 8 IDs in priority order and
+        diagnostic slots take none. Returns the slot buffer, holding the error code and the handle of the new slot.
         '''
         if schedule < PLINScheduleIndex.MIN or schedule > PLINScheduleIndex.MAX:
             raise ValueError(
                 f"Schedule out of range [{PLINScheduleIndex.MIN}..{PLINScheduleIndex.MAX}].")
-        if id > PLINFrameID.UNC_MAX:
+        if type == PLINUSBSlotType.SPORADIC:
+            if len(ids) < PLINUSBSlotNumber.MIN or len(ids) > PLINUSBSlotNumber.MAX:
+                raise ValueError(
+                    f"Invalid number of IDs [{PLINUSBSlotNumber.MIN}..{PLINUSBSlotNumber.MAX}].")
+        elif type in (PLINUSBSlotType.MASTER_REQ, PLINUSBSlotType.SLAVE_RSP):
+            ids = (PLINFrameID.DIAG_MASTER_REQ if type == PLINUSBSlotType.MASTER_REQ else PLINFrameID.DIAG_SLAVE_RSP,)
+        elif len(ids) != 1:
+            raise ValueError(f"Slot type {PLINUSBSlotType(type).name} takes exactly one ID.")
+        if type in (PLINUSBSlotType.UNCOND, PLINUSBSlotType.EVENT, PLINUSBSlotType.SPORADIC):
+            for id in ids:
+                if id > PLINFrameID.UNC_MAX:
+                    raise ValueError(
+                        f"ID {id} out of range [{PLINFrameID.UNC_MIN}..{PLINFrameID.UNC_MAX}].")
+        if type == PLINUSBSlotType.EVENT and count_resolve > PLINScheduleIndex.MAX:
             raise ValueError(
-                f"ID {id} out of range [{PLINFrameID.UNC_MIN}..{PLINFrameID.UNC_MAX}].")
+                f"Resolve schedule {count_resolve} out of range [{PLINScheduleIndex.MIN}..{PLINScheduleIndex.MAX}].")
+
         buffer = PLINUSBAddScheduleSlot(
-            schedule=schedule, delay=delay_ms, type=PLINUSBSlotType.UNCOND)
+            schedule=schedule, delay=delay_ms, type=type, count_resolve=count_resolve)
         # ID idx 1 - 7 reserved for sporadic frames only.
-        buffer.id[0] = id
+        buffer.id = (c_uint8 * PLINUSBSlotNumber.MAX)(*ids)
         self._ioctl(PLIOADDSCHDSLOT, buffer)
-        return buffer.err
+        return buffer
+
+    def add_unconditional_schedule_slot(self, schedule: int, delay_ms: int, id: int) -> int:
+        '''
+        Adds an unconditional schedule slot for the specified ID.
+        '''
+        return self.add_schedule_slot(schedule=schedule, type=PLINUSBSlotType.UNCOND, delay_ms=delay_ms, ids=(id,)).err
 
     def add_event_triggered_schedule_slot(self, schedule: int, delay_ms: int, id: int, count_resolve: int):
         '''
         Adds an event-triggered schedule slot for the specified ID.
         '''
-        if schedule < PLINScheduleIndex.MIN or schedule > PLINScheduleIndex.MAX:
-            raise ValueError(
-                f"Schedule out of range [{PLINScheduleIndex.MIN}..{PLINScheduleIndex.MAX}].")
-        if id > PLINFrameID.UNC_MAX:
-            raise ValueError(
-                f"ID {id} out of range [{PLINFrameID.UNC_MIN}..{PLINFrameID.UNC_MAX}].")
-        if count_resolve > PLINScheduleIndex.MAX:
-            raise ValueError(
-                f"Resolve schedule {count_resolve} out of range [{PLINScheduleIndex.MIN}..{PLINScheduleIndex.MAX}].")
-
-        buffer = PLINUSBAddScheduleSlot(
-            schedule=schedule, delay=delay_ms, type=PLINUSBSlotType.EVENT, count_resolve=count_resolve)
-        # ID idx 1 - 7 reserved for sporadic frames only.
-        buffer.id[0] = id
-        self._ioctl(PLIOADDSCHDSLOT, buffer)
-        return buffer.err
+        return self.add_schedule_slot(schedule=schedule, type=PLINUSBSlotType.EVENT, delay_ms=delay_ms, ids=(id,),
+                                      count_resolve=count_resolve).err
 
     def add_sporadic_schedule_slot(self, schedule: int, delay_ms: int, ids: List[int], count_resolve: int):
         '''
         Adds a sporadic schedule slot for the specified ID.
         '''
-        if schedule < PLINScheduleIndex.MIN or schedule > PLINScheduleIndex.MAX:
-            raise ValueError(
-                f"Schedule out of range [{PLINScheduleIndex.MIN}..{PLINScheduleIndex.MAX}].")
-        if len(ids) < PLINUSBSlotNumber.MIN or len(ids) > PLINUSBSlotNumber.MAX:
-            raise ValueError(
-                f"Invalid number of IDs [{PLINUSBSlotNumber.MIN}..{PLINUSBSlotNumber.MAX}].")
-        for id in ids:
-            if id > PLINFrameID.UNC_MAX:
-                raise ValueError(
-                    f"ID {id} out of range [{PLINFrameID.UNC_MIN}..{PLINFrameID.UNC_MAX}].")
-
-        buffer = PLINUSBAddScheduleSlot(
-            schedule=schedule, delay=delay_ms, type=PLINUSBSlotType.SPORADIC, count_resolve=count_resolve)
-        buffer.id = (c_uint8 * PLINUSBSlotNumber.MAX)(*ids)
-        self._ioctl(PLIOADDSCHDSLOT, buffer)
-        return buffer.err
+        return self.add_schedule_slot(schedule=schedule, type=PLINUSBSlotType.SPORADIC, delay_ms=delay_ms, ids=ids,
+                                      count_resolve=count_resolve).err
 
     def add_diagnostic_schedule_slot(self, schedule: int, delay_ms: int, type: PLINUSBSlotType):
         '''
         Generic function for adding a diagnostic schedule slot (either master request or slave response).
         '''
-        if schedule < PLINScheduleIndex.MIN or schedule > PLINScheduleIndex.MAX:
-            raise ValueError(
-                f"Schedule out of range [{PLINScheduleIndex.MIN}..{PLINScheduleIndex.MAX}].")
-        buffer = PLINUSBAddScheduleSlot(
-            schedule=schedule, delay=delay_ms, type=type)
-        # ID idx 1 - 7 reserved for sporadic frames only.
-        buffer.id[0] = PLINFrameID.DIAG_MASTER_REQ if type == PLINUSBSlotType.MASTER_REQ else PLINFrameID.DIAG_SLAVE_RSP
-        self._ioctl(PLIOADDSCHDSLOT, buffer)
-        return buffer.err
+        return self.add_schedule_slot(schedule=schedule, type=type, delay_ms=delay_ms).err
 
     def add_master_request_schedule_slot(self, schedule: int, delay_ms: int):
         '''
@@ -512,28 +691,117 @@ class PLIN:
         buffer = PLINUSBLEDState(on_off=int(enable))
         self._ioctl(PLIOSETLEDSTATE, buffer)
 
-    def read(self, block=True) -> Union[PLINMessage, None]:
+    def _wait_readable(self, timeout_ms: Optional[int]) -> bool:
+        '''
+        Waits up to timeout_ms milliseconds for the device to have data to read.
+
+        A timeout of None waits indefinitely.
+        '''
+        if self._poll is None:
+            self._poll = select.poll()
+            self._poll.register(self.fd, select.POLLIN)
+        return bool(self._poll.poll(timeout_ms))
+
+    def _wait_writable(self, timeout_ms: Optional[int]) -> bool:
+        '''
+        Waits up to timeout_ms milliseconds for the device to accept data to write.
+
+        A timeout of None waits indefinitely.
+        '''
+        if self._write_poll is None:
+            self._write_poll = select.poll()
+            self._write_poll.register(self.fd, select.POLLOUT)
+        return bool(self._write_poll.poll(timeout_ms))
+
+    def _read_into(self, buffer: Any, timeout_ms: Optional[int]) -> int:
+        '''
+        Reads from the device into buffer, waiting up to timeout_ms milliseconds if no data is queued.
+
+        Data that is already queued is read with a single syscall. Returns the number of bytes read, 0 on timeout.
+        Raises PLINException at end of file (e.g. the device was unplugged) and OSError on any other read error.
+        '''
+        deadline = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000
+        while True:
+            try:
+                count = os.readv(self.fd, [buffer])
+            except (BlockingIOError, InterruptedError):
+                remaining_ms = None if deadline is None else max(0, math.ceil((deadline - time.monotonic()) * 1000))
+                if remaining_ms == 0 or not self._wait_readable(remaining_ms):
+                    return 0
+                continue
+            if count == 0:
+                raise PLINException("PLIN device closed (end of file)!")
+            return count
+
+    def read(self, block: bool = True, timeout_ms: Optional[int] = None) -> Union[PLINMessage, None]:
         '''
         Reads a PLINMessage from the LIN bus with an optional timeout in milliseconds.
 
-        A timeout value of 0 blocks until data is read. If the timeout is reached before data is read, None is returned.
+        A timeout of None blocks until data is read, and block=False is equivalent to a timeout of 0.
+        If the timeout is reached before data is read, None is returned.
         '''
         if self.fd:
-            blocking = os.get_blocking(self.fd)
-            os.set_blocking(self.fd, block)
-            try:
-                result = os.read(self.fd, PLINMessage.buffer_length)
-                message = PLINMessage.from_buffer_copy(result)
-                # If bytes read was invalid.
-                if bytes(message.data) == PLIN_EMPTY_DATA:
-                    message = None
-            except:
+            message = PLINMessage()
+            count = self._read_into(memoryview(message).cast('B'), timeout_ms if block else 0)
+            # If bytes read was invalid.
+            if count < PLINMessage.buffer_length or bytes(message.data) == PLIN_EMPTY_DATA:
                 message = None
-            os.set_blocking(self.fd, blocking)
             return message
         else:
             raise Exception("PLIN not connected!")
 
+    def _get_read_buffer(self, max_frames: int) -> bytearray:
+        '''
+        Returns the preallocated read buffer, growing it if it cannot hold max_frames messages.
+        '''
+        if max_frames > self._read_frames:
+            # Batches returned by read_many() may still reference the old buffer, so it is replaced, not resized.
+            self._read_buffer = bytearray(max_frames * PLINMessage.buffer_length)
+            self._read_frames = max_frames
+        return self._read_buffer
+
+    def _compact_batch(self, buffer: bytearray, count: int) -> int:
+        '''
+        Removes invalid messages from the first count messages of buffer, returning the number of valid messages left.
+        '''
+        length = PLINMessage.buffer_length
+        offset = PLINMessage.data.offset
+        view = memoryview(buffer)
+        valid = 0
+        for i in range(count):
+            record = view[i * length:(i + 1) * length]
+            if record[offset:offset + PLIN_DAT_LEN] == PLIN_EMPTY_DATA:
+                continue
+            if valid != i:
+                view[valid * length:(valid + 1) * length] = record
+            valid += 1
+        return valid
+
+    def read_many(self, max_frames: int, timeout_ms: Optional[int] = None) -> Sequence[PLINMessage]:
+        '''
+        Reads up to max_frames PLINMessages queued by the driver with a single read into a preallocated buffer.
+
+        The returned batch is a ctypes array of PLINMessage views over that buffer, which is reused by the next call.
+        Copy any message that must outlive the next call (e.g. with PLINMessage.from_buffer_copy).
+        A timeout of None blocks until data is read. If the timeout is reached before data is read, an empty batch is returned.
+        '''
+        if not self.fd:
+            raise Exception("PLIN not connected!")
+        if max_frames < 1:
+            raise ValueError(f"max_frames {max_frames} must be at least 1.")
+
+        buffer = self._get_read_buffer(max_frames)
+        view = memoryview(buffer)[:max_frames * PLINMessage.buffer_length]
+        count = self._read_into(view, timeout_ms) // PLINMessage.buffer_length
+
+        # Check the data field of every message in the batch at once, only compacting if an invalid one was read.
+        stride = PLINMessage.buffer_length // 8
+        first = PLINMessage.data.offset // 8
+        data_words = memoryview(buffer).cast('Q')[first:count * stride:stride]
+        if PLIN_EMPTY_DATA_WORD in data_words:
+            count = self._compact_batch(buffer, count)
+        return (PLINMessage * count).from_buffer(buffer)
+
     def write(self, message: PLINMessage):
         '''
         Writes a PLINMessage to the LIN bus.
@@ -542,6 +810,72 @@ class PLIN:
             if message.dir == PLINFrameDirection.PUBLISHER:
                 self.block_id(message.id)
             buffer = bytearray(message)
-            os.write(self.fd, buffer)
+            try:
+                os.write(self.fd, buffer)
+            except BlockingIOError:
+                self._wait_writable(None)
+                os.write(self.fd, buffer)
         else:
             raise Exception("PLIN not connected!")
+
+
+class PLINPublisher:
+    '''
+    Prepared handle for updating the data of a publisher frame entry, returned by PLIN.publisher().
+
+    The handle owns a preallocated PLIOCHGBYTEARRAY buffer and compares new data with the data last sent, as held in the
+    local frame table of the device, so update() only sends the range of bytes that changed, or nothing.
+    '''
+    _DATA_OFFSET = PLINUSBUpdateData.d.offset
+    _ENTRY_DATA_OFFSET = PLINUSBFrameEntry.d.offset
+
+    def __init__(self, plin: PLIN, id: int):
+        self.plin = plin
+        self.id = id
+        self._buffer = PLINUSBUpdateData(id=id)
+        self._view = memoryview(self._buffer).cast('B')
+        self._entry = None
+        self._entry_data = None
+
+    @property
+    def data(self) -> bytearray:
+        '''
+        Data bytes of the frame entry as last sent.
+        '''
+        return bytearray(self._last_data())
+
+    def _last_data(self) -> memoryview:
+        entry = self.plin._frame_entries[self.id]
+        if entry is None:
+            self.plin.get_frame_entry(self.id)
+            entry = self.plin._frame_entries[self.id]
+        if entry is not self._entry:
+            # The entry was replaced, e.g. by set_frame_entry() or reset().
+            self._entry = entry
+            self._entry_data = memoryview(entry).cast('B')[self._ENTRY_DATA_OFFSET:self._ENTRY_DATA_OFFSET + PLIN_DAT_LEN]
+        return self._entry_data
+
+    def update(self, data: Union[bytes, bytearray, Sequence[int]], index: int = 0) -> bool:
+        '''
+        Sets the data bytes of the frame entry starting at index, returning whether an ioctl was needed.
+        '''
+        end = index + len(data)
+        if index < 0 or end > PLIN_DAT_LEN:
+            raise ValueError(f"Data range [{index}..{end}) out of range [0..{PLIN_DAT_LEN}].")
+        last = self._last_data()
+        first = index
+        while first < end and last[first] == data[first - index]:
+            first += 1
+        if first == end:
+            return False
+        stop = end
+        while last[stop - 1] == data[stop - 1 - index]:
+            stop -= 1
+
+        buffer = self._buffer
+        buffer.idx = first
+        buffer.len = stop - first
+        self._view[self._DATA_OFFSET:self._DATA_OFFSET + stop - first] = bytes(data[first - index:stop - index])
+        self.plin._ioctl(PLIOCHGBYTEARRAY, buffer)
+        last[first:stop] = self._view[self._DATA_OFFSET:self._DATA_OFFSET + stop - first]
+        return True
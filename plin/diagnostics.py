@@ -0,0 +1,129 @@
+import collections
+import threading
+from concurrent.futures import Future
+from typing import Deque, Dict, NamedTuple, Optional
+
+from plin.device import PLINException
+from plin.transport import LINTransport
+
+
+class DiagnosticJob(NamedTuple):
+    '''
+    A request queued on a DiagnosticScheduler.
+    '''
+    nad: int
+    payload: bytes
+    expect_response: bool
+    future: Future
+
+
+class DiagnosticScheduler:
+    '''
+    Runs diagnostic and node configuration requests to many nodes through a LINTransport, returning futures.
+
+    A slave node discards its response when a master request addressed to another node is sent, so requests cannot
+    overlap on the bus. The scheduler instead keeps the bus busy: a worker thread takes the next request as soon as
+    the previous transaction ends, visiting the nodes with queued requests round-robin so that no node waits behind
+    another node's whole backlog. Each node has at most one outstanding request and its requests run in submission
+    order. A future completes with the response, or with the exception raised by the transport (e.g. LINTPError on
+    a timeout); requests sent with expect_response=False complete with None once sent.
+    '''
+
+    def __init__(self, transport: LINTransport):
+        self.transport = transport
+        self._jobs: Dict[int, Deque[DiagnosticJob]] = {}
+        self._ready: Deque[int] = collections.deque()
+        self._condition = threading.Condition()
+        self._running = False
+        # Set by stop(), until the scheduler is started again.
+        self._stopped = False
+        self._thread = None
+
+    def submit(self, nad: int, payload: bytes, expect_response: bool = True) -> Future:
+        '''
+        Queues a request to the node with the specified NAD. Requests may be queued before start(), but raise
+        RuntimeError once the scheduler is stopped, as no worker would run them.
+        '''
+        job = DiagnosticJob(nad, bytes(payload), expect_response, Future())
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError("Scheduler stopped!")
+            jobs = self._jobs.get(nad)
+            if jobs is None:
+                jobs = self._jobs[nad] = collections.deque()
+            if not jobs:
+                self._ready.append(nad)
+            jobs.append(job)
+            self._condition.notify()
+        return job.future
+
+    @property
+    def pending(self) -> int:
+        '''
+        Number of requests queued and not started yet.
+        '''
+        with self._condition:
+            return sum(len(jobs) for jobs in self._jobs.values())
+
+    def start(self):
+        '''
+        Starts the worker thread.
+        '''
+        if self._running:
+            raise PLINException("Scheduler already started!")
+        self._running = True
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=f"{self.transport.plin.interface}-diagnostics",
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self, cancel: bool = False):
+        '''
+        Stops the worker thread once the queued requests are done, or after the current one if cancel is set, in which
+        case the futures of the requests not started are cancelled.
+        '''
+        if not self._running:
+            raise PLINException("Scheduler not started!")
+        with self._condition:
+            if cancel:
+                for jobs in self._jobs.values():
+                    for job in jobs:
+                        job.future.cancel()
+                    jobs.clear()
+                self._ready.clear()
+            self._running = False
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join()
+        self._thread = None
+
+    def _next_job(self) -> Optional[DiagnosticJob]:
+        with self._condition:
+            while not self._ready:
+                if not self._running:
+                    return None
+                self._condition.wait()
+            nad = self._ready.popleft()
+            jobs = self._jobs[nad]
+            job = jobs.popleft()
+            if jobs:
+                self._ready.append(nad)
+            return job
+
+    def _run(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            if not job.future.set_running_or_notify_cancel():
+                continue
+            try:
+                if job.expect_response:
+                    result = self.transport.request(job.nad, job.payload)
+                else:
+                    self.transport.send(job.nad, job.payload)
+                    result = None
+            except Exception as e:
+                job.future.set_exception(e)
+            else:
+                job.future.set_result(result)
@@ -0,0 +1,563 @@
+import array
+import errno
+import fcntl
+import select
+import socket
+import termios
+import threading
+import time
+from ctypes import *
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from plin.device import *
+from plin.enums import *
+from plin.lin import *
+from plin.structs import *
+
+
+class PLINEmulator:
+    '''
+    In-process emulation of a PLIN device, for running the library without PEAK hardware.
+
+    The device is reached through one end of a socket pair, read and written like the chardev, and through ioctl(),
+    which implements the PLIO* commands on their ctypes buffers. A bus thread runs the active schedule (or keep-alive
+    frame) in master mode, transmits frames written by the host, applies the ID filter and timestamps every received
+    message with a virtual clock advancing by the nominal LIN frame time at the configured baudrate.
+
+    Emulated slave nodes answer subscriber frames with the data given to set_slave_response(). In slave mode, headers
+    from an emulated master are injected with receive_header(). time_scale scales the emulated bus time to real time:
+    1.0 runs in real time, 0 runs as fast as the host consumes frames.
+
+    Received messages are delivered to the host through a device queue of rx_queue_size messages. If the host does not
+    keep up, further messages are dropped, usb_rx_ovr is incremented and an OVERRUN message is delivered once the
+    queue drains.
+    '''
+
+    def __init__(self,
+                 bus_baudrate: int = 19200,
+                 time_scale: float = 1.0,
+                 rx_queue_size: int = 1024,
+                 tx_queue_size: int = 32,
+                 slot_pool_size: int = 256,
+                 firmware_version: str = "2.5.0"):
+        self.bus_baudrate = bus_baudrate
+        self.time_scale = time_scale
+        self.rx_queue_size = rx_queue_size
+        self.tx_queue_size = tx_queue_size
+        self.slot_pool_size = slot_pool_size
+        self.firmware_version = [int(v) for v in firmware_version.split('.')]
+        self.led = False
+        self.id_string = b''
+
+        self._lock = threading.RLock()
+        self._socket = None
+        self._thread = None
+        self._running = False
+        self._slave_responses: Dict[int, Union[bytes, Callable[[], Optional[bytes]]]] = {}
+        self._monitors: List[Callable[[PLINMessage], None]] = []
+        self._next_handle = 1
+        self._reset_state()
+
+    def _reset_state(self):
+        self.mode = PLINMode.NONE
+        self.baudrate = 0
+        self.bus_state = PLINBusState.UNINIT
+        self.id_filter = (1 << (PLIN_USB_FILTER_LEN * 8)) - 1
+        self.frame_entries: List[PLINUSBFrameEntry] = [PLINUSBFrameEntry(id=id)
+                                                       for id in range(PLINFrameID.MAX + 1)]
+        self.response_remap = [0] * PLIN_USB_RSP_REMAP_ID_LEN
+        self.schedules: List[List[PLINUSBAddScheduleSlot]] = [[] for _ in range(PLINScheduleIndex.MAX + 1)]
+        self.breakpoints = set()
+        self.usb_rx_ovr = 0
+        self._updated = set()
+        self._active_schedule = None
+        self._suspended = None
+        self._slot = 0
+        self._keep_alive = None
+        self._keep_alive_running = False
+        self._tx_queue: List[PLINMessage] = []
+        self._tx_buffer = bytearray()
+        self._rx_buffer = bytearray()
+        self._overrun = False
+        self._clock_us = 0.0
+
+    def open(self) -> int:
+        '''
+        Returns a new file descriptor for the device, owned by the caller.
+        '''
+        with self._lock:
+            if self._socket is not None:
+                raise PLINException("Emulated device already open!")
+            host, self._socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.setblocking(False)
+            host.setblocking(False)
+            return host.detach()
+
+    def close(self):
+        '''
+        Stops the bus thread and closes the device end of the socket pair.
+        '''
+        self._stop_bus()
+        with self._lock:
+            if self._socket is not None:
+                self._socket.close()
+                self._socket = None
+
+    def now_us(self) -> int:
+        '''
+        Current time of the emulated device clock, as used for ts_us.
+        '''
+        return int(self._clock_us)
+
+    def set_slave_response(self, id: int, data: Union[bytes, Callable[[], Optional[bytes]], None]):
+        '''
+        Sets the response an emulated slave node gives to subscriber frames with the specified ID.
+
+        data may be a callable returning the response, or None for no response. None removes the slave node.
+        '''
+        with self._lock:
+            if data is None:
+                self._slave_responses.pop(id, None)
+            else:
+                self._slave_responses[id] = data
+
+    def add_monitor(self, callback: Callable[[PLINMessage], None]):
+        '''
+        Registers a callback for every frame on the bus regardless of the ID filter, e.g. to emulate a slave node
+        reacting to master requests. It is called from the bus thread, before the frame is delivered to the host.
+        '''
+        with self._lock:
+            self._monitors.append(callback)
+
+    def receive_header(self, id: int):
+        '''
+        Emulates a header sent by a master node on the bus (slave mode).
+        '''
+        with self._lock:
+            self._transmit(id)
+            self._flush_rx()
+
+    def inject(self, messages: Iterable[PLINMessage]):
+        '''
+        Queues messages for the host as if they had been received, subject to the ID filter.
+        '''
+        with self._lock:
+            for message in messages:
+                self._deliver(message)
+            self._flush_rx()
+
+    def ioctl(self, request: int, arg: Any = None) -> int:
+        '''
+        Executes a PLIO* command, updating arg in place like the driver does.
+        '''
+        handler = self._handlers.get(request)
+        if handler is None:
+            raise OSError(errno.ENOTTY, "Inappropriate ioctl for device")
+        with self._lock:
+            handler(self, arg)
+        return 0
+
+    # Bus model.
+
+    def _start_bus(self):
+        if self._thread is None:
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="plin-emulator", daemon=True)
+            self._thread.start()
+
+    def _stop_bus(self):
+        thread = self._thread
+        if thread is not None:
+            self._running = False
+            thread.join()
+            self._thread = None
+
+    def _run(self):
+        poll = select.poll()
+        with self._lock:
+            poll.register(self._socket.fileno(), select.POLLIN)
+        while self._running:
+            with self._lock:
+                self._receive_host_writes()
+                duration_us = self._step()
+                if duration_us is None or self.time_scale > 0 or len(self._rx_buffer) >= 64 * PLINMessage.buffer_length:
+                    self._flush_rx()
+                pending = bool(self._rx_buffer)
+            if duration_us is not None:
+                if self.time_scale > 0:
+                    time.sleep(duration_us * self.time_scale / 1000000)
+                continue
+            # Idle: wait for the host to write or read, and let the emulated clock follow real time.
+            start = time.monotonic()
+            poll.modify(self._socket.fileno(), select.POLLIN | (select.POLLOUT if pending else 0))
+            poll.poll(10)
+            with self._lock:
+                if self.time_scale > 0:
+                    self._clock_us += (time.monotonic() - start) * 1000000 / self.time_scale
+
+    def _step(self) -> Optional[float]:
+        '''
+        Executes the next bus action, returning its duration in microseconds or None if the bus is idle.
+        '''
+        if self.mode != PLINMode.MASTER or self.bus_state != PLINBusState.ACTIVE:
+            self._tx_queue.clear()
+            return None
+        if self._tx_queue:
+            message = self._tx_queue.pop(0)
+            data = bytes(message.data) if message.dir == PLINFrameDirection.PUBLISHER else None
+            return self._transmit(message.id, data)
+        if self._active_schedule is not None:
+            slots = self.schedules[self._active_schedule]
+            slot = slots[self._slot]
+            if slot.handle in self.breakpoints:
+                self._suspended = self._active_schedule
+                self._active_schedule = None
+                return None
+            self._slot = (self._slot + 1) % len(slots)
+            return self._run_slot(slot.delay, self._execute_slot, slot)
+        if self._keep_alive_running and self._keep_alive is not None:
+            id, period_ms = self._keep_alive
+            return self._run_slot(period_ms, self._transmit, id)
+        return None
+
+    def _run_slot(self, delay_ms: int, action: Callable, *args) -> float:
+        '''
+        Runs the action at the start of a slot, then advances the clock to the end of the slot.
+        '''
+        start_us = self._clock_us
+        action(*args)
+        self._clock_us = max(self._clock_us, start_us + delay_ms * 1000)
+        return self._clock_us - start_us
+
+    def _execute_slot(self, slot: PLINUSBAddScheduleSlot):
+        if slot.type == PLINUSBSlotType.SPORADIC:
+            # Only the highest priority frame with updated data is sent, if any.
+            for id in slot.id:
+                if id in self._updated:
+                    self._transmit(id)
+                    return
+            return
+        if slot.type == PLINUSBSlotType.EVENT and not self._slave_response(slot.id[0]):
+            return
+        self._transmit(slot.id[0])
+
+    def _slave_response(self, id: int) -> Optional[bytes]:
+        response = self._slave_responses.get(id)
+        if callable(response):
+            response = response()
+        return response
+
+    def _transmit(self, id: int, data: Optional[bytes] = None) -> float:
+        '''
+        Emulates a frame with the specified ID on the bus and delivers it to the host, returning its duration.
+        '''
+        entry = self.frame_entries[id & PLINFrameID.MAX]
+        flags = 0
+        direction = entry.direction
+        if data is None and direction == PLINFrameDirection.PUBLISHER:
+            if entry.flags & PLINFrameFlag.SINGLE_SHOT and id not in self._updated:
+                data = None
+            else:
+                remap = self.response_remap[id] if self.mode == PLINMode.SLAVE else 0
+                source = self.frame_entries[remap] if remap else entry
+                data = bytes(source.d)[:entry.len or PLIN_DAT_LEN]
+        elif data is None:
+            data = self._slave_response(id)
+        self._updated.discard(id)
+
+        if data is None:
+            flags = PLINFrameErrorFlag.SLV_NOT_RSP
+            data = b''
+        length = len(data)
+        duration_us = frame_time_us(length, self.baudrate or self.bus_baudrate)
+        self._clock_us += duration_us
+        message = PLINMessage(type=PLINMessageType.FRAME, flags=flags, id=id, len=length, dir=direction,
+                              cs_type=entry.checksum, ts_us=self.now_us(), data=data.ljust(PLIN_DAT_LEN, b'\x00'))
+        for monitor in self._monitors:
+            monitor(message)
+        self._deliver(message)
+
+        # Go-to-sleep command.
+        if id == PLINFrameID.DIAG_MASTER_REQ and length and data[0] == 0:
+            self.bus_state = PLINBusState.SLEEP
+            self._deliver(PLINMessage(type=PLINMessageType.SLEEP, ts_us=self.now_us()))
+        return duration_us
+
+    def _deliver(self, message: PLINMessage):
+        if message.type == PLINMessageType.FRAME and not self.id_filter & (1 << (message.id & PLINFrameID.MAX)):
+            return
+        length = PLINMessage.buffer_length
+        if self._overrun:
+            if len(self._rx_buffer) + 2 * length > self.rx_queue_size * length:
+                self.usb_rx_ovr = (self.usb_rx_ovr + 1) & 0xffff
+                return
+            self._rx_buffer += bytes(PLINMessage(type=PLINMessageType.OVERRUN, ts_us=self.now_us()))
+            self._overrun = False
+        if len(self._rx_buffer) + length > self.rx_queue_size * length:
+            self.usb_rx_ovr = (self.usb_rx_ovr + 1) & 0xffff
+            self._overrun = True
+            return
+        self._rx_buffer += bytes(message)
+
+    def _flush_rx(self):
+        if self._rx_buffer and self._socket is not None:
+            try:
+                sent = self._socket.send(self._rx_buffer)
+            except (BlockingIOError, BrokenPipeError, ConnectionResetError):
+                return
+            del self._rx_buffer[:sent]
+
+    def _receive_host_writes(self):
+        try:
+            data = self._socket.recv(65536)
+        except (BlockingIOError, ConnectionResetError):
+            return
+        self._tx_buffer += data
+        length = PLINMessage.buffer_length
+        while len(self._tx_buffer) >= length:
+            message = PLINMessage.from_buffer_copy(self._tx_buffer)
+            del self._tx_buffer[:length]
+            # Like the device, frames written while the queue is full are lost.
+            if len(self._tx_queue) < self.tx_queue_size:
+                self._tx_queue.append(message)
+
+    # PLIO* commands.
+
+    def _init_hardware(self, arg: PLINUSBInitHardware):
+        self.mode = PLINMode(arg.mode)
+        self.baudrate = arg.baudrate
+        self.bus_state = PLINBusState.ACTIVE if self.mode != PLINMode.NONE else PLINBusState.UNINIT
+        if self.mode != PLINMode.NONE:
+            self._start_bus()
+
+    def _reset_hardware(self, arg):
+        self._reset_state()
+
+    def _set_frame_entry(self, arg: PLINUSBFrameEntry):
+        self.frame_entries[arg.id & PLINFrameID.MAX] = PLINUSBFrameEntry.from_buffer_copy(arg)
+
+    def _get_frame_entry(self, arg: PLINUSBFrameEntry):
+        memmove(addressof(arg), addressof(self.frame_entries[arg.id & PLINFrameID.MAX]), sizeof(arg))
+
+    def _start_autobaud(self, arg: PLINUSBAutoBaud):
+        if self.mode != PLINMode.NONE:
+            arg.err = PLINError.ILL_MODE
+            return
+        self.baudrate = self.bus_baudrate
+        arg.err = PLINError.OK
+        self._deliver(PLINMessage(type=PLINMessageType.AUTOBAUD_OK, ts_us=self.now_us()))
+        self._flush_rx()
+
+    def _get_baudrate(self, arg: PLINUSBGetBaudrate):
+        arg.baudrate = self.baudrate
+
+    def _set_id_filter(self, arg: PLINUSBIDFilter):
+        self.id_filter = int.from_bytes(bytes(arg.id_mask), 'little')
+
+    def _get_id_filter(self, arg: PLINUSBIDFilter):
+        arg.id_mask = (c_uint8 * PLIN_USB_FILTER_LEN)(*self.id_filter.to_bytes(PLIN_USB_FILTER_LEN, 'little'))
+
+    def _get_mode(self, arg: PLINUSBGetMode):
+        arg.mode = self.mode
+
+    def _set_id_string(self, arg: PLINUSBIDString):
+        self.id_string = arg.str
+
+    def _get_id_string(self, arg: PLINUSBIDString):
+        arg.str = self.id_string
+
+    def _identify(self, arg):
+        pass
+
+    def _get_firmware_version(self, arg: PLINUSBFirmwareVersion):
+        arg.major, arg.minor, arg.sub = self.firmware_version
+
+    def _start_keep_alive(self, arg: PLINUSBKeepAlive):
+        self._keep_alive = (arg.id, arg.period_ms)
+        self._keep_alive_running = True
+        arg.err = PLINError.OK
+
+    def _resume_keep_alive(self, arg: PLINUSBKeepAlive):
+        self._keep_alive_running = self._keep_alive is not None
+        arg.err = PLINError.OK if self._keep_alive_running else PLINError.FAIL
+
+    def _pause_keep_alive(self, arg: PLINUSBKeepAlive):
+        self._keep_alive_running = False
+        arg.err = PLINError.OK
+
+    def _slots_used(self) -> int:
+        return sum(len(slots) for slots in self.schedules)
+
+    def _add_schedule_slot(self, arg: PLINUSBAddScheduleSlot):
+        if arg.schedule > PLINScheduleIndex.MAX:
+            arg.err = PLINError.ILL_SCHEDULE
+            return
+        if self._slots_used() >= self.slot_pool_size:
+            arg.err = PLINError.SLOTPOOL
+            return
+        arg.handle = self._next_handle
+        self._next_handle += 1
+        arg.err = PLINError.OK
+        self.schedules[arg.schedule].append(PLINUSBAddScheduleSlot.from_buffer_copy(arg))
+
+    def _delete_schedule(self, arg: PLINUSBDeleteSchedule):
+        if arg.schedule > PLINScheduleIndex.MAX:
+            arg.err = PLINError.ILL_SCHEDULE
+            return
+        for slot in self.schedules[arg.schedule]:
+            self.breakpoints.discard(slot.handle)
+        self.schedules[arg.schedule] = []
+        if self._active_schedule == arg.schedule:
+            self._active_schedule = None
+        if self._suspended == arg.schedule:
+            self._suspended = None
+        arg.err = PLINError.OK
+
+    def _get_slot_count(self, arg: PLINUSBGetSlotCount):
+        arg.count = len(self.schedules[arg.schedule]) if arg.schedule <= PLINScheduleIndex.MAX else 0
+
+    def _get_schedule_slot(self, arg: PLINUSBGetScheduleSlot):
+        slots = self.schedules[arg.schedule] if arg.schedule <= PLINScheduleIndex.MAX else []
+        if arg.slot_idx >= len(slots):
+            arg.err = 1
+            return
+        slot = slots[arg.slot_idx]
+        arg.err = 0
+        arg.type = slot.type
+        arg.count_resolve = slot.count_resolve
+        arg.delay = slot.delay
+        arg.id = slot.id
+        arg.handle = slot.handle
+
+    def _set_schedule_breakpoint(self, arg: PLINUSBSetScheduleBreakpoint):
+        if arg.brkpt:
+            self.breakpoints.add(arg.handle)
+        else:
+            self.breakpoints.discard(arg.handle)
+
+    def _start_schedule(self, arg: PLINUSBStartSchedule):
+        if self.mode != PLINMode.MASTER:
+            arg.err = PLINError.ILL_MODE
+        elif arg.schedule > PLINScheduleIndex.MAX or not self.schedules[arg.schedule]:
+            arg.err = PLINError.ILL_SCHEDULE
+        else:
+            self._active_schedule = arg.schedule
+            self._suspended = None
+            self._slot = 0
+            arg.err = PLINError.OK
+
+    def _resume_schedule(self, arg: PLINUSBResumeSchedule):
+        if self.mode != PLINMode.MASTER or self._suspended is None:
+            arg.err = 1
+            return
+        self._active_schedule = self._suspended
+        self._suspended = None
+        slots = self.schedules[self._active_schedule]
+        # Step over the breakpoint the schedule stopped at.
+        if slots[self._slot].handle in self.breakpoints:
+            self._execute_slot(slots[self._slot])
+            self._slot = (self._slot + 1) % len(slots)
+        arg.err = PLINError.OK
+
+    def _suspend_schedule(self, arg: PLINUSBSuspendSchedule):
+        if self._active_schedule is None:
+            arg.err = 1
+            return
+        arg.schedule = self._active_schedule
+        arg.handle = self.schedules[self._active_schedule][self._slot].handle
+        self._suspended = self._active_schedule
+        self._active_schedule = None
+        arg.err = PLINError.OK
+
+    def _get_status(self, arg: PLINUSBGetStatus):
+        arg.mode = self.mode
+        # Writes already accepted by the host file descriptor count as queued, as with the driver.
+        pending = array.array('i', [0])
+        if self._socket is not None:
+            fcntl.ioctl(self._socket.fileno(), termios.FIONREAD, pending)
+        queued = len(self._tx_queue) + (pending[0] + len(self._tx_buffer)) // PLINMessage.buffer_length
+        arg.tx_qfree = max(0, self.tx_queue_size - queued)
+        arg.schd_poolfree = self.slot_pool_size - self._slots_used()
+        arg.baudrate = self.baudrate
+        arg.usb_rx_ovr = self.usb_rx_ovr
+        arg.usb_filter = self.id_filter
+        arg.bus_state = self.bus_state
+
+    def _reset_tx_queue(self, arg):
+        self._tx_queue.clear()
+
+    def _update_data(self, arg: PLINUSBUpdateData):
+        entry = self.frame_entries[arg.id & PLINFrameID.MAX]
+        length = min(arg.len, PLIN_DAT_LEN - arg.idx)
+        entry.d[arg.idx:arg.idx + length] = arg.d[:length]
+        self._updated.add(arg.id & PLINFrameID.MAX)
+
+    def _wakeup(self, arg):
+        self.bus_state = PLINBusState.ACTIVE if self.mode != PLINMode.NONE else PLINBusState.UNINIT
+        self._deliver(PLINMessage(type=PLINMessageType.WAKEUP, ts_us=self.now_us()))
+        self._flush_rx()
+
+    def _response_remap(self, arg: PLINUSBResponseRemap):
+        if arg.set_get == PLINUSBResponseRemapType.SET:
+            self.response_remap = list(arg.id)
+        else:
+            arg.id = (c_uint8 * PLIN_USB_RSP_REMAP_ID_LEN)(*self.response_remap)
+
+    def _set_led_state(self, arg: PLINUSBLEDState):
+        self.led = bool(arg.on_off)
+
+    _handlers = {
+        PLIOHWINIT: _init_hardware,
+        PLIORSTHW: _reset_hardware,
+        PLIOSETFRMENTRY: _set_frame_entry,
+        PLIOGETFRMENTRY: _get_frame_entry,
+        PLIOSTARTAUTOBAUD: _start_autobaud,
+        PLIOGETBAUDRATE: _get_baudrate,
+        PLIOSETIDFILTER: _set_id_filter,
+        PLIOGETIDFILTER: _get_id_filter,
+        PLIOGETMODE: _get_mode,
+        PLIOSETIDSTR: _set_id_string,
+        PLIOGETIDSTR: _get_id_string,
+        PLIOIDENTIFY: _identify,
+        PLIOGETFWVER: _get_firmware_version,
+        PLIOSTARTHB: _start_keep_alive,
+        PLIORESUMEHB: _resume_keep_alive,
+        PLIOPAUSEHB: _pause_keep_alive,
+        PLIOADDSCHDSLOT: _add_schedule_slot,
+        PLIODELSCHD: _delete_schedule,
+        PLIOGETSLOTSCNT: _get_slot_count,
+        PLIOGETSCHDSLOT: _get_schedule_slot,
+        PLIOSETSCHDBP: _set_schedule_breakpoint,
+        PLIOSTARTSCHD: _start_schedule,
+        PLIORESUMESCHD: _resume_schedule,
+        PLIOPAUSESCHD: _suspend_schedule,
+        PLIOGETSTATUS: _get_status,
+        PLIORSTUSBTX: _reset_tx_queue,
+        PLIOCHGBYTEARRAY: _update_data,
+        PLIOXMTWAKEUP: _wakeup,
+        PLIOSETGETRSPMAP: _response_remap,
+        PLIOSETLEDSTATE: _set_led_state,
+    }
+
+
+class EmulatedPLIN(PLIN):
+    '''
+    PLIN device backed by a PLINEmulator instead of /dev/plinX.
+    '''
+
+    def __init__(self, emulator: Optional[PLINEmulator] = None, interface: str = "emulator"):
+        super().__init__(interface)
+        self.emulator = emulator if emulator is not None else PLINEmulator()
+
+    def _open(self) -> int:
+        return self.emulator.open()
+
+    def _device_ioctl(self, *args, **kwargs):
+        return self.emulator.ioctl(*args, **kwargs)
+
+    def stop(self):
+        '''
+        Disconnects from the emulated device and stops its bus.
+        '''
+        self.emulator.close()
+        super().stop()
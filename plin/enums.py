@@ -140,3 +140,20 @@ class PLINScheduleIndex(IntEnum):
     '''
     MIN = 0
     MAX = 7
+
+
+class PLINOverflowPolicy(IntEnum):
+    '''
+    Behaviour of a receive buffer that is full.
+    '''
+    DROP_OLDEST = 0                     # overwrite the oldest buffered message
+    BLOCK = 1                           # stop reading until space is free
+
+
+class PLINLossSource(IntEnum):
+    '''
+    Origin of a loss of received messages.
+    '''
+    DEVICE_OVERRUN = 0                  # OVERRUN message from the device
+    USB_OVERRUN = 1                     # usb_rx_ovr counter of the device status incremented
+    RING_OVERFLOW = 2                   # receive ring overwritten before dispatch
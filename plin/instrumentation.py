@@ -0,0 +1,131 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Latency histograms have one bucket per power of two nanoseconds: bucket n counts durations in [2**(n-1), 2**n).
+IOCTL_HISTOGRAM_BUCKETS = 40
+
+
+class IoctlSpan(NamedTuple):
+    '''
+    One completed ioctl, as passed to the on_ioctl callback of PLINInstrumentation.
+    '''
+    request: int
+    name: str
+    start_ns: int
+    duration_ns: int
+    errno: int
+
+
+class IoctlStats:
+    '''
+    Call count, errno outcomes and latency histogram of one ioctl code.
+    '''
+    __slots__ = ("name", "calls", "errors", "total_ns", "max_ns", "histogram", "errnos")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.histogram = [0] * IOCTL_HISTOGRAM_BUCKETS
+        self.errnos: Dict[int, int] = {}
+
+    def _record(self, duration_ns: int, errno: int):
+        self.calls += 1
+        self.total_ns += duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+        self.histogram[min(duration_ns.bit_length(), IOCTL_HISTOGRAM_BUCKETS - 1)] += 1
+        if errno:
+            self.errors += 1
+            self.errnos[errno] = self.errnos.get(errno, 0) + 1
+
+    def percentile(self, fraction: float) -> int:
+        '''
+        Returns an upper bound of the latency percentile in nanoseconds, from the histogram.
+        '''
+        rank = fraction * self.calls
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if count and seen >= rank:
+                return min(1 << bucket, self.max_ns)
+        return self.max_ns
+
+    def _asdict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_us": self.total_ns / 1000,
+            "mean_us": self.total_ns / self.calls / 1000 if self.calls else 0.0,
+            "p50_us": self.percentile(0.50) / 1000,
+            "p99_us": self.percentile(0.99) / 1000,
+            "max_us": self.max_ns / 1000,
+            "errnos": dict(self.errnos),
+        }
+
+
+class PLINInstrumentation:
+    '''
+    Collects per-ioctl statistics of PLIN devices.
+
+    Assign an instance to PLIN.instrumentation to record every ioctl issued by the device; several devices may share one
+    instance. When set, on_ioctl is called with an IoctlSpan after every ioctl, e.g. to export tracing spans.
+    With PLIN.instrumentation left as None, ioctls are not timed at all.
+    '''
+
+    def __init__(self, on_ioctl: Optional[Callable[[IoctlSpan], None]] = None):
+        self.on_ioctl = on_ioctl
+        self._stats: Dict[int, IoctlStats] = {}
+        self._lock = threading.Lock()
+
+    def call(self, name: str, function: Callable[..., Any], request: int, *args) -> Any:
+        '''
+        Calls function(request, *args), recording its duration and errno under the ioctl code request.
+        '''
+        error = 0
+        start = time.perf_counter_ns()
+        try:
+            return function(request, *args)
+        except OSError as e:
+            error = e.errno or 0
+            raise
+        finally:
+            duration = time.perf_counter_ns() - start
+            self.record(request, name, duration, error)
+            if self.on_ioctl is not None:
+                self.on_ioctl(IoctlSpan(request, name, start, duration, error))
+
+    def record(self, request: int, name: str, duration_ns: int, errno: int = 0):
+        '''
+        Records one ioctl with the specified duration and errno (0 on success).
+        '''
+        with self._lock:
+            stats = self._stats.get(request)
+            if stats is None:
+                stats = self._stats[request] = IoctlStats(name)
+            stats._record(duration_ns, errno)
+
+    def stats(self) -> List[IoctlStats]:
+        '''
+        Returns the statistics of every ioctl code seen, the codes taking the most time in total first.
+        '''
+        with self._lock:
+            return sorted(self._stats.values(), key=lambda stats: stats.total_ns, reverse=True)
+
+    def snapshot(self) -> Dict[str, dict]:
+        '''
+        Returns the statistics by ioctl name, the codes taking the most time in total first.
+        '''
+        with self._lock:
+            ordered = sorted(self._stats.values(), key=lambda stats: stats.total_ns, reverse=True)
+            return {stats.name: stats._asdict() for stats in ordered}
+
+    def reset(self):
+        '''
+        Clears all statistics.
+        '''
+        with self._lock:
+            self._stats = {}
@@ -0,0 +1,14 @@
+# break (13) + delimiter (1) + sync (10) + protected ID (10) bits.
+LIN_HEADER_BITS = 34
+# Bits per response byte, including start and stop bits.
+LIN_BYTE_BITS = 10
+
+
+def frame_time_us(length: int, baudrate: int) -> float:
+    '''
+    Nominal time in microseconds to transmit a LIN frame with length data bytes (plus checksum) at baudrate.
+
+    A length of 0 is a header without response.
+    '''
+    bits = LIN_HEADER_BITS + (LIN_BYTE_BITS * (length + 1) if length else 0)
+    return bits * 1000000 / baudrate
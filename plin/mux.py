@@ -0,0 +1,199 @@
+import heapq
+import itertools
+import select
+import time
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from plin.capture import CaptureReader
+from plin.clock import ClockSync
+from plin.device import PLIN
+from plin.structs import *
+
+
+class MuxFrame(NamedTuple):
+    '''
+    A frame of a PLINMultiplexer, with its host time in nanoseconds and the source it was read from (the interface of a
+    PLIN or the path of a capture).
+    '''
+    host_ns: int
+    source: str
+    frame: PLINFrame
+
+
+class _Source:
+    __slots__ = ("name", "plin", "capture", "sync", "position", "pending", "anchor")
+
+    def __init__(self, name: str, plin: Optional[PLIN] = None, capture: Optional[CaptureReader] = None,
+                 sync: Optional[ClockSync] = None):
+        self.name = name
+        self.plin = plin
+        self.capture = capture
+        self.sync = sync
+        # Next capture record to load and number of frames of the source in the heap.
+        self.position = 0
+        self.pending = 0
+        # Next capture anchor to add to sync.
+        self.anchor = 0
+
+    @property
+    def exhausted(self) -> bool:
+        return self.capture is not None and self.position >= self.capture.count
+
+
+class PLINMultiplexer:
+    '''
+    Merges the frames of several sources, started PLIN devices and captures, into one stream ordered by host time.
+
+    The devices are read through a single epoll loop. Their timestamps are mapped to the host clock by a ClockSync
+    each, and so are the timestamps of a capture, fed with the host wall times it recorded (CaptureReader.anchors) as
+    its records are loaded, which follows the drift of its device clock and restarts at its resets. clock is therefore
+    time.time_ns by default to align both. Captures without anchors past the first record are mapped at the nominal
+    rate of the device clock.
+    Frames wait in a heap for a k-way merge: a device frame is emitted once latency_ms elapsed since its host time, so
+    frames read later from a slower device can still be placed before it, and captures are loaded chunk_frames records
+    at a time, keeping memory bounded whatever their length. A device frame arriving more than latency_ms late is
+    emitted immediately, out of order, and counted in late.
+    Without devices, iterating the multiplexer merges the captures to the end.
+    '''
+
+    def __init__(self,
+                 sources: Sequence[Union[PLIN, CaptureReader]],
+                 latency_ms: int = 50,
+                 max_frames: int = 256,
+                 chunk_frames: int = 4096,
+                 clock: Callable[[], int] = time.time_ns):
+        self.latency_ms = latency_ms
+        self.max_frames = max_frames
+        self.chunk_frames = chunk_frames
+        self.clock = clock
+        self.late = 0
+        self._epoll = select.epoll()
+        self._sources: List[_Source] = []
+        # Index of the source of every device file descriptor.
+        self._devices: Dict[int, int] = {}
+        self._heap: List[Tuple[int, int, int, PLINFrame]] = []
+        self._sequence = itertools.count()
+        self._last_ns = None
+        for source in sources:
+            if isinstance(source, CaptureReader):
+                self._sources.append(_Source(source.path, capture=source, sync=ClockSync(clock=clock)))
+            else:
+                self._sources.append(_Source(source.interface, plin=source, sync=ClockSync(clock=clock)))
+                self._devices[source.fd] = len(self._sources) - 1
+                self._epoll.register(source.fd, select.EPOLLIN)
+        for index, source in enumerate(self._sources):
+            if source.capture is not None:
+                self._load(index, source)
+
+    def __enter__(self) -> "PLINMultiplexer":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __iter__(self) -> Iterator[MuxFrame]:
+        '''
+        Yields the merged frames, until the captures are exhausted if there are no devices, indefinitely otherwise.
+        '''
+        while not self.exhausted:
+            yield from self._merge(self._wait(None))
+
+    @property
+    def exhausted(self) -> bool:
+        '''
+        Whether every source is a capture read to the end and every frame was emitted.
+        '''
+        return not self._devices and not self._heap
+
+    def poll(self, timeout_ms: Optional[int] = 0) -> List[MuxFrame]:
+        '''
+        Reads the devices with data, waiting up to timeout_ms (None blocks until a frame can be emitted), and returns
+        the frames that can be emitted in order.
+        '''
+        return list(self._merge(self._wait(timeout_ms)))
+
+    def flush(self) -> List[MuxFrame]:
+        '''
+        Returns every frame waiting in the heap regardless of latency_ms, e.g. once the devices are stopped, including
+        the rest of the captures.
+        '''
+        return list(self._merge(None))
+
+    def close(self):
+        '''
+        Closes the epoll instance. The sources are left open.
+        '''
+        self._epoll.close()
+
+    def _load(self, index: int, source: _Source):
+        capture = source.capture
+        stop = min(capture.count, source.position + self.chunk_frames)
+        records = capture.records(source.position, stop)
+        anchors = capture.anchors
+        for record, frame in enumerate(PLINFrame.iter_buffer(records), source.position):
+            # Every anchor up to the record, including the one of a reset at the record itself, and the first anchor of
+            # the capture for the records before it.
+            while source.anchor < len(anchors) and \
+                    (anchors[source.anchor].index <= record or not source.sync.synchronized):
+                anchor = anchors[source.anchor]
+                source.sync.update(anchor.ts_us, anchor.wall_ns)
+                source.anchor += 1
+            heapq.heappush(self._heap, (source.sync.to_host(frame.ts_us), next(self._sequence), index, frame))
+        records.release()
+        source.pending += stop - source.position
+        source.position = stop
+
+    def _read(self, index: int, source: _Source):
+        batch = source.plin.read_many(self.max_frames, timeout_ms=0)
+        if not batch:
+            return
+        source.sync.update_batch(batch, self.clock())
+        for frame in PLINFrame.iter_buffer(bytes(batch)):
+            heapq.heappush(self._heap, (source.sync.to_host(frame.ts_us), next(self._sequence), index, frame))
+            source.pending += 1
+
+    def _wait(self, timeout_ms: Optional[int]) -> Optional[int]:
+        '''
+        Reads the devices, returning the newest host time a frame may have to be emitted, None without devices.
+        '''
+        if not self._devices:
+            return None
+        latency_ns = self.latency_ms * 1000000
+        deadline = None if timeout_ms is None else time.monotonic() + timeout_ms / 1000
+        while True:
+            now = self.clock()
+            if self._heap and self._heap[0][0] <= now - latency_ns:
+                wait = 0.0
+            else:
+                # Until the oldest frame is due, within the timeout.
+                wait = (self._heap[0][0] + latency_ns - now) / 1e9 if self._heap else -1
+                if deadline is not None:
+                    remaining = max(0.0, deadline - time.monotonic())
+                    wait = remaining if wait < 0 else min(wait, remaining)
+            for fd, _ in self._epoll.poll(wait):
+                index = self._devices[fd]
+                self._read(index, self._sources[index])
+            now = self.clock()
+            if wait == 0 or (self._heap and self._heap[0][0] <= now - latency_ns) or \
+                    (deadline is not None and time.monotonic() >= deadline):
+                return now - latency_ns
+
+    def _merge(self, watermark: Optional[int]) -> Iterator[MuxFrame]:
+        '''
+        Pops the frames up to watermark, all of them if None.
+        '''
+        while self._heap:
+            host_ns, _, index, frame = self._heap[0]
+            source = self._sources[index]
+            if watermark is not None and host_ns > watermark:
+                return
+            heapq.heappop(self._heap)
+            source.pending -= 1
+            # A capture always has a frame in the heap until it is exhausted, so the next one is never smaller.
+            if source.capture is not None and not source.pending and not source.exhausted:
+                self._load(index, source)
+            if self._last_ns is not None and host_ns < self._last_ns:
+                self.late += 1
+            else:
+                self._last_ns = host_ns
+            yield MuxFrame(host_ns, source.name, frame)
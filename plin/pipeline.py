@@ -0,0 +1,291 @@
+import multiprocessing
+import struct
+import time
+import traceback
+from multiprocessing import shared_memory
+from typing import Any, Callable, List, NamedTuple, Optional
+
+from plin.device import PLIN, PLINException
+from plin.structs import *
+
+PLIN_PIPELINE_MAGIC = b'PLINRING'
+
+# magic, slot count, records per slot, batches written, records written.
+RING_HEADER = struct.Struct('<8sIIQQ')
+# version (odd while the slot is written), sequence number of the first record, record count.
+RING_SLOT_HEADER = struct.Struct('<QQI4x')
+_VERSION = struct.Struct('<Q')
+_COUNTERS = struct.Struct('<QQ')
+_COUNTERS_OFFSET = 16
+
+
+class PipelineBatch(NamedTuple):
+    '''
+    A batch of raw PLINMessage records taken from a SharedFrameRing.
+
+    sequence numbers the batches written to the ring and first_record the records, both from 0. missed is the number of
+    batches meant for the same consumer that were overwritten before it could read them.
+    '''
+    sequence: int
+    first_record: int
+    count: int
+    data: bytes
+    missed: int = 0
+
+
+class SharedFrameRing:
+    '''
+    Ring of batches of raw PLINMessage records in shared memory, written by one process and read by any number of
+    processes without pickling.
+
+    Every slot holds one batch and a version that is odd while the slot is written and 2 * (sequence + 1) once batch
+    sequence is complete, so a reader detects a batch overwritten while it was being copied. The header publishes the
+    number of batches and records written.
+    '''
+
+    def __init__(self, name: Optional[str] = None, slots: int = 1024, slot_frames: int = 64, create: bool = True):
+        if create:
+            if slots < 1 or slot_frames < 1:
+                raise ValueError("slots and slot_frames must be at least 1.")
+            size = RING_HEADER.size + slots * (RING_SLOT_HEADER.size + slot_frames * PLINMessage.buffer_length)
+            self._shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            RING_HEADER.pack_into(self._shm.buf, 0, PLIN_PIPELINE_MAGIC, slots, slot_frames, 0, 0)
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            magic, slots, slot_frames, _, _ = RING_HEADER.unpack_from(self._shm.buf)
+            if magic != PLIN_PIPELINE_MAGIC:
+                raise ValueError(f"{name} is not a PLIN frame ring.")
+        self.name = self._shm.name
+        self.slots = slots
+        self.slot_frames = slot_frames
+        self._slot_size = RING_SLOT_HEADER.size + slot_frames * PLINMessage.buffer_length
+        self._next, self._records = self.counters()
+
+    @classmethod
+    def attach(cls, name: str) -> "SharedFrameRing":
+        '''
+        Opens a ring created by another process.
+        '''
+        return cls(name, create=False)
+
+    def counters(self):
+        '''
+        Returns the number of batches and of records written so far.
+        '''
+        return _COUNTERS.unpack_from(self._shm.buf, _COUNTERS_OFFSET)
+
+    @property
+    def head(self) -> int:
+        '''
+        Number of batches written so far, i.e. the sequence number of the next batch.
+        '''
+        return _VERSION.unpack_from(self._shm.buf, _COUNTERS_OFFSET)[0]
+
+    def _offset(self, sequence: int) -> int:
+        return RING_HEADER.size + (sequence % self.slots) * self._slot_size
+
+    def write(self, messages: Any) -> int:
+        '''
+        Writes a batch of raw records, e.g. a batch returned by PLIN.read_many(), returning its sequence number.
+
+        Batches larger than a slot are split over several slots.
+        '''
+        data = memoryview(messages).cast('B')
+        length = PLINMessage.buffer_length
+        count = len(data) // length
+        sequence = self._next
+        for start in range(0, count, self.slot_frames):
+            chunk = data[start * length:min(count, start + self.slot_frames) * length]
+            self._write_slot(chunk)
+        return sequence
+
+    def _write_slot(self, chunk: memoryview):
+        buf = self._shm.buf
+        sequence = self._next
+        offset = self._offset(sequence)
+        count = len(chunk) // PLINMessage.buffer_length
+        _VERSION.pack_into(buf, offset, 2 * sequence + 1)
+        start = offset + RING_SLOT_HEADER.size
+        buf[start:start + len(chunk)] = chunk
+        RING_SLOT_HEADER.pack_into(buf, offset, 2 * sequence + 1, self._records, count)
+        _VERSION.pack_into(buf, offset, 2 * sequence + 2)
+        self._next = sequence + 1
+        self._records += count
+        _COUNTERS.pack_into(buf, _COUNTERS_OFFSET, self._next, self._records)
+
+    def read(self, sequence: int) -> Optional[PipelineBatch]:
+        '''
+        Returns a copy of the batch with the specified sequence number, or None if it is not in the ring (not written
+        yet or overwritten).
+        '''
+        buf = self._shm.buf
+        offset = self._offset(sequence)
+        version, first_record, count = RING_SLOT_HEADER.unpack_from(buf, offset)
+        if version != 2 * sequence + 2:
+            return None
+        start = offset + RING_SLOT_HEADER.size
+        data = bytes(buf[start:start + count * PLINMessage.buffer_length])
+        # Checked after copying, as the writer may reuse the slot meanwhile.
+        if _VERSION.unpack_from(buf, offset)[0] != version:
+            return None
+        return PipelineBatch(sequence, first_record, count, data)
+
+    def close(self):
+        '''
+        Detaches from the ring.
+        '''
+        self._shm.close()
+
+    def unlink(self):
+        '''
+        Destroys the ring, once every process has closed it.
+        '''
+        self._shm.unlink()
+
+
+def _report(errors: Any, stop: Any):
+    '''
+    Sends the exception being handled to the parent process and stops the reader.
+    '''
+    errors.put((multiprocessing.current_process().name, traceback.format_exc()))
+    stop.set()
+
+
+def _reader_main(open_device: Callable[[], PLIN], name: str, stop: Any, errors: Any, poll_ms: int):
+    ring = SharedFrameRing.attach(name)
+    try:
+        plin = open_device()
+        try:
+            while not stop.is_set():
+                batch = plin.read_many(ring.slot_frames, timeout_ms=poll_ms)
+                if batch:
+                    ring.write(batch)
+        finally:
+            plin.stop()
+    except Exception:
+        _report(errors, stop)
+    finally:
+        ring.close()
+
+
+def _worker_main(handler: Callable[[PipelineBatch], None], name: str, index: int, workers: int, done: Any,
+                 stop: Any, errors: Any, poll_ms: int):
+    ring = SharedFrameRing.attach(name)
+    sequence = index
+    missed = 0
+    try:
+        while True:
+            head = ring.head
+            if sequence >= head:
+                if done.is_set() and sequence >= ring.head:
+                    return
+                time.sleep(poll_ms / 1000)
+                continue
+            batch = ring.read(sequence)
+            if batch is None:
+                # Overwritten: continue with the oldest batch of this worker still in the ring.
+                oldest = max(sequence + workers, ring.head - ring.slots + 1)
+                skip = (oldest - sequence + workers - 1) // workers
+                missed += skip
+                sequence += skip * workers
+                continue
+            handler(batch._replace(missed=missed))
+            missed = 0
+            sequence += workers
+    except Exception:
+        _report(errors, stop)
+    finally:
+        ring.close()
+
+
+class FramePipeline:
+    '''
+    Reads a PLIN device in one process and processes the frames in a pool of worker processes.
+
+    The reader process calls open_device() to get a started PLIN (a picklable callable, e.g. a module-level function
+    or functools.partial) and writes every batch read from it to a SharedFrameRing. Worker i of n calls
+    handler(PipelineBatch) for the batches whose sequence number modulo n is i, e.g. to decode them with
+    PLINFrame.iter_buffer() or plin.arrays.from_buffer() and persist them; batches are never pickled.
+    Workers that fall more than a ring behind skip the overwritten batches and report them in PipelineBatch.missed.
+
+    An exception raised by open_device(), the device or a handler is sent back to this process and stops the reader, so
+    no more batches are written for a worker that is gone; failed tells whether it happened and stop() raises it as a
+    PLINException, as it does for a process that died without reporting an error.
+    '''
+
+    def __init__(self,
+                 open_device: Callable[[], PLIN],
+                 handler: Callable[[PipelineBatch], None],
+                 workers: int = 2,
+                 slots: int = 1024,
+                 slot_frames: int = 64,
+                 poll_ms: int = 10,
+                 context: Optional[Any] = None):
+        if workers < 1:
+            raise ValueError(f"workers {workers} must be at least 1.")
+        self.open_device = open_device
+        self.handler = handler
+        self.workers = workers
+        self.slots = slots
+        self.slot_frames = slot_frames
+        self.poll_ms = poll_ms
+        self._context = context or multiprocessing.get_context()
+        self.ring: Optional[SharedFrameRing] = None
+        self._processes: List[Any] = []
+        self._errors = None
+
+    @property
+    def failed(self) -> bool:
+        '''
+        Whether the reader or a worker failed.
+        '''
+        return self._errors is not None and not self._errors.empty() or \
+            any(process.exitcode not in (None, 0) for process in self._processes)
+
+    def start(self):
+        '''
+        Creates the ring and starts the reader and worker processes.
+        '''
+        self.ring = SharedFrameRing(slots=self.slots, slot_frames=self.slot_frames)
+        self._stop = self._context.Event()
+        self._done = self._context.Event()
+        self._errors = self._context.SimpleQueue()
+        self._processes = [self._context.Process(target=_reader_main, name="plin-pipeline-reader", daemon=True,
+                                                 args=(self.open_device, self.ring.name, self._stop, self._errors,
+                                                       self.poll_ms))]
+        self._processes += [self._context.Process(target=_worker_main, name=f"plin-pipeline-worker-{index}",
+                                                  daemon=True,
+                                                  args=(self.handler, self.ring.name, index, self.workers, self._done,
+                                                        self._stop, self._errors, self.poll_ms))
+                            for index in range(self.workers)]
+        for process in self._processes:
+            process.start()
+
+    def stop(self):
+        '''
+        Stops the reader, lets the workers process the batches left in the ring, then destroys the ring.
+
+        Raises a PLINException if the reader or a worker failed.
+        '''
+        if not self._processes:
+            raise PLINException("Pipeline not started!")
+        self._stop.set()
+        self._processes[0].join()
+        self._done.set()
+        for process in self._processes[1:]:
+            process.join()
+        failures = []
+        while not self._errors.empty():
+            name, error = self._errors.get()
+            failures.append(f"{name} failed:\n{error}")
+        # A process reporting its error exits normally, any other exit code is a crash.
+        failures += [f"{process.name} exited with code {process.exitcode}." for process in self._processes
+                     if process.exitcode != 0]
+        self._processes = []
+        self._errors.close()
+        self._errors = None
+        self.ring.close()
+        self.ring.unlink()
+        self.ring = None
+        if failures:
+            raise PLINException("\n".join(failures))
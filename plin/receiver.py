@@ -0,0 +1,388 @@
+import collections
+import errno
+import struct
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from plin.device import PLIN, PLIOGETSTATUS, PLINException, PLINIoctlError
+from plin.enums import *
+from plin.structs import *
+
+PLINCallback = Callable[[PLINMessage], None]
+
+# type, id and ts_us of a PLINMessage record.
+_RECORD_KEY = struct.Struct('=H2xB3xQ')
+
+
+class LossWindow(NamedTuple):
+    '''
+    Messages lost between two received messages, as device timestamps.
+
+    start_us is the timestamp of the last message received before the loss and end_us of the first message received
+    after it, either None if unknown. count is the number of messages lost, the number of overruns for
+    PLINLossSource.USB_OVERRUN, or None if unknown.
+    '''
+    source: PLINLossSource
+    start_us: Optional[int]
+    end_us: Optional[int]
+    count: Optional[int]
+
+
+LossCallback = Callable[[LossWindow], None]
+
+
+class PLINReceiver:
+    '''
+    Background receiver for a started PLIN device.
+
+    A reader thread drains the device into a preallocated ring of raw messages and a dispatch thread hands every message
+    to the callbacks registered for its frame ID or message type. The reader only advances the head of the ring and the
+    dispatcher only advances the tail, so neither takes a lock. With PLINOverflowPolicy.DROP_OLDEST the reader
+    overwrites unread messages when the ring is full and the dispatcher counts them in dropped; with
+    PLINOverflowPolicy.BLOCK the reader stops draining the device until space is free.
+
+    Losses are reported to the callbacks registered with subscribe_loss() as LossWindows: OVERRUN messages, increments
+    of the usb_rx_ovr counter of the device (sampled every status_interval_ms milliseconds, never per frame; sampling
+    is disabled if the device does not support PLIOGETSTATUS, and retried at the next interval after any other error,
+    counted in status_errors) and ring overflows. A loss, a ring more than half full or a read returning a full batch
+    puts the receiver under pressure for pressure_hold_ms milliseconds: the reader then reads batches of pressure_frames
+    messages, and callbacks subscribed as optional are skipped along with decoding the messages nobody else subscribed
+    to.
+
+    With sync_id_filter, the hardware ID filter follows the subscriptions: it allows the union of the subscribed IDs,
+    or all IDs while a callback is subscribed to PLINMessageType.FRAME, so frames nobody subscribed to are dropped by
+    the device instead of being transferred and discarded. Every change of the subscriptions issues at most one
+    PLIOSETIDFILTER, none if the union did not change; use subscribe_ids() to subscribe to several IDs at once.
+    The filter is first applied at the first subscription or at start(), never at construction, so a receiver created
+    before its subscriptions does not block every ID meanwhile. From then on the receiver owns the filter: changes made
+    directly on the device (set_id_filter(), block_id(), ...) are overwritten at the next change of the subscriptions.
+    '''
+
+    def __init__(self,
+                 plin: PLIN,
+                 capacity: int = 4096,
+                 overflow: PLINOverflowPolicy = PLINOverflowPolicy.DROP_OLDEST,
+                 max_frames: int = 64,
+                 poll_ms: int = 100,
+                 pressure_frames: int = 1024,
+                 pressure_hold_ms: int = 1000,
+                 status_interval_ms: Optional[int] = 1000,
+                 sync_id_filter: bool = False):
+        if capacity < 1:
+            raise ValueError(f"capacity {capacity} must be at least 1.")
+        self.plin = plin
+        self.capacity = capacity
+        self.overflow = overflow
+        self.max_frames = max_frames
+        self.poll_ms = poll_ms
+        self.pressure_frames = pressure_frames
+        self.pressure_hold_ms = pressure_hold_ms
+        self.status_interval_ms = status_interval_ms
+        self.sync_id_filter = sync_id_filter
+        self.received = 0
+        self.dropped = 0
+        self.pressure = False
+        # Status samples that failed and were retried at the next interval.
+        self.status_errors = 0
+        # Exception that stopped the reader thread, e.g. PLINException once the device is unplugged.
+        self.error: Optional[Exception] = None
+
+        self._ring = bytearray(capacity * PLINMessage.buffer_length)
+        self._head = 0
+        self._reserved = 0
+        self._tail = 0
+        self._data = threading.Event()
+        self._space = threading.Event()
+        self._running = False
+        self._threads = []
+        self._pressure_until = 0.0
+
+        # Loss detection: usb_rx_ovr as last sampled, the timestamps of the last messages read and dispatched, losses
+        # found by the reader and the loss waiting for the next dispatched message to close its window.
+        self._status = PLINUSBGetStatus()
+        self._usb_rx_ovr = None
+        self._sampled_us = None
+        self._read_us = None
+        self._dispatched_us = None
+        self._losses = collections.deque()
+        self._open_loss = None
+
+        # Callback tables are replaced rather than mutated, so the dispatch thread never sees a partial update.
+        # Subscriptions are kept as (id or type, callback, optional) and compiled into a table of all callbacks and
+        # a table without the optional ones, each a (callbacks by ID, callbacks by type) pair.
+        self._id_subscriptions: List[Tuple[int, PLINCallback, bool]] = []
+        self._type_subscriptions: List[Tuple[int, PLINCallback, bool]] = []
+        self._loss_callbacks: Tuple[LossCallback, ...] = ()
+        self._compile(sync=False)
+
+    @property
+    def id_mask(self) -> int:
+        '''
+        Bitset of the frame IDs with callbacks (bit n set for ID n), all IDs with a callback for PLINMessageType.FRAME.
+        '''
+        return self._id_mask
+
+    def _compile(self, sync: bool = True):
+        id_mask = 0
+        for id, _, _ in self._id_subscriptions:
+            id_mask |= 1 << id
+        if any(type == PLINMessageType.FRAME for type, _, _ in self._type_subscriptions):
+            id_mask = (1 << PLIN_USB_RSP_REMAP_ID_LEN) - 1
+        if self.sync_id_filter and sync:
+            self.plin._apply_id_filter(id_mask)
+        self._id_mask = id_mask
+
+        tables = []
+        for required in (False, True):
+            id_callbacks = [()] * PLIN_USB_RSP_REMAP_ID_LEN
+            type_callbacks: Dict[int, Tuple[PLINCallback, ...]] = {}
+            for id, callback, optional in self._id_subscriptions:
+                if not (required and optional):
+                    id_callbacks[id] += (callback,)
+            for type, callback, optional in self._type_subscriptions:
+                if not (required and optional):
+                    type_callbacks[type] = type_callbacks.get(type, ()) + (callback,)
+            tables.append((tuple(id_callbacks), type_callbacks))
+        self._callbacks, self._required_callbacks = tables
+
+    def subscribe_id(self, id: int, callback: PLINCallback, optional: bool = False):
+        '''
+        Registers a callback for frames with the specified ID. Optional callbacks are skipped under pressure.
+        '''
+        self.subscribe_ids((id,), callback, optional)
+
+    def subscribe_ids(self, ids: Iterable[int], callback: PLINCallback, optional: bool = False):
+        '''
+        Registers a callback for frames with any of the specified IDs, updating the ID filter once.
+        '''
+        ids = list(ids)
+        for id in ids:
+            if id > PLINFrameID.MAX or id < PLINFrameID.MIN:
+                raise ValueError(
+                    f"ID {id} out of range [{PLINFrameID.MIN}..{PLINFrameID.MAX}].")
+        self._id_subscriptions = self._id_subscriptions + [(id, callback, optional) for id in ids]
+        self._compile()
+
+    def unsubscribe_id(self, id: int, callback: PLINCallback):
+        '''
+        Removes a callback registered for frames with the specified ID.
+        '''
+        self.unsubscribe_ids((id,), callback)
+
+    def unsubscribe_ids(self, ids: Iterable[int], callback: PLINCallback):
+        '''
+        Removes a callback registered for frames with any of the specified IDs, updating the ID filter once.
+        '''
+        ids = set(ids)
+        self._id_subscriptions = [s for s in self._id_subscriptions if s[0] not in ids or s[1] != callback]
+        self._compile()
+
+    def subscribe_type(self, type: PLINMessageType, callback: PLINCallback, optional: bool = False):
+        '''
+        Registers a callback for messages of the specified type. Optional callbacks are skipped under pressure.
+        '''
+        self._type_subscriptions = self._type_subscriptions + [(type, callback, optional)]
+        self._compile()
+
+    def unsubscribe_type(self, type: PLINMessageType, callback: PLINCallback):
+        '''
+        Removes a callback registered for messages of the specified type.
+        '''
+        self._type_subscriptions = [s for s in self._type_subscriptions if s[:2] != (type, callback)]
+        self._compile()
+
+    def subscribe_loss(self, callback: LossCallback):
+        '''
+        Registers a callback for the LossWindows found, called from the dispatch thread.
+        '''
+        self._loss_callbacks += (callback,)
+
+    def unsubscribe_loss(self, callback: LossCallback):
+        '''
+        Removes a callback registered for LossWindows.
+        '''
+        self._loss_callbacks = tuple(c for c in self._loss_callbacks if c != callback)
+
+    @property
+    def pending(self) -> int:
+        '''
+        Number of messages buffered but not dispatched yet.
+        '''
+        return min(self._head - self._tail, self.capacity)
+
+    def start(self):
+        '''
+        Starts the reader and dispatch threads.
+        '''
+        if self._running:
+            raise PLINException("Receiver already started!")
+        if self.sync_id_filter:
+            self.plin._apply_id_filter(self._id_mask)
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._read_loop, name=f"{self.plin.interface}-reader", daemon=True),
+            threading.Thread(target=self._dispatch_loop, name=f"{self.plin.interface}-dispatch", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        '''
+        Stops the reader and dispatch threads. Messages still buffered are dispatched before returning.
+        '''
+        if not self._running:
+            raise PLINException("Receiver not started!")
+        self._running = False
+        self._data.set()
+        self._space.set()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._dispatch_pending()
+        if self._open_loss is not None:
+            self._emit_loss(LossWindow(*self._open_loss[:2], None, self._open_loss[2]))
+            self._open_loss = None
+
+    def _signal_pressure(self):
+        self._pressure_until = time.monotonic() + self.pressure_hold_ms / 1000
+        self.pressure = True
+
+    def _sample_status(self):
+        '''
+        Reads usb_rx_ovr, queueing a LossWindow if it was incremented since the last sample.
+        '''
+        try:
+            self.plin._ioctl(PLIOGETSTATUS, self._status)
+        except PLINIoctlError as e:
+            if e.errno in (errno.ENOTTY, errno.EINVAL):
+                # Not a PLIN device, e.g. a pipe: only OVERRUN messages and ring overflows are detected.
+                self.status_interval_ms = None
+            else:
+                # Transient, e.g. EBUSY: sampled again at the next interval.
+                self.status_errors += 1
+                traceback.print_exc()
+            return
+        overruns = self._status.usb_rx_ovr
+        if self._usb_rx_ovr is not None and overruns != self._usb_rx_ovr:
+            self._losses.append(LossWindow(PLINLossSource.USB_OVERRUN, self._sampled_us, self._read_us,
+                                           (overruns - self._usb_rx_ovr) & 0xffff))
+            self._signal_pressure()
+            self._data.set()
+        self._usb_rx_ovr = overruns
+        self._sampled_us = self._read_us
+
+    def _read_loop(self):
+        length = PLINMessage.buffer_length
+        ring = memoryview(self._ring)
+        next_sample = 0.0
+        while self._running:
+            now = time.monotonic()
+            if self.status_interval_ms is not None and now >= next_sample:
+                self._sample_status()
+                next_sample = now + (self.status_interval_ms or 0) / 1000
+            if self.pressure and now >= self._pressure_until:
+                self.pressure = False
+
+            count = min(self.pressure_frames if self.pressure else self.max_frames, self.capacity)
+            if self.overflow == PLINOverflowPolicy.BLOCK:
+                count = min(count, self.capacity - (self._head - self._tail))
+                if count == 0:
+                    self._signal_pressure()
+                    self._space.wait(self.poll_ms / 1000)
+                    self._space.clear()
+                    continue
+
+            try:
+                batch = self.plin.read_many(count, timeout_ms=self.poll_ms)
+            except (PLINException, OSError) as e:
+                self.error = e
+                return
+            if not batch:
+                continue
+            self._read_us = batch[len(batch) - 1].ts_us
+            data = memoryview(batch).cast('B')
+            # Records up to _reserved may be overwritten from here on, records up to _head are complete.
+            self._reserved = self._head + len(batch)
+            start = (self._head % self.capacity) * length
+            first = min(len(data), len(ring) - start)
+            ring[start:start + first] = data[:first]
+            ring[:len(data) - first] = data[first:]
+            self._head += len(batch)
+            if len(batch) == count or self._head - self._tail > self.capacity // 2:
+                self._signal_pressure()
+            self._data.set()
+
+    def _dispatch_loop(self):
+        while self._running:
+            self._data.wait(self.poll_ms / 1000)
+            self._data.clear()
+            self._dispatch_pending()
+
+    def _dispatch_pending(self):
+        while self._losses:
+            self._emit_loss(self._losses.popleft())
+
+        length = PLINMessage.buffer_length
+        ring = self._ring
+        head = self._head
+        tail = self._tail
+        while tail < head:
+            offset = (tail % self.capacity) * length
+            type, id, ts_us = _RECORD_KEY.unpack_from(ring, offset)
+            id_callbacks, type_callbacks = self._required_callbacks if self.pressure else self._callbacks
+            callbacks = type_callbacks.get(type, ())
+            if type == PLINMessageType.FRAME:
+                callbacks += id_callbacks[id & PLINFrameID.MAX]
+            # Messages without callbacks are not decoded.
+            message = PLINMessage.from_buffer_copy(ring, offset) if callbacks else None
+            # Checked after reading, as the reader may overwrite the record meanwhile.
+            oldest = self._reserved - self.capacity
+            if tail < oldest:
+                self.dropped += oldest - tail
+                self._loss(PLINLossSource.RING_OVERFLOW, oldest - tail)
+                tail = oldest
+                continue
+            tail += 1
+            self._tail = tail
+            self._space.set()
+            self.received += 1
+
+            if type == PLINMessageType.OVERRUN:
+                self._loss(PLINLossSource.DEVICE_OVERRUN, None)
+            else:
+                if self._open_loss is not None:
+                    source, start_us, count = self._open_loss
+                    self._open_loss = None
+                    self._emit_loss(LossWindow(source, start_us, ts_us, count))
+                self._dispatched_us = ts_us
+            if message is not None:
+                self._dispatch(message, callbacks)
+        self._tail = tail
+
+    def _loss(self, source: PLINLossSource, count: Optional[int]):
+        '''
+        Opens a loss window after the last dispatched message, or extends the one already open.
+        '''
+        self._signal_pressure()
+        if self._open_loss is None:
+            self._open_loss = [source, self._dispatched_us, count]
+        elif count is None or self._open_loss[2] is None:
+            self._open_loss[2] = None
+        else:
+            self._open_loss[2] += count
+
+    def _emit_loss(self, loss: LossWindow):
+        for callback in self._loss_callbacks:
+            try:
+                callback(loss)
+            except Exception:
+                traceback.print_exc()
+
+    def _dispatch(self, message: PLINMessage, callbacks: Tuple[PLINCallback, ...]):
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception:
+                traceback.print_exc()
@@ -0,0 +1,155 @@
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+from plin.device import PLIN, PLINException
+from plin.enums import *
+from plin.structs import *
+
+_DIAGNOSTIC_IDS = {
+    PLINUSBSlotType.MASTER_REQ: PLINFrameID.DIAG_MASTER_REQ,
+    PLINUSBSlotType.SLAVE_RSP: PLINFrameID.DIAG_SLAVE_RSP,
+}
+
+
+class ScheduleSlot(NamedTuple):
+    '''
+    Declarative description of a schedule slot.
+    '''
+    type: PLINUSBSlotType
+    delay_ms: int
+    ids: Tuple[int, ...] = ()
+    count_resolve: int = 0
+
+    @classmethod
+    def unconditional(cls, delay_ms: int, id: int) -> "ScheduleSlot":
+        return cls(PLINUSBSlotType.UNCOND, delay_ms, (id,))
+
+    @classmethod
+    def event_triggered(cls, delay_ms: int, id: int, count_resolve: int) -> "ScheduleSlot":
+        return cls(PLINUSBSlotType.EVENT, delay_ms, (id,), count_resolve)
+
+    @classmethod
+    def sporadic(cls, delay_ms: int, ids: Sequence[int], count_resolve: int = 0) -> "ScheduleSlot":
+        return cls(PLINUSBSlotType.SPORADIC, delay_ms, tuple(ids), count_resolve)
+
+    @classmethod
+    def master_request(cls, delay_ms: int) -> "ScheduleSlot":
+        return cls(PLINUSBSlotType.MASTER_REQ, delay_ms)
+
+    @classmethod
+    def slave_response(cls, delay_ms: int) -> "ScheduleSlot":
+        return cls(PLINUSBSlotType.SLAVE_RSP, delay_ms)
+
+    @classmethod
+    def from_dict(cls, slot: Dict[str, Union[int, List[int]]]) -> "ScheduleSlot":
+        '''
+        Converts a slot returned by PLIN.get_schedule_slots().
+        '''
+        type = PLINUSBSlotType(slot["type"])
+        ids = tuple(slot["id"])
+        if type == PLINUSBSlotType.SPORADIC:
+            while len(ids) > PLINUSBSlotNumber.MIN and ids[-1] == 0:
+                ids = ids[:-1]
+        elif type in _DIAGNOSTIC_IDS:
+            ids = ()
+        else:
+            ids = ids[:1]
+        return cls(type, slot["delay"], ids, slot["count_resolve"])
+
+    def key(self) -> Tuple[int, int, Tuple[int, ...], int]:
+        '''
+        Returns the slot as the device stores it, for comparing declared slots with slots read from the device.
+        '''
+        ids = (_DIAGNOSTIC_IDS[self.type],) if self.type in _DIAGNOSTIC_IDS else tuple(self.ids)
+        return (int(self.type), self.delay_ms, ids + (0,) * (PLINUSBSlotNumber.MAX - len(ids)), self.count_resolve)
+
+
+class ScheduleTable:
+    '''
+    Declarative description of all schedules of a PLIN device.
+
+    apply() programs a device with the smallest set of schedule deletions and slot additions, given the slots it
+    currently holds. The device can only append slots or delete a whole schedule, so a schedule that is unchanged is
+    left alone, a schedule that only gained slots at its end is extended and any other schedule is rebuilt.
+    The handles of the programmed slots are kept in handles, for use with set_breakpoint().
+    '''
+
+    def __init__(self, schedules: Optional[Dict[int, Sequence[ScheduleSlot]]] = None):
+        self.schedules: List[List[ScheduleSlot]] = [[] for _ in range(PLINScheduleIndex.MAX + 1)]
+        self.handles: List[List[int]] = [[] for _ in range(PLINScheduleIndex.MAX + 1)]
+        for schedule, slots in (schedules or {}).items():
+            self[schedule] = slots
+
+    def __getitem__(self, schedule: int) -> List[ScheduleSlot]:
+        return self.schedules[schedule]
+
+    def __setitem__(self, schedule: int, slots: Sequence[ScheduleSlot]):
+        if schedule < PLINScheduleIndex.MIN or schedule > PLINScheduleIndex.MAX:
+            raise ValueError(
+                f"Schedule out of range [{PLINScheduleIndex.MIN}..{PLINScheduleIndex.MAX}].")
+        self.schedules[schedule] = list(slots)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, ScheduleTable):
+            return NotImplemented
+        return [[slot.key() for slot in slots] for slots in self.schedules] == \
+            [[slot.key() for slot in slots] for slots in other.schedules]
+
+    @classmethod
+    def from_device(cls, plin: PLIN) -> "ScheduleTable":
+        '''
+        Reads all schedules of a device, including the handles of their slots.
+        '''
+        table = cls()
+        for schedule in range(PLINScheduleIndex.MIN, PLINScheduleIndex.MAX + 1):
+            slots = plin.get_schedule_slots(schedule)
+            table.schedules[schedule] = [ScheduleSlot.from_dict(slot) for slot in slots]
+            table.handles[schedule] = [slot["handle"] for slot in slots]
+        return table
+
+    def diff(self, current: "ScheduleTable") -> List[Tuple[int, bool, List[ScheduleSlot]]]:
+        '''
+        Returns the operations turning current into this table, as (schedule, delete first, slots to add) tuples.
+        '''
+        operations = []
+        for schedule, slots in enumerate(self.schedules):
+            wanted = [slot.key() for slot in slots]
+            present = [slot.key() for slot in current.schedules[schedule]]
+            if wanted == present:
+                continue
+            if wanted[:len(present)] == present:
+                operations.append((schedule, False, slots[len(present):]))
+            else:
+                operations.append((schedule, True, slots))
+        return operations
+
+    def apply(self, plin: PLIN, current: Optional["ScheduleTable"] = None) -> int:
+        '''
+        Programs the schedules of a device, returning the number of slots added.
+
+        current is the table the device holds, e.g. the table applied last. If None, it is read from the device.
+        '''
+        if current is None:
+            current = ScheduleTable.from_device(plin)
+        self.handles = [list(handles) for handles in current.handles]
+
+        added = 0
+        for schedule, delete, slots in self.diff(current):
+            if delete:
+                err = plin.delete_schedule(schedule)
+                if err:
+                    raise PLINException(f"Deleting schedule {schedule} failed with error {err}.")
+                self.handles[schedule] = []
+            for slot in slots:
+                buffer = plin.add_schedule_slot(schedule=schedule, type=slot.type, delay_ms=slot.delay_ms,
+                                                ids=slot.ids, count_resolve=slot.count_resolve)
+                if buffer.err:
+                    raise PLINException(f"Adding slot to schedule {schedule} failed with error {buffer.err}.")
+                self.handles[schedule].append(buffer.handle)
+                added += 1
+        return added
+
+    def set_breakpoint(self, plin: PLIN, schedule: int, slot: int, enable: bool = True):
+        '''
+        Enables or disables a breakpoint on a slot of an applied schedule.
+        '''
+        plin.set_schedule_breakpoint(self.handles[schedule][slot], enable)
@@ -0,0 +1,181 @@
+import math
+from typing import Dict, Iterable, NamedTuple, Union
+
+from plin.enums import *
+from plin.lin import frame_time_us
+from plin.structs import *
+
+_ERROR_FLAGS = list(PLINFrameErrorFlag)
+_NO_RESPONSE = PLINFrameErrorFlag.SLV_NOT_RSP | PLINFrameErrorFlag.TIMEOUT
+
+
+class IDSnapshot(NamedTuple):
+    '''
+    Statistics of one frame ID.
+    '''
+    id: int
+    frames: int
+    rate_hz: float
+    interval_mean_us: float
+    interval_jitter_us: float
+    interval_max_us: int
+    errors: Dict[PLINFrameErrorFlag, int]
+    checksum_types: Dict[PLINFrameChecksumType, int]
+    bus_time_us: float
+
+
+class BusSnapshot(NamedTuple):
+    '''
+    Statistics of the whole bus; ids holds the statistics of every frame ID seen.
+    '''
+    frames: int
+    overruns: int
+    sleeps: int
+    wakeups: int
+    # Nominal bus time of the frames received after the first one, over the time elapsed since the first one.
+    bus_time_us: float
+    span_us: int
+    bus_load: float
+    ids: Dict[int, IDSnapshot]
+
+
+class _IDCounters:
+    __slots__ = ("frames", "last_us", "intervals", "interval_mean", "interval_m2", "interval_max", "errors",
+                 "checksum_types", "bus_time_us")
+
+    def __init__(self):
+        self.frames = 0
+        self.last_us = None
+        self.intervals = 0
+        self.interval_mean = 0.0
+        self.interval_m2 = 0.0
+        self.interval_max = 0
+        self.errors = [0] * len(_ERROR_FLAGS)
+        self.checksum_types = [0] * (max(PLINFrameChecksumType) + 1)
+        self.bus_time_us = 0.0
+
+    def _snapshot(self, id: int) -> IDSnapshot:
+        variance = self.interval_m2 / self.intervals if self.intervals else 0.0
+        return IDSnapshot(
+            id=id,
+            frames=self.frames,
+            rate_hz=1000000 / self.interval_mean if self.interval_mean else 0.0,
+            interval_mean_us=self.interval_mean,
+            interval_jitter_us=math.sqrt(variance),
+            interval_max_us=self.interval_max,
+            errors={flag: count for flag, count in zip(_ERROR_FLAGS, self.errors) if count},
+            checksum_types={PLINFrameChecksumType(type): count for type, count in enumerate(self.checksum_types) if count},
+            bus_time_us=self.bus_time_us,
+        )
+
+
+class BusStatistics:
+    '''
+    Running statistics of a stream of received messages, e.g. from PLIN.read(), PLIN.read_many(), a PLINReceiver or
+    CaptureReader.query().
+
+    Every message is accounted in constant time: per frame ID, the frame rate and the mean, jitter (standard deviation)
+    and maximum of the time between frames, the count of every error flag and of every checksum type, and the nominal
+    bus time of the frames at baudrate. OVERRUN, SLEEP and WAKEUP messages are counted for the whole bus.
+    Intervals are measured with the device timestamps; an interval is skipped when the device clock goes backwards.
+
+    update() takes no lock, so snapshot() can be called from another thread (e.g. a dashboard) at any time without
+    slowing ingestion; a snapshot taken while a message is being accounted may not include all of it yet.
+    '''
+
+    def __init__(self, baudrate: int = 19200):
+        self.baudrate = baudrate
+        # Nominal frame times by data length, for a response of 0..8 bytes.
+        self._frame_times = [frame_time_us(length, baudrate) for length in range(PLIN_DAT_LEN + 1)]
+        self.reset()
+
+    def reset(self):
+        '''
+        Clears all statistics.
+        '''
+        self.frames = 0
+        self.overruns = 0
+        self.sleeps = 0
+        self.wakeups = 0
+        self.bus_time_us = 0.0
+        self.first_us = None
+        self.last_us = None
+        self._ids = [None] * (PLINFrameID.MAX + 1)
+
+    def update(self, message: Union[PLINMessage, PLINFrame]):
+        '''
+        Accounts one received message.
+        '''
+        type = message.type
+        if type != PLINMessageType.FRAME:
+            if type == PLINMessageType.OVERRUN:
+                self.overruns += 1
+            elif type == PLINMessageType.SLEEP:
+                self.sleeps += 1
+            elif type == PLINMessageType.WAKEUP:
+                self.wakeups += 1
+            return
+
+        id = message.id & PLINFrameID.MAX
+        ts_us = message.ts_us
+        error_flags = flags = int(message.flags)
+        counters = self._ids[id]
+        if counters is None:
+            counters = self._ids[id] = _IDCounters()
+
+        counters.frames += 1
+        last_us = counters.last_us
+        if last_us is not None and ts_us >= last_us:
+            # Welford's running mean and variance.
+            interval = ts_us - last_us
+            counters.intervals += 1
+            delta = interval - counters.interval_mean
+            counters.interval_mean += delta / counters.intervals
+            counters.interval_m2 += delta * (interval - counters.interval_mean)
+            if interval > counters.interval_max:
+                counters.interval_max = interval
+        counters.last_us = ts_us
+
+        errors = counters.errors
+        while flags:
+            bit = flags & -flags
+            index = bit.bit_length() - 1
+            if index < len(errors):
+                errors[index] += 1
+            flags ^= bit
+        counters.checksum_types[message.cs_type & 3] += 1
+
+        bus_time_us = self._frame_times[0 if error_flags & _NO_RESPONSE else min(message.len, PLIN_DAT_LEN)]
+        counters.bus_time_us += bus_time_us
+        self.frames += 1
+        if self.first_us is None or ts_us < self.last_us:
+            # First frame, or the device clock went backwards: restart the span used for the bus load.
+            self.first_us = ts_us
+            self.bus_time_us = 0.0
+        else:
+            self.bus_time_us += bus_time_us
+        self.last_us = ts_us
+
+    def update_many(self, messages: Iterable[Union[PLINMessage, PLINFrame]]):
+        '''
+        Accounts several received messages, e.g. a batch returned by PLIN.read_many().
+        '''
+        update = self.update
+        for message in messages:
+            update(message)
+
+    def snapshot(self) -> BusSnapshot:
+        '''
+        Returns the current statistics.
+        '''
+        span_us = self.last_us - self.first_us if self.first_us is not None else 0
+        return BusSnapshot(
+            frames=self.frames,
+            overruns=self.overruns,
+            sleeps=self.sleeps,
+            wakeups=self.wakeups,
+            bus_time_us=self.bus_time_us,
+            span_us=span_us,
+            bus_load=min(1.0, self.bus_time_us / span_us) if span_us > 0 else 0.0,
+            ids={id: counters._snapshot(id) for id, counters in enumerate(self._ids) if counters is not None},
+        )
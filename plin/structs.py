@@ -1,6 +1,7 @@
 
+import struct
 from ctypes import *
-from typing import Any, Union
+from typing import Any, Iterator, Union
 
 from plin.enums import *
 
@@ -47,6 +48,115 @@ class PLINMessage(Structure):
         return result
 
 
+# Native layout of PLINMessage: type, flags, id, len, dir, cs_type, ts_us, data and reserved padding.
+PLIN_MESSAGE_STRUCT = struct.Struct('=HHBBBBQ8s8x')
+
+
+class PLINFrame:
+    '''
+    Compact, read-only representation of a received LIN message, decoded from the raw 32-byte PLINMessage layout.
+
+    Fields are stored as plain integers and bytes behind read-only properties, so frames can be used as dict keys
+    and set members; type, flags, dir and cs_type are only converted to their enums when accessed.
+    '''
+    __slots__ = ("_type", "_flags", "_id", "_len", "_dir", "_cs_type", "_ts_us", "_data")
+
+    def __init__(self, type: int = 0, flags: int = 0, id: int = 0, len: int = 0, dir: int = 0, cs_type: int = 0,
+                 ts_us: int = 0, data: bytes = bytes(PLIN_DAT_LEN)):
+        self._type = type
+        self._flags = flags
+        self._id = id
+        self._len = len
+        self._dir = dir
+        self._cs_type = cs_type
+        self._ts_us = ts_us
+        self._data = bytes(data)
+
+    @classmethod
+    def from_buffer(cls, buffer: Any, offset: int = 0) -> "PLINFrame":
+        '''
+        Decodes the PLINMessage record at offset in buffer.
+        '''
+        return cls(*PLIN_MESSAGE_STRUCT.unpack_from(buffer, offset))
+
+    @classmethod
+    def iter_buffer(cls, buffer: Any) -> Iterator["PLINFrame"]:
+        '''
+        Decodes consecutive PLINMessage records, e.g. a batch returned by PLIN.read_many().
+        '''
+        view = memoryview(buffer).cast('B')
+        view = view[:len(view) - len(view) % PLIN_MESSAGE_STRUCT.size]
+        return (cls(*fields) for fields in PLIN_MESSAGE_STRUCT.iter_unpack(view))
+
+    @property
+    def type(self) -> PLINMessageType:
+        return PLINMessageType(self._type)
+
+    @property
+    def id(self) -> int:
+        return self._id
+
+    @property
+    def len(self) -> int:
+        return self._len
+
+    @property
+    def ts_us(self) -> int:
+        return self._ts_us
+
+    @property
+    def data(self) -> bytes:
+        return self._data
+
+    @property
+    def flags(self) -> PLINFrameFlag:
+        return PLINFrameFlag(self._flags)
+
+    @property
+    def error_flags(self) -> PLINFrameErrorFlag:
+        return PLINFrameErrorFlag(self._flags)
+
+    @property
+    def dir(self) -> PLINFrameDirection:
+        return PLINFrameDirection(self._dir)
+
+    @property
+    def cs_type(self) -> PLINFrameChecksumType:
+        return PLINFrameChecksumType(self._cs_type)
+
+    def _fields(self) -> tuple:
+        return (self._type, self._flags, self._id, self._len, self._dir, self._cs_type, self._ts_us, self._data)
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, PLINFrame):
+            return NotImplemented
+        return self._fields() == other._fields()
+
+    def __hash__(self) -> int:
+        return hash(self._fields())
+
+    def __repr__(self) -> str:
+        return str(self._asdict())
+
+    def _asdict(self) -> dict:
+        return {
+            "type": self.type,
+            "flags": self.flags,
+            "id": self.id,
+            "len": self.len,
+            "dir": self.dir,
+            "cs_type": self.cs_type,
+            "ts_us": self.ts_us,
+            "data": bytearray(self.data),
+        }
+
+    def to_message(self) -> PLINMessage:
+        '''
+        Converts the frame to a PLINMessage.
+        '''
+        return PLINMessage.from_buffer_copy(PLIN_MESSAGE_STRUCT.pack(*self._fields()))
+
+
 class PLINUSBInitHardware(Structure):
     _fields_ = [
         ("baudrate", c_uint16),
@@ -242,11 +352,8 @@ class PLINUSBGetStatus(Structure):
         result = {field: getattr(self, field)
                   for field, _ in self._fields_}
         result["mode"] = PLINMode(self.mode)
-        if self.usb_filter == 0:
-            result["usb_filter"] = bytearray([0] * PLIN_USB_FILTER_LEN)
-        else:
-            result["usb_filter"] = bytearray.fromhex(
-                f"{self.usb_filter:x}").ljust(PLIN_USB_FILTER_LEN, b'\x00')
+        # Same byte order as PLINUSBIDFilter.id_mask.
+        result["usb_filter"] = bytearray(self.usb_filter.to_bytes(PLIN_USB_FILTER_LEN, 'little'))
         result["bus_state"] = PLINBusState(self.bus_state)
         del result["unused"]
         return result
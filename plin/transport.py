@@ -0,0 +1,228 @@
+import math
+import queue
+import time
+from typing import Callable, List, Optional, Tuple
+
+from plin.device import PLIN, PLINException
+from plin.enums import *
+from plin.receiver import PLINReceiver
+from plin.structs import *
+
+# Protocol control information (PCI) types of ISO 17987-2 transport frames.
+LIN_TP_SF = 0x00
+LIN_TP_FF = 0x10
+LIN_TP_CF = 0x20
+LIN_TP_PADDING = 0xff
+LIN_TP_SF_MAX = 6                       # data bytes of a single frame
+LIN_TP_FF_DATA = 5                      # data bytes of a first frame
+LIN_TP_CF_DATA = 6                      # data bytes of a consecutive frame
+LIN_TP_MAX_LENGTH = 4095
+
+LIN_TP_NAD_FUNCTIONAL = 0x7e
+LIN_TP_NAD_BROADCAST = 0x7f
+LIN_TP_NEGATIVE_RESPONSE = 0x7f
+LIN_TP_NRC_RESPONSE_PENDING = 0x78
+
+
+class LINTPError(PLINException):
+    pass
+
+
+def segment(nad: int, payload: bytes) -> List[bytes]:
+    '''
+    Splits a payload into the 8-byte frames carrying it to the node with the specified NAD, padded with 0xff.
+    '''
+    length = len(payload)
+    if length == 0 or length > LIN_TP_MAX_LENGTH:
+        raise ValueError(f"Payload length {length} out of range [1..{LIN_TP_MAX_LENGTH}].")
+    if length <= LIN_TP_SF_MAX:
+        return [bytes([nad, LIN_TP_SF | length, *payload]).ljust(PLIN_DAT_LEN, b'\xff')]
+
+    frames = [bytes([nad, LIN_TP_FF | length >> 8, length & 0xff, *payload[:LIN_TP_FF_DATA]])]
+    sn = 1
+    for offset in range(LIN_TP_FF_DATA, length, LIN_TP_CF_DATA):
+        chunk = payload[offset:offset + LIN_TP_CF_DATA]
+        frames.append(bytes([nad, LIN_TP_CF | sn, *chunk]).ljust(PLIN_DAT_LEN, b'\xff'))
+        sn = (sn + 1) & 0x0f
+    return frames
+
+
+class LINTPReassembler:
+    '''
+    Reassembles the payloads carried by transport frames, from the node with the specified NAD or any node if None.
+    '''
+
+    def __init__(self, nad: Optional[int] = None):
+        self.nad = nad
+        self.reset()
+
+    def reset(self):
+        '''
+        Discards the payload being reassembled.
+        '''
+        self._nad = None
+        self._length = 0
+        self._sn = 0
+        self._buffer = bytearray()
+
+    @property
+    def busy(self) -> bool:
+        '''
+        Whether a first frame was received and consecutive frames are awaited.
+        '''
+        return self._nad is not None
+
+    def feed(self, data: bytes) -> Optional[Tuple[int, bytes]]:
+        '''
+        Processes one frame, returning the NAD and payload when a payload is complete.
+        '''
+        nad, pci = data[0], data[1]
+        if self.nad is not None and nad != self.nad:
+            return None
+        kind = pci & 0xf0
+        if kind == LIN_TP_SF:
+            length = pci & 0x0f
+            if length == 0 or length > LIN_TP_SF_MAX:
+                raise LINTPError(f"Invalid single frame length {length}.")
+            self.reset()
+            return nad, bytes(data[2:2 + length])
+        if kind == LIN_TP_FF:
+            length = (pci & 0x0f) << 8 | data[2]
+            if length <= LIN_TP_SF_MAX:
+                raise LINTPError(f"Invalid first frame length {length}.")
+            self._nad = nad
+            self._length = length
+            self._sn = 1
+            self._buffer = bytearray(data[3:3 + LIN_TP_FF_DATA])
+            return None
+        if kind == LIN_TP_CF:
+            if self._nad is None or nad != self._nad:
+                return None
+            if pci & 0x0f != self._sn:
+                expected = self._sn
+                self.reset()
+                raise LINTPError(f"Unexpected sequence number {pci & 0x0f}, expected {expected}.")
+            self._sn = (self._sn + 1) & 0x0f
+            self._buffer += data[2:2 + LIN_TP_CF_DATA]
+            if len(self._buffer) < self._length:
+                return None
+            payload = bytes(self._buffer[:self._length])
+            self.reset()
+            return nad, payload
+        raise LINTPError(f"Invalid PCI 0x{pci:02x}.")
+
+
+class LINTransport:
+    '''
+    LIN transport layer (ISO 17987-2) over the diagnostic frames of a PLIN master.
+
+    Requests are sent by updating the data of the master request frame (0x3C), configured as a single-shot publisher by
+    setup(), and responses are reassembled from slave response frames (0x3D). The device must run a schedule with
+    master request and slave response slots, e.g. ScheduleSlot.master_request() and ScheduleSlot.slave_response().
+    Each frame of a request is queued as soon as the device reports the previous one on the bus, so a segmented request
+    takes one master request slot per frame.
+
+    Timeouts are in milliseconds: n_as_ms for each request frame to be sent, p2_ms for the first frame of a response,
+    p2_star_ms after a response pending (NRC 0x78) and n_cr_ms between the frames of a response.
+    Without a receiver, the transport reads the device itself and discards other messages while waiting; with a
+    PLINReceiver, it subscribes to the diagnostic frames instead, sharing the device with other consumers.
+    '''
+
+    def __init__(self,
+                 plin: PLIN,
+                 receiver: Optional[PLINReceiver] = None,
+                 p2_ms: int = 1000,
+                 p2_star_ms: int = 5000,
+                 n_as_ms: int = 1000,
+                 n_cr_ms: int = 1000):
+        self.plin = plin
+        self.receiver = receiver
+        self.p2_ms = p2_ms
+        self.p2_star_ms = p2_star_ms
+        self.n_as_ms = n_as_ms
+        self.n_cr_ms = n_cr_ms
+        self._messages = queue.SimpleQueue()
+
+    def setup(self):
+        '''
+        Configures the diagnostic frame entries and lets their frames through the ID filter.
+        '''
+        self.plin.set_frame_entry(PLINFrameID.DIAG_MASTER_REQ, PLINFrameDirection.PUBLISHER,
+                                  PLINFrameChecksumType.CLASSIC, flags=PLINFrameFlag.SINGLE_SHOT, len=PLIN_DAT_LEN)
+        self.plin.set_frame_entry(PLINFrameID.DIAG_SLAVE_RSP, PLINFrameDirection.SUBSCRIBER,
+                                  PLINFrameChecksumType.CLASSIC, len=PLIN_DAT_LEN)
+        ids = (PLINFrameID.DIAG_MASTER_REQ, PLINFrameID.DIAG_SLAVE_RSP)
+        if self.receiver is not None:
+            self.receiver.subscribe_ids(ids, self._messages.put)
+        else:
+            self.plin.update_id_filter(allow=ids)
+
+    def close(self):
+        '''
+        Unsubscribes from the receiver, if any.
+        '''
+        if self.receiver is not None:
+            self.receiver.unsubscribe_ids((PLINFrameID.DIAG_MASTER_REQ, PLINFrameID.DIAG_SLAVE_RSP), self._messages.put)
+
+    def _next_message(self, deadline: float) -> Optional[PLINMessage]:
+        remaining_ms = max(0, math.ceil((deadline - time.monotonic()) * 1000))
+        if self.receiver is not None:
+            try:
+                return self._messages.get(timeout=remaining_ms / 1000)
+            except queue.Empty:
+                return None
+        return self.plin.read(timeout_ms=remaining_ms)
+
+    def _wait_frame(self, deadline: float, match: Callable[[PLINMessage], bool], timer: str) -> PLINMessage:
+        while True:
+            message = self._next_message(deadline)
+            if message is not None and message.type == PLINMessageType.FRAME and not message.flags and match(message):
+                return message
+            if time.monotonic() >= deadline:
+                raise LINTPError(f"{timer} timeout.")
+
+    def send(self, nad: int, payload: bytes):
+        '''
+        Sends a payload to the node with the specified NAD, returning once its last frame was sent.
+        '''
+        if self.receiver is not None:
+            # Frames received before the request cannot belong to it.
+            while not self._messages.empty():
+                self._messages.get_nowait()
+        for frame in segment(nad, payload):
+            self.plin.set_frame_entry_data(PLINFrameID.DIAG_MASTER_REQ, index=0, data=bytearray(frame), len=PLIN_DAT_LEN)
+            deadline = time.monotonic() + self.n_as_ms / 1000
+            self._wait_frame(deadline, lambda m: m.id == PLINFrameID.DIAG_MASTER_REQ and bytes(m.data) == frame, "N_As")
+
+    def receive(self, nad: int, timeout_ms: Optional[int] = None) -> bytes:
+        '''
+        Receives a payload from the node with the specified NAD, any node for LIN_TP_NAD_BROADCAST.
+
+        timeout_ms bounds the wait for the first frame, p2_ms if None.
+        '''
+        reassembler = LINTPReassembler(None if nad == LIN_TP_NAD_BROADCAST else nad)
+        deadline = time.monotonic() + (self.p2_ms if timeout_ms is None else timeout_ms) / 1000
+        while True:
+            message = self._wait_frame(deadline, lambda m: m.id == PLINFrameID.DIAG_SLAVE_RSP and m.len > 1,
+                                       "N_Cr" if reassembler.busy else "P2")
+            result = reassembler.feed(bytes(message.data))
+            if result is not None:
+                return result[1]
+            if reassembler.busy:
+                deadline = time.monotonic() + self.n_cr_ms / 1000
+
+    def request(self, nad: int, payload: bytes) -> bytes:
+        '''
+        Sends a diagnostic request and returns the response, waiting up to p2_star_ms after every response pending.
+
+        Negative responses other than response pending are returned like any other response.
+        '''
+        self.send(nad, payload)
+        timeout_ms = self.p2_ms
+        while True:
+            response = self.receive(nad, timeout_ms)
+            if len(response) == 3 and response[0] == LIN_TP_NEGATIVE_RESPONSE and \
+                    response[2] == LIN_TP_NRC_RESPONSE_PENDING:
+                timeout_ms = self.p2_star_ms
+                continue
+            return response
@@ -0,0 +1,76 @@
+import collections
+
+import pytest
+from plin.emulator import EmulatedPLIN, PLINEmulator
+from plin.enums import PLINFrameID, PLINMode
+from plin.schedule import ScheduleSlot, ScheduleTable
+from plin.transport import LINTPReassembler, segment
+
+
+class SlaveNodes:
+    '''
+    Emulated slave nodes answering the diagnostic requests addressed to nads, recording the requests received.
+
+    handler returns the response payloads to a request payload; by default the request is echoed with the positive
+    response SID.
+    '''
+
+    def __init__(self, emulator, nads, handler=None):
+        self.nads = set(nads)
+        self.handler = handler or (lambda request: [bytes([request[0] + 0x40]) + request[1:]])
+        self.requests = []
+        self.reassembler = LINTPReassembler()
+        self.responses = collections.deque()
+        emulator.add_monitor(self.on_frame)
+        emulator.set_slave_response(PLINFrameID.DIAG_SLAVE_RSP, self.respond)
+
+    def on_frame(self, message):
+        if message.id == PLINFrameID.DIAG_MASTER_REQ and message.len:
+            request = self.reassembler.feed(bytes(message.data))
+            if request is not None and request[0] in self.nads:
+                nad, payload = request
+                self.requests.append((nad, payload))
+                for response in self.handler(payload):
+                    self.responses.extend(segment(nad, response))
+
+    def respond(self):
+        return self.responses.popleft() if self.responses else None
+
+
+@pytest.fixture
+def emulator():
+    return PLINEmulator(time_scale=0)
+
+
+@pytest.fixture
+def master(emulator):
+    plin = EmulatedPLIN(emulator)
+    plin.start(mode=PLINMode.MASTER, baudrate=19200)
+    yield plin
+    plin.stop()
+
+
+@pytest.fixture
+def slave(emulator):
+    plin = EmulatedPLIN(emulator)
+    plin.start(mode=PLINMode.SLAVE, baudrate=19200)
+    yield plin
+    plin.stop()
+
+
+@pytest.fixture
+def diagnostic_master(master):
+    '''
+    Master running a schedule of a master request and a slave response slot.
+    '''
+    ScheduleTable({0: [ScheduleSlot.master_request(10), ScheduleSlot.slave_response(10)]}).apply(master)
+    master.start_schedule(0)
+    return master
+
+
+@pytest.fixture
+def slave_nodes(emulator):
+    '''
+    Creates SlaveNodes on the emulator.
+    '''
+    return lambda nads, handler=None: SlaveNodes(emulator, nads, handler)
@@ -0,0 +1,124 @@
+import asyncio
+import os
+from unittest.mock import MagicMock, patch
+
+import pytest
+from plin.aio import _EXECUTOR_METHODS, _INLINE_METHODS, AsyncPLIN
+from plin.device import PLIOGETSTATUS, PLIN, PLINException
+from plin.enums import PLINMode
+from plin.structs import PLINMessage
+
+
+@pytest.fixture
+def fifo(tmp_path):
+    path = str(tmp_path / "plin0")
+    os.mkfifo(path)
+    yield path
+
+
+@pytest.fixture
+def mock_ioctl():
+    with patch('fcntl.ioctl', new_callable=MagicMock) as mock_ioctl:
+        yield mock_ioctl
+
+
+def test_frames(fifo, mock_ioctl):
+    async def run():
+        dev = AsyncPLIN(fifo)
+        await dev.start(mode=PLINMode.MASTER)
+        write_fd = os.open(fifo, os.O_WRONLY)
+        os.write(write_fd, b''.join(bytes(PLINMessage(id=i)) for i in range(1, 4)))
+
+        ids = []
+        async for message in dev.frames():
+            ids.append(message.id)
+            if len(ids) == 3:
+                await dev.stop()
+        os.close(write_fd)
+        return ids
+
+    assert asyncio.run(run()) == [1, 2, 3]
+
+
+def test_read_timeout(fifo, mock_ioctl):
+    async def run():
+        dev = AsyncPLIN(fifo)
+        await dev.start(mode=PLINMode.MASTER)
+        message = await dev.read(timeout_ms=10)
+        await dev.get_status()
+        await dev.stop()
+        return message
+
+    assert asyncio.run(run()) is None
+    assert mock_ioctl.called
+
+
+def test_read_error(fifo, mock_ioctl):
+    async def run():
+        dev = AsyncPLIN(fifo)
+        await dev.start(mode=PLINMode.MASTER)
+        fifo_fd = dev.device.fd
+        dev._loop.remove_reader(fifo_fd)
+        read_fd, write_fd = os.pipe()
+        os.close(write_fd)
+        dev.device.fd = read_fd
+        dev._on_readable()
+        with pytest.raises(PLINException, match="end of file"):
+            async for _ in dev.frames():
+                pass
+        await dev.stop()
+        os.close(fifo_fd)
+
+    asyncio.run(run())
+
+
+def test_stop_keeps_queue(fifo, mock_ioctl):
+    async def run():
+        dev = AsyncPLIN(fifo, queue_size=2)
+        await dev.start(mode=PLINMode.MASTER)
+        write_fd = os.open(fifo, os.O_WRONLY)
+        os.write(write_fd, b''.join(bytes(PLINMessage(id=i)) for i in range(1, 3)))
+        while dev._queue.qsize() < 2:
+            await asyncio.sleep(0.01)
+        # The end of the stream does not take the place of a queued message.
+        await dev.stop()
+        os.close(write_fd)
+        return [message.id async for message in dev.frames()], dev.dropped
+
+    assert asyncio.run(run()) == ([1, 2], 0)
+
+
+def test_methods():
+    public = {name for name in dir(PLIN) if not name.startswith("_") and callable(getattr(PLIN, name))}
+    # Every method of PLIN is wrapped, run in an executor or reimplemented on the event loop, except read_many.
+    wrapped = set(_INLINE_METHODS) | set(_EXECUTOR_METHODS) | {"start", "stop", "read", "write", "write_many"}
+    assert public - {"read_many"} == wrapped
+    assert not set(_INLINE_METHODS) & {"write_many", "start_autobaud"}
+
+
+def test_write_many(fifo, mock_ioctl):
+    def ioctl(fd, request, buffer=None):
+        if request == PLIOGETSTATUS:
+            buffer.tx_qfree = credits.pop(0)
+    mock_ioctl.side_effect = ioctl
+    credits = [0, 0, 2, 2]
+
+    async def run():
+        dev = AsyncPLIN(fifo)
+        await dev.start(mode=PLINMode.MASTER)
+        read_fd = os.open(fifo, os.O_RDONLY | os.O_NONBLOCK)
+        dev._loop.remove_reader(dev.device.fd)
+        # The loop keeps running while the transmit queue of the device is full.
+        ticks = []
+        ticker = asyncio.ensure_future(asyncio.sleep(0))
+        ticker.add_done_callback(ticks.append)
+        written = await dev.write_many([PLINMessage(id=i) for i in range(1, 5)])
+        data = os.read(read_fd, 4096)
+        os.close(read_fd)
+        await dev.stop()
+        return written, data, ticks
+
+    written, data, ticks = asyncio.run(run())
+    assert written == 4
+    assert [PLINMessage.from_buffer_copy(data, i * 32).id for i in range(4)] == [1, 2, 3, 4]
+    assert ticks
@@ -0,0 +1,36 @@
+import pytest
+from plin.structs import PLIN_EMPTY_DATA, PLINMessage
+
+np = pytest.importorskip("numpy")
+from plin.arrays import *
+
+
+@pytest.fixture
+def raw_messages():
+    messages = [PLINMessage(id=0x22, len=2, ts_us=100, data=bytearray([0x01, 0x02])),
+                PLINMessage(id=0x3f, data=bytearray(PLIN_EMPTY_DATA)),
+                PLINMessage(id=0x23, len=1, ts_us=300, flags=0x20, data=bytearray([0x03]))]
+    return b''.join(bytes(m) for m in messages)
+
+
+def test_dtype_matches_message():
+    assert PLIN_MESSAGE_DTYPE.itemsize == PLINMessage.buffer_length
+    for name, _ in PLINMessage._fields_:
+        assert PLIN_MESSAGE_DTYPE.fields[name][1] == getattr(PLINMessage, name).offset
+
+
+def test_from_buffer(raw_messages):
+    array = from_buffer(raw_messages + b'\x00' * 5)
+    assert len(array) == 3
+    assert list(array["id"]) == [0x22, 0x3f, 0x23]
+    assert list(array["ts_us"]) == [100, 0, 300]
+    assert list(array["data"][0][:2]) == [0x01, 0x02]
+    assert list(valid_mask(array)) == [True, False, True]
+    assert to_message(array[2]).flags == 0x20
+
+
+def test_from_file(tmp_path, raw_messages):
+    path = tmp_path / "capture.bin"
+    path.write_bytes(b'HDR!' + raw_messages)
+    array = from_file(str(path), offset=4)
+    assert list(array["id"]) == [0x22, 0x3f, 0x23]
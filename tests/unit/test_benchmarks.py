@@ -0,0 +1,15 @@
+import json
+
+from benchmarks.bench_plin import BENCHMARKS, main
+
+
+def test_benchmarks_report(tmp_path):
+    output = tmp_path / "results.json"
+    main(["--iterations", "20", "--output", str(output)])
+
+    report = json.loads(output.read_text())
+    assert set(report["results"]) == set(BENCHMARKS)
+    for result in report["results"].values():
+        assert result["frames_per_sec"] > 0
+        assert set(result["latency_us"]) == {"p50", "p90", "p99", "max"}
+        assert result["alloc_peak_bytes_per_op"] >= 0
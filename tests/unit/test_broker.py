@@ -0,0 +1,167 @@
+import os
+import socket
+import threading
+import time
+
+import pytest
+from plin.broker import (BROKER_COUNT, BROKER_HEADER, BROKER_MAX_REQUEST, BrokerClient, BrokerMessage, PLINBroker,
+                         parse_device)
+from plin.device import PLINException
+from plin.emulator import EmulatedPLIN, PLINEmulator
+from plin.enums import PLINFrameChecksumType, PLINFrameDirection, PLINMessageType, PLINMode
+from plin.structs import PLINMessage
+
+
+@pytest.fixture
+def emulator():
+    return PLINEmulator(time_scale=0, rx_queue_size=4096)
+
+
+@pytest.fixture
+def broker(slave, tmp_path):
+    broker = PLINBroker([slave], str(tmp_path / "broker.sock"), max_buffer=16384)
+    thread = threading.Thread(target=broker.serve_forever, daemon=True)
+    thread.start()
+    yield broker
+    broker.stop()
+    thread.join()
+    broker.close()
+
+
+def read_messages(client, count, timeout=1):
+    messages = []
+    deadline = time.monotonic() + timeout
+    while len(messages) < count and time.monotonic() < deadline:
+        batch = client.read(timeout=0.1)
+        if batch is not None:
+            messages += [PLINMessage.from_buffer_copy(m) for m in batch[1]]
+    return messages
+
+
+def test_filters(broker):
+    with BrokerClient(broker.path) as all_frames, BrokerClient(broker.path) as some:
+        all_frames.subscribe()
+        some.subscribe(ids=[0x21], types=[PLINMessageType.FRAME])
+        # Subscriptions are applied in order with the messages that follow them.
+        assert all_frames.call("get_mode") == PLINMode.SLAVE
+        assert some.call("get_mode") == PLINMode.SLAVE
+
+        broker.devices[0].emulator.inject([PLINMessage(id=i % 4 + 0x20, ts_us=i) for i in range(8)] +
+                                          [PLINMessage(type=PLINMessageType.WAKEUP)])
+        assert [m.id for m in read_messages(all_frames, 9)] == [0x20, 0x21, 0x22, 0x23] * 2 + [0]
+        assert [m.ts_us for m in read_messages(some, 2)] == [1, 5]
+        assert some.read(timeout=0.05) is None
+
+
+def test_write_and_call(broker):
+    with BrokerClient(broker.path) as client:
+        client.call("set_frame_entry", 0x10, PLINFrameDirection.SUBSCRIBER, PLINFrameChecksumType.ENHANCED, len=2)
+        assert client.call("get_frame_entry", 0x10)["direction"] == PLINFrameDirection.SUBSCRIBER
+        assert client.write([PLINMessage(id=0x10, len=2, dir=PLINFrameDirection.PUBLISHER)] * 3) == 3
+
+        with pytest.raises(PLINException, match="not allowed"):
+            client.call("reset")
+        with pytest.raises(PLINException, match="Unknown device"):
+            client.call("get_mode", device=1)
+
+
+def test_backpressure(broker):
+    with BrokerClient(broker.path) as slow:
+        slow.subscribe()
+        slow.call("get_mode")
+        # Shrink the kernel buffering of the slow client so the broker buffer fills up.
+        for sock in list(broker._clients):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1)
+        slow.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1)
+        fast = BrokerClient(broker.path)
+        fast.subscribe()
+        fast.call("get_mode")
+
+        total = 4000
+        for start in range(0, total, 500):
+            broker.devices[0].emulator.inject([PLINMessage(id=1, ts_us=i) for i in range(start, start + 500)])
+            time.sleep(0.01)
+        assert [m.ts_us for m in read_messages(fast, total, timeout=5)] == list(range(total))
+
+        received = read_messages(slow, total, timeout=0.5)
+        assert 0 < len(received) < total
+        assert len(received) + slow.dropped[0] == total
+        fast.close()
+
+
+def test_slow_write(broker, monkeypatch):
+    plin = broker.devices[0]
+    write_many = plin.write_many
+    monkeypatch.setattr(plin, "write_many", lambda *args, **kwargs: time.sleep(0.5) or write_many(*args, **kwargs))
+    with BrokerClient(broker.path) as writer, BrokerClient(broker.path) as reader:
+        reader.subscribe()
+        reader.call("get_mode")
+        start = time.monotonic()
+        writer._send(BrokerMessage.WRITE, 0, bytes(PLINMessage(id=0x10, len=1, dir=PLINFrameDirection.PUBLISHER)))
+        plin.emulator.inject([PLINMessage(id=1, ts_us=1)])
+        # Frames keep flowing while the write is in progress.
+        assert [m.ts_us for m in read_messages(reader, 1)] == [1]
+        assert time.monotonic() - start < 0.4
+        assert writer._wait(BrokerMessage.WRITTEN, 0) == BROKER_COUNT.pack(1)
+
+
+@pytest.mark.parametrize("request_", [BROKER_HEADER.pack(BrokerMessage.SUBSCRIBE, 0, 3) + b'abc',
+                                      BROKER_HEADER.pack(BrokerMessage.WRITE, 0, 5) + b'12345',
+                                      BROKER_HEADER.pack(BrokerMessage.FRAMES, 0, 0),
+                                      BROKER_HEADER.pack(BrokerMessage.WRITE, 0, BROKER_MAX_REQUEST + 1)])
+def test_malformed_request(broker, request_):
+    with BrokerClient(broker.path) as bad, BrokerClient(broker.path) as good:
+        bad.sock.sendall(request_)
+        with pytest.raises(PLINException, match="disconnected"):
+            bad.call("get_mode")
+        assert good.call("get_mode") == PLINMode.SLAVE
+
+
+def test_device_closed(tmp_path):
+    devices = [EmulatedPLIN(PLINEmulator(time_scale=0), interface=f"plin{i}") for i in range(2)]
+    for plin in devices:
+        plin.start(mode=PLINMode.SLAVE, baudrate=19200)
+    broker = PLINBroker(devices, str(tmp_path / "broker.sock"))
+    thread = threading.Thread(target=broker.serve_forever, daemon=True)
+    thread.start()
+    with BrokerClient(broker.path) as client:
+        client.subscribe(0)
+        client.subscribe(1)
+        client.call("get_mode", device=1)
+        # The first device is unplugged, the second one keeps streaming.
+        devices[0].emulator.close()
+        devices[1].emulator.inject([PLINMessage(id=1, ts_us=i) for i in range(3)])
+        assert [m.ts_us for m in read_messages(client, 3)] == [0, 1, 2]
+        assert "end of file" in client.closed[0]
+        assert isinstance(broker.errors[0], PLINException) and devices[0].fd is None
+        with pytest.raises(PLINException, match="closed"):
+            client.call("get_mode", device=0)
+        assert client.write([PLINMessage(id=0x10, len=1)], device=0) == 0
+        assert thread.is_alive()
+    broker.stop()
+    thread.join()
+    broker.close()
+    devices[1].stop()
+
+
+def test_socket_path(broker, slave, tmp_path):
+    assert os.stat(broker.path).st_mode & 0o777 == 0o600
+    # The socket of a running broker is not taken over.
+    with pytest.raises(PLINException, match="already listening"):
+        PLINBroker([slave], broker.path)
+    with BrokerClient(broker.path) as client:
+        assert client.call("get_mode") == PLINMode.SLAVE
+
+    # A socket nobody listens on is replaced.
+    stale = str(tmp_path / "stale.sock")
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(stale)
+    sock.close()
+    other = PLINBroker([], stale, mode=0o660)
+    assert os.stat(stale).st_mode & 0o777 == 0o660
+    other.close()
+
+
+def test_parse_device():
+    assert parse_device("/dev/plin0") == ("/dev/plin0", PLINMode.SLAVE, 19200)
+    assert parse_device("/dev/plin1:master:9600") == ("/dev/plin1", PLINMode.MASTER, 9600)
@@ -0,0 +1,44 @@
+import os
+
+import pytest
+from plin.capture import *
+from plin.structs import PLINMessage
+
+
+def make_messages(count, step_us=1000):
+    return [PLINMessage(id=i % 4, len=1, ts_us=i * step_us, data=bytearray([i & 0xff])) for i in range(count)]
+
+
+@pytest.fixture
+def capture_path(tmp_path):
+    path = str(tmp_path / "bus.plincap")
+    with CaptureWriter(path, bucket_us=10000) as writer:
+        messages = make_messages(100)
+        writer.write(messages[:50])
+        writer.write((PLINMessage * 50)(*messages[50:]))
+    yield path
+
+
+def test_roundtrip(capture_path):
+    with CaptureReader(capture_path) as reader:
+        assert len(reader) == 100
+        assert reader[42].ts_us == 42000
+        assert reader[-1].data[0] == 99
+        assert reader.ts_us == 0
+        assert reader.wall_ns > 0
+        assert len(reader.buckets) == 10
+        assert reader.buckets[0].id_mask == 0b1111
+
+
+def test_query(capture_path):
+    with CaptureReader(capture_path) as reader:
+        result = list(reader.query(id=2, t0=20000, t1=40000))
+        assert [m.ts_us for m in result] == [22000, 26000, 30000, 34000, 38000]
+        assert len(list(reader.query())) == 100
+
+
+def test_missing_index(capture_path):
+    os.remove(capture_path + PLIN_CAPTURE_INDEX_SUFFIX)
+    with CaptureReader(capture_path) as reader:
+        assert len(reader.buckets) == 10
+        assert len(list(reader.query(id=1))) == 25
@@ -0,0 +1,54 @@
+import random
+
+import pytest
+from plin.clock import CLOCK_NOMINAL_RATE, ClockSync
+from plin.structs import PLINMessage
+
+
+def test_fit():
+    random.seed(1)
+    sync = ClockSync()
+    # Device clock 50 ppm slow, observed with up to 200 us of latency.
+    for i in range(2000):
+        ts_us = 5_000_000 + i * 10_000
+        sync.update(ts_us, 10**18 + round(ts_us * 1000 * (1 + 50e-6)) + random.randrange(200_000))
+
+    assert sync.drift_ppm == pytest.approx(50, abs=1)
+    assert 50_000 < sync.error_ns < 70_000
+    expected = 10**18 + round(30_000_000 * 1000 * (1 + 50e-6)) + 100_000
+    assert sync.to_host(30_000_000) == pytest.approx(expected, abs=10_000)
+
+
+def test_update_batch():
+    sync = ClockSync(clock=lambda: 7_000_000)
+    with pytest.raises(ValueError):
+        sync.to_host(0)
+    sync.update_batch(b''.join(bytes(PLINMessage(ts_us=ts)) for ts in (100, 200)))
+    assert sync.synchronized
+    assert sync.rate == CLOCK_NOMINAL_RATE
+    assert sync.to_host(200) == 7_000_000
+    assert sync.to_host(1200) == 8_000_000
+    sync.update_batch(b'')
+    assert sync.observations == 1
+
+
+def test_backwards():
+    sync = ClockSync()
+    sync.update(1000, 1_000_000)
+    sync.update(2000, 2_000_000)
+    sync.update(500, 10_000_000)
+    assert sync.resets == 1
+    assert sync.observations == 1
+    assert sync.to_host(600) == 10_100_000
+
+
+def test_to_host_array():
+    sync = ClockSync()
+    sync.update(0, 10**18)
+    sync.update(1_000_000, 10**18 + 1_001_000_000)
+    assert sync.to_host_array([0, 500_000]) == [10**18, 10**18 + 500_500_000]
+
+    np = pytest.importorskip("numpy")
+    converted = sync.to_host_array(np.array([0, 500_000, 2_000_000], dtype=np.uint64))
+    assert converted.dtype == np.int64
+    assert converted.tolist() == [sync.to_host(ts) for ts in (0, 500_000, 2_000_000)]
@@ -0,0 +1,128 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+from plin.command import PLINCommandChannel
+from plin.enums import PLINFrameChecksumType, PLINFrameDirection, PLINMode
+from plin.instrumentation import PLINInstrumentation
+
+
+@pytest.fixture
+def plin(master):
+    master.instrumentation = PLINInstrumentation()
+    return master
+
+
+def calls(plin, name):
+    return plin.instrumentation.snapshot().get(name, {}).get("calls", 0)
+
+
+def test_coalesce_data(plin):
+    channel = PLINCommandChannel(plin)
+    first = channel.set_frame_entry(0x10, PLINFrameDirection.PUBLISHER, PLINFrameChecksumType.ENHANCED, len=4)
+    channel.set_frame_entry(0x10, PLINFrameDirection.PUBLISHER, PLINFrameChecksumType.ENHANCED, len=8)
+    updates = [channel.set_frame_entry_data(0x10, 0, b'\x01\x02', 2),
+               channel.set_frame_entry_data(0x10, 2, b'\x03\x04', 2),
+               channel.set_frame_entry_data(0x10, 1, b'\x05', 1)]
+    # Not contiguous with the pending update.
+    channel.set_frame_entry_data(0x10, 6, b'\x06', 1)
+    assert channel.pending == 3
+    assert channel.coalesced == 3
+    assert updates[0] is updates[2]
+
+    channel.start()
+    channel.stop()
+    assert first.result() is None
+    assert calls(plin, "PLIOSETFRMENTRY") == 1
+    assert calls(plin, "PLIOCHGBYTEARRAY") == 2
+    entry = plin.get_frame_entry(0x10, refresh=True)
+    assert entry.len == 8
+    assert bytes(entry.d) == b'\x01\x05\x03\x04\x00\x00\x06\x00'
+
+
+def test_coalesce_id_filter(plin):
+    channel = PLINCommandChannel(plin)
+    before = calls(plin, "PLIOSETIDFILTER")
+    channel.set_id_filter(bytes(8))
+    channel.update_id_filter(allow=[1, 2, 3])
+    channel.update_id_filter(block=[2])
+    other = channel.update_id_filter(allow=[4], block=[1])
+    with pytest.raises(ValueError):
+        channel.update_id_filter(allow=[64])
+    assert channel.pending == 1
+
+    channel.start()
+    channel.stop()
+    assert other.result() is None
+    assert calls(plin, "PLIOSETIDFILTER") == before + 1
+    assert int.from_bytes(plin.get_id_filter(), 'little') == 1 << 3 | 1 << 4
+
+
+def test_submit_keeps_order(plin):
+    channel = PLINCommandChannel(plin)
+    channel.set_id_filter(bytes(8))
+    channel.submit("register_id", 5)
+    channel.set_id_filter(b'\x01')
+    channel.set_led_state(True)
+    channel.query("get_id_filter")
+    channel.set_led_state(False)
+    assert channel.pending == 6
+    assert channel.coalesced == 0
+
+    channel.start()
+    channel.stop()
+    assert int.from_bytes(plin.get_id_filter(), 'little') == 0x1
+
+
+def test_query(plin):
+    channel = PLINCommandChannel(plin)
+    statuses = [channel.get_status(), channel.get_status()]
+    channel.set_led_state(True)
+    statuses.append(channel.get_status())
+    assert statuses[0] is statuses[1]
+    assert statuses[1] is not statuses[2]
+    failed = channel.submit("get_schedule_slots", 99)
+
+    channel.start()
+    channel.stop()
+    assert calls(plin, "PLIOGETSTATUS") == 2
+    assert statuses[2].result()["mode"] == PLINMode.MASTER
+    assert failed.exception() is not None
+
+
+def test_query_arguments(plin):
+    channel = PLINCommandChannel(plin)
+    remap = list(range(64))
+    shared = [channel.query("get_visual_response_remap", remap), channel.query("get_visual_response_remap", remap)]
+    assert shared[0] is shared[1]
+    # Arguments that cannot be compared are queried separately.
+    separate = [channel.query("get_mode", SimpleNamespace()), channel.query("get_mode", SimpleNamespace())]
+    assert separate[0] is not separate[1]
+
+    channel.start()
+    channel.stop()
+    assert shared[0].result() == plin.get_visual_response_remap(remap)
+    assert isinstance(separate[1].exception(), TypeError)
+
+
+def test_concurrent_reader(plin):
+    channel = PLINCommandChannel(plin)
+    channel.start()
+    plin.clear_id_filter()
+    stop = threading.Event()
+    received = []
+
+    def read():
+        while not stop.is_set():
+            received.extend(m.id for m in plin.read_many(64, timeout_ms=10))
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    futures = [channel.set_frame_entry_data(0x10, 0, bytes([i]), 1) for i in range(100)]
+    futures += [channel.get_status() for _ in range(10)]
+    for future in futures:
+        future.result(timeout=5)
+    stop.set()
+    reader.join()
+    channel.stop()
+    assert plin.get_frame_entry(0x10).d[0] == 99
@@ -135,3 +135,184 @@ def test_get_status(plin_master, mock_ioctl):
     mock_ioctl.assert_called_once()
     _, ioctl_num, arg = mock_ioctl.mock_calls[0].args
     assert ioctl_num == PLIOGETSTATUS
+
+
+@pytest.fixture
+def plin_pipe():
+    plin = PLIN("/dev/plin0")
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    plin.fd = read_fd
+    yield plin, write_fd
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def test_read_many(plin_pipe):
+    plin, write_fd = plin_pipe
+    messages = [PLINMessage(id=i, len=2, data=bytearray([i, i])) for i in range(3)]
+    empty = PLINMessage(id=0x3f, data=bytearray(PLIN_EMPTY_DATA))
+    os.write(write_fd, b''.join(bytes(m) for m in [messages[0], empty, messages[1], messages[2]]))
+
+    batch = plin.read_many(max_frames=16, timeout_ms=0)
+    assert [m.id for m in batch] == [0, 1, 2]
+    assert bytearray(batch[2].data)[:2] == bytearray([2, 2])
+
+    # Entries are views over the preallocated read buffer.
+    batch[0].id = 0x10
+    assert plin.read_many(max_frames=16, timeout_ms=0)[:] == []
+    assert PLINMessage.from_buffer_copy(plin._read_buffer).id == 0x10
+
+
+def test_read_many_timeout(plin_pipe):
+    plin, _ = plin_pipe
+    assert len(plin.read_many(max_frames=4, timeout_ms=10)) == 0
+
+
+def test_read_many_errors():
+    plin = PLIN("/dev/plin0")
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    plin.fd = read_fd
+    os.close(write_fd)
+    with pytest.raises(PLINException, match="end of file"):
+        plin.read_many(max_frames=16, timeout_ms=100)
+    os.close(read_fd)
+    with pytest.raises(OSError):
+        plin.read_many(max_frames=16, timeout_ms=100)
+
+
+def test_read(plin_pipe):
+    plin, write_fd = plin_pipe
+    os.write(write_fd, bytes(PLINMessage(id=0x22, len=1, data=bytearray([0x01]))))
+
+    message = plin.read(timeout_ms=10)
+    assert message.id == 0x22
+    assert plin.read(block=False) is None
+    assert plin.read(timeout_ms=10) is None
+
+
+def test_id_filter_cache(plin_master, mock_ioctl):
+    plin, mock_ioctl = plin_master
+
+    # The filter is read once, then edited locally.
+    plin.block_id(5)
+    assert [c.args[1] for c in mock_ioctl.mock_calls] == [PLIOGETIDFILTER]
+
+    mock_ioctl.reset_mock()
+    plin.register_id(5)
+    plin.register_id(5)
+    plin.update_id_filter(allow=[5], block=[6])
+    assert [c.args[1] for c in mock_ioctl.mock_calls] == [PLIOSETIDFILTER]
+    assert bytearray(mock_ioctl.mock_calls[0].args[2].id_mask) == bytearray([0x20] + [0] * 7)
+
+    mock_ioctl.reset_mock()
+    plin.update_id_filter(allow=[1, 2], block=[5])
+    plin.clear_id_filter(allow_all=False)
+    assert [c.args[1] for c in mock_ioctl.mock_calls] == [PLIOSETIDFILTER, PLIOSETIDFILTER]
+
+
+def test_write_does_not_refilter(plin_master, mock_ioctl):
+    plin, mock_ioctl = plin_master
+    plin.set_id_filter(bytearray([0xff] * 8))
+    mock_ioctl.reset_mock()
+
+    message = PLINMessage(id=0x3c, dir=PLINFrameDirection.PUBLISHER)
+    with patch('os.write') as mock_write:
+        plin.write(message)
+        plin.write(message)
+    assert [c.args[1] for c in mock_ioctl.mock_calls] == [PLIOSETIDFILTER]
+    assert mock_write.call_count == 2
+
+
+def test_write_many(plin_master, mock_ioctl):
+    plin, mock_ioctl = plin_master
+    plin.set_id_filter(bytearray([0xff] * 8))
+    mock_ioctl.reset_mock()
+
+    def get_status(fd, request, buffer):
+        if request == PLIOGETSTATUS:
+            buffer.tx_qfree = 2
+    mock_ioctl.side_effect = get_status
+
+    messages = [PLINMessage(id=i, dir=PLINFrameDirection.PUBLISHER) for i in range(1, 6)]
+    # The first chunk is written partially.
+    with patch('os.write', side_effect=[48, 16, 64, 32]) as mock_write:
+        assert plin.write_many(messages) == 5
+    assert [c.args[1] for c in mock_ioctl.mock_calls].count(PLIOSETIDFILTER) == 1
+    assert [len(c.args[1]) for c in mock_write.mock_calls] == [64, 16, 64, 32]
+    assert plin._id_filter == ~0x3e & ((1 << 64) - 1)
+
+
+def test_frame_entry_cache(plin_master, mock_ioctl):
+    plin, mock_ioctl = plin_master
+    plin.set_frame_entry(0x22, direction=PLINFrameDirection.PUBLISHER,
+                         checksum_type=PLINFrameChecksumType.CLASSIC, data=bytearray([1, 2, 3]), len=3)
+    plin.set_frame_entry_data(0x22, index=1, data=bytearray([7, 8]), len=2)
+    mock_ioctl.reset_mock()
+
+    entry = plin.get_frame_entry(0x22)
+    mock_ioctl.assert_not_called()
+    assert entry.flags == PLINFrameFlag.RSP_ENABLE
+    assert bytearray(entry.d)[:3] == bytearray([1, 7, 8])
+
+    plin.get_frame_entry(0x22, refresh=True)
+    assert [c.args[1] for c in mock_ioctl.mock_calls] == [PLIOGETFRMENTRY]
+
+
+def test_ioctl_error(plin_master, mock_ioctl):
+    plin, mock_ioctl = plin_master
+    mock_ioctl.side_effect = OSError(16, "Device or resource busy")
+    with pytest.raises(PLINIoctlError) as error:
+        plin.get_status()
+    assert error.value.name == "PLIOGETSTATUS"
+    assert error.value.errno == 16
+
+
+def test_publisher(plin_master, mock_ioctl):
+    plin, mock_ioctl = plin_master
+    plin.set_frame_entry(0x22, direction=PLINFrameDirection.PUBLISHER,
+                         checksum_type=PLINFrameChecksumType.CLASSIC, data=bytearray([1, 2, 3, 4]), len=4)
+    sent = []
+    mock_ioctl.side_effect = lambda fd, request, buffer: sent.append((buffer.idx, buffer.len, bytes(buffer.d)))
+    publisher = plin.publisher(0x22)
+
+    assert not publisher.update(bytearray([1, 2, 3, 4]))
+    assert publisher.update(bytearray([1, 9, 8, 4]))
+    assert publisher.update(bytearray([5]), index=3)
+    assert sent == [(1, 2, bytes([9, 8, 0, 0, 0, 0, 0, 0])), (3, 1, bytes([5, 8, 0, 0, 0, 0, 0, 0]))]
+    assert bytearray(plin.get_frame_entry(0x22).d)[:4] == bytearray([1, 9, 8, 5])
+
+    # Updates made through the device are seen by the handle.
+    plin.set_frame_entry_data(0x22, index=0, data=bytearray([7]), len=1)
+    assert publisher.data[:4] == bytearray([7, 9, 8, 5])
+    with pytest.raises(ValueError):
+        publisher.update(bytearray(2), index=7)
+
+
+def test_set_frame_entries(plin_master, mock_ioctl):
+    plin, mock_ioctl = plin_master
+    entries = [PLINUSBFrameEntry(id=i, len=2, direction=PLINFrameDirection.SUBSCRIBER,
+                                 checksum=PLINFrameChecksumType.ENHANCED) for i in range(4)]
+    assert plin.set_frame_entries(entries) == 4
+
+    entries[2].checksum = PLINFrameChecksumType.CLASSIC
+    mock_ioctl.reset_mock()
+    assert plin.set_frame_entries(entries) == 1
+    _, ioctl_num, arg = mock_ioctl.mock_calls[0].args
+    assert ioctl_num == PLIOSETFRMENTRY
+    assert arg.id == 2
+
+
+def test_frame_entry_range(plin_master, mock_ioctl):
+    plin, mock_ioctl = plin_master
+    mock_ioctl.reset_mock()
+    with pytest.raises(ValueError):
+        plin.get_frame_entry(0x40)
+    with pytest.raises(ValueError):
+        plin.set_frame_entry(0x41, direction=PLINFrameDirection.SUBSCRIBER, checksum_type=PLINFrameChecksumType.CLASSIC)
+    with pytest.raises(ValueError):
+        plin.set_frame_entry_data(-1, index=0, data=bytearray([1]), len=1)
+    with pytest.raises(ValueError):
+        plin.set_frame_entry_data(0x10, index=6, data=bytearray(4), len=4)
+    assert not mock_ioctl.called
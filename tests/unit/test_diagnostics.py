@@ -0,0 +1,55 @@
+import time
+
+import pytest
+from plin.diagnostics import DiagnosticScheduler
+from plin.transport import LINTPError, LINTransport
+
+
+@pytest.fixture
+def scheduler(diagnostic_master):
+    transport = LINTransport(diagnostic_master, p2_ms=100)
+    transport.setup()
+    return DiagnosticScheduler(transport)
+
+
+def test_round_robin(scheduler, slave_nodes):
+    cluster = slave_nodes({0x01, 0x02, 0x03})
+    futures = [scheduler.submit(0x01, bytes([0x22, 0xf1, i])) for i in range(3)]
+    futures += [scheduler.submit(0x02, bytes([0x22, 0xf1, 0x10])), scheduler.submit(0x03, bytes([0x22, 0xf1, 0x20]))]
+    scheduler.start()
+    results = [future.result(timeout=5) for future in futures]
+    scheduler.stop()
+
+    assert results[0] == bytes([0x62, 0xf1, 0x00])
+    assert results[4] == bytes([0x62, 0xf1, 0x20])
+    assert [nad for nad, _ in cluster.requests] == [0x01, 0x02, 0x03, 0x01, 0x01]
+
+
+def test_errors_and_cancel(scheduler, slave_nodes):
+    slave_nodes({0x01})
+    scheduler.start()
+    # Node configuration requests without response complete once sent.
+    assert scheduler.submit(0x06, bytes([0xb6]), expect_response=False).result(timeout=5) is None
+    missing = scheduler.submit(0x05, bytes([0x22, 0xf1, 0x90]))
+    queued = scheduler.submit(0x01, bytes([0x22, 0xf1, 0x90]))
+    while not missing.running() and not missing.done():
+        time.sleep(0.001)
+    # The request to the missing node is running until P2 expires, the other one is cancelled.
+    scheduler.stop(cancel=True)
+    assert queued.cancelled()
+    with pytest.raises(LINTPError):
+        missing.result(timeout=5)
+
+
+def test_submit_after_stop(scheduler, slave_nodes):
+    slave_nodes({0x01})
+    scheduler.start()
+    scheduler.stop()
+    with pytest.raises(RuntimeError):
+        scheduler.submit(0x01, bytes([0x22, 0xf1, 0x90]))
+    assert scheduler.pending == 0
+
+    # Restarting the scheduler accepts requests again.
+    scheduler.start()
+    assert scheduler.submit(0x01, bytes([0x22, 0xf1, 0x90])).result(timeout=5) == bytes([0x62, 0xf1, 0x90])
+    scheduler.stop()
@@ -0,0 +1,97 @@
+import time
+
+import pytest
+from plin.emulator import EmulatedPLIN
+from plin.enums import *
+from plin.lin import frame_time_us
+from plin.schedule import ScheduleSlot, ScheduleTable
+from plin.structs import PLINMessage
+
+
+def read_frames(plin, count, timeout_s=1):
+    frames = []
+    deadline = time.monotonic() + timeout_s
+    while len(frames) < count and time.monotonic() < deadline:
+        frames.extend(PLINMessage.from_buffer_copy(m) for m in plin.read_many(count - len(frames), timeout_ms=10))
+    return frames
+
+
+def test_configuration(master):
+    assert master.get_mode() == PLINMode.MASTER
+    assert master.get_baudrate() == 19200
+    assert master.get_firmware_version() == "2.5.0"
+    master.set_id_string("test ID")
+    assert master.get_id_string() == "test ID"
+    master.set_id_filter(bytearray([0x0f] + [0] * 7))
+    assert master.get_id_filter() == bytearray([0x0f] + [0] * 7)
+    assert master.get_status()["usb_filter"] == bytearray([0x0f] + [0] * 7)
+
+    master.reset()
+    assert master.get_mode() == PLINMode.NONE
+    assert master.get_baudrate() == 0
+
+
+def test_schedule(master, emulator):
+    master.set_frame_entry(0x22, PLINFrameDirection.PUBLISHER, PLINFrameChecksumType.ENHANCED,
+                           data=bytearray([1, 2]), len=2)
+    master.set_frame_entry(0x23, PLINFrameDirection.SUBSCRIBER, PLINFrameChecksumType.ENHANCED, len=4)
+    emulator.set_slave_response(0x23, b'\x0a\x0b\x0c\x0d')
+
+    table = ScheduleTable({0: [ScheduleSlot.unconditional(10, 0x22), ScheduleSlot.unconditional(10, 0x23)]})
+    table.apply(master)
+    assert ScheduleTable.from_device(master) == table
+    assert master.start_schedule(0) == PLINError.OK
+
+    frames = read_frames(master, 4)
+    assert [f.id for f in frames] == [0x22, 0x23, 0x22, 0x23]
+    assert bytearray(frames[0].data)[:2] == bytearray([1, 2])
+    assert bytearray(frames[1].data)[:4] == bytearray([0x0a, 0x0b, 0x0c, 0x0d])
+    assert frames[1].dir == PLINFrameDirection.SUBSCRIBER
+    assert frames[2].ts_us - frames[0].ts_us == 20000
+
+
+def test_filter_and_no_response(master):
+    master.set_frame_entry(0x10, PLINFrameDirection.SUBSCRIBER, PLINFrameChecksumType.CLASSIC)
+    master.add_unconditional_schedule_slot(schedule=1, delay_ms=5, id=0x10)
+    master.add_unconditional_schedule_slot(schedule=1, delay_ms=5, id=0x11)
+    master.clear_id_filter(allow_all=False)
+    master.register_id(0x10)
+    master.start_schedule(1)
+
+    frames = read_frames(master, 3)
+    assert {f.id for f in frames} == {0x10}
+    assert frames[0].flags == PLINFrameErrorFlag.SLV_NOT_RSP
+
+
+def test_write(master):
+    master.clear_id_filter()
+    master.write(PLINMessage(id=0x3c, len=8, dir=PLINFrameDirection.PUBLISHER, data=bytearray([0x7f] * 8)))
+    frames = read_frames(master, 1, timeout_s=0.1)
+    # The master does not receive the frames it publishes, as write() blocks their ID.
+    assert frames == []
+    master.register_id(0x3c)
+    master.write(PLINMessage(id=0x3d, len=8, dir=PLINFrameDirection.SUBSCRIBER))
+    assert read_frames(master, 1)[0].flags == PLINFrameErrorFlag.SLV_NOT_RSP
+
+
+def test_write_many(master):
+    master.register_id(0x3d)
+    # More frames than the transmit queue holds: write_many() waits for free space instead of losing frames.
+    messages = [PLINMessage(id=0x3d, len=8, dir=PLINFrameDirection.SUBSCRIBER) for _ in range(100)]
+    assert master.write_many(messages) == 100
+    assert len(read_frames(master, 100)) == 100
+
+
+def test_overrun(emulator):
+    emulator.rx_queue_size = 4
+    plin = EmulatedPLIN(emulator)
+    plin.start(mode=PLINMode.SLAVE, baudrate=19200)
+    # Fill the socket so the device queue backs up.
+    emulator.inject(PLINMessage(id=1) for _ in range(10000))
+    assert plin.get_status()["usb_rx_ovr"] > 0
+    plin.stop()
+
+
+def test_frame_time():
+    assert frame_time_us(8, 19200) == pytest.approx((34 + 90) / 19200 * 1e6)
+    assert frame_time_us(0, 20000) == 1700
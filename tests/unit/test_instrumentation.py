@@ -0,0 +1,32 @@
+import errno
+
+import pytest
+from plin.device import PLIOGETSTATUS, PLIOSETIDFILTER, PLINIoctlError
+from plin.instrumentation import PLINInstrumentation
+
+
+def test_instrumentation(master):
+    spans = []
+    master.instrumentation = PLINInstrumentation(on_ioctl=spans.append)
+    for _ in range(3):
+        master.get_status()
+    master.set_id_filter(bytearray(8))
+
+    snapshot = master.instrumentation.snapshot()
+    assert snapshot["PLIOGETSTATUS"]["calls"] == 3
+    assert snapshot["PLIOSETIDFILTER"]["calls"] == 1
+    assert snapshot["PLIOGETSTATUS"]["p50_us"] <= snapshot["PLIOGETSTATUS"]["max_us"]
+    assert [span.request for span in spans] == [PLIOGETSTATUS] * 3 + [PLIOSETIDFILTER]
+    assert all(span.errno == 0 and span.duration_ns >= 0 for span in spans)
+
+    master.instrumentation.reset()
+    assert master.instrumentation.snapshot() == {}
+
+
+def test_ioctl_error(master):
+    master.instrumentation = PLINInstrumentation()
+    with pytest.raises(PLINIoctlError) as error:
+        master._ioctl(0x1234)
+    assert error.value.errno == errno.ENOTTY
+    assert error.value.name == "0x1234"
+    assert master.instrumentation.snapshot()["0x1234"]["errnos"] == {errno.ENOTTY: 1}
@@ -1,5 +1,6 @@
 import pytest
-from plin.structs import PLINMessage
+from plin.enums import *
+from plin.structs import PLINFrame, PLINMessage
 
 
 @pytest.fixture
@@ -9,3 +10,32 @@ def test_message():
 def test_set_message_data(test_message):
     test_message.data = bytearray([0xff])
     assert bytearray(test_message.data) == bytearray([0xff] + [0] * 7)
+
+
+def test_frame_from_buffer():
+    message = PLINMessage(type=PLINMessageType.FRAME, flags=PLINFrameErrorFlag.BAD_CS, id=0x22, len=2,
+                          dir=PLINFrameDirection.SUBSCRIBER, cs_type=PLINFrameChecksumType.ENHANCED,
+                          ts_us=123456789, data=bytearray([0x01, 0x02]))
+    frame = PLINFrame.from_buffer(bytes(message))
+
+    assert frame._asdict() == message._asdict()
+    assert frame.error_flags == PLINFrameErrorFlag.BAD_CS
+    assert frame.dir is PLINFrameDirection.SUBSCRIBER
+    assert bytes(frame.to_message()) == bytes(message)
+
+
+def test_frame_iter_buffer():
+    batch = (PLINMessage * 3)(*(PLINMessage(id=i, ts_us=i) for i in range(3)))
+    frames = list(PLINFrame.iter_buffer(batch))
+    assert [f.id for f in frames] == [0, 1, 2]
+    assert frames[1] == PLINFrame.from_buffer(bytes(batch[1]))
+
+
+def test_frame_read_only():
+    frame = PLINFrame(id=0x10, data=bytearray(8))
+    frames = {frame}
+    for name in ("id", "len", "ts_us", "data", "type"):
+        with pytest.raises(AttributeError):
+            setattr(frame, name, 1)
+    assert isinstance(frame.data, bytes)
+    assert PLINFrame(id=0x10) in frames
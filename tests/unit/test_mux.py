@@ -0,0 +1,101 @@
+import time
+
+import pytest
+from plin.capture import CaptureReader, CaptureWriter
+from plin.emulator import EmulatedPLIN, PLINEmulator
+from plin.enums import PLINMode
+from plin.mux import PLINMultiplexer
+from plin.structs import PLINMessage
+
+
+def write_capture(path, timestamps, id):
+    with CaptureWriter(str(path)) as writer:
+        writer.write([PLINMessage(id=id, ts_us=ts) for ts in timestamps])
+    return CaptureReader(str(path))
+
+
+def test_merge_captures(tmp_path):
+    first = write_capture(tmp_path / "a.plin", range(1000, 100000, 1000), 1)
+    second = write_capture(tmp_path / "b.plin", range(500_000, 600_000, 700), 2)
+    with first, second, PLINMultiplexer([first, second], chunk_frames=16) as mux:
+        frames = list(mux)
+        assert mux.exhausted
+
+    expected = sorted([(first.wall_ns + (ts - first.ts_us) * 1000, first.path, ts)
+                       for ts in range(1000, 100000, 1000)] +
+                      [(second.wall_ns + (ts - second.ts_us) * 1000, second.path, ts)
+                       for ts in range(500_000, 600_000, 700)])
+    assert [(f.host_ns, f.source, f.frame.ts_us) for f in frames] == expected
+    assert {f.frame.id for f in frames if f.source == second.path} == {2}
+    assert mux.late == 0
+
+
+@pytest.fixture
+def devices():
+    devices = []
+    for name in ("plin0", "plin1"):
+        plin = EmulatedPLIN(PLINEmulator(time_scale=0), interface=name)
+        plin.start(mode=PLINMode.SLAVE, baudrate=19200)
+        devices.append(plin)
+    yield devices
+    for plin in devices:
+        plin.stop()
+
+
+def test_merge_devices(devices):
+    with PLINMultiplexer(devices, latency_ms=20) as mux:
+        assert mux.poll() == []
+        start = time.monotonic()
+        for i in range(10):
+            for index, plin in enumerate(devices):
+                plin.emulator.inject([PLINMessage(id=index, ts_us=i * 1000 + index)])
+            time.sleep(0.002)
+        frames = []
+        while len(frames) < 20 and time.monotonic() - start < 2:
+            frames += mux.poll(timeout_ms=100)
+        assert not mux.exhausted
+
+    assert len(frames) == 20
+    assert [f.host_ns for f in frames] == sorted(f.host_ns for f in frames)
+    for index, plin in enumerate(devices):
+        assert [f.frame.ts_us for f in frames if f.source == plin.interface] == [i * 1000 + index for i in range(10)]
+
+
+def test_flush(devices, tmp_path):
+    capture = write_capture(tmp_path / "a.plin", range(0, 10000, 1000), 1)
+    clock = lambda: time.time_ns() + 120 * 10**9
+    with capture, PLINMultiplexer([devices[0], capture], latency_ms=60000, chunk_frames=4, clock=clock) as mux:
+        # The capture is older than the latency bound, the device frame is not.
+        devices[0].emulator.inject([PLINMessage(id=3, ts_us=5)])
+        frames = mux.poll(timeout_ms=50)
+        assert [f.source for f in frames] == [capture.path] * 10
+        assert [f.frame.id for f in mux.flush()] == [3]
+
+
+def test_capture_drift(tmp_path, monkeypatch):
+    base_ns = 1_700_000_000 * 10 ** 9
+    wall = [0]
+    monkeypatch.setattr("plin.capture.time.time_ns", lambda: wall[0])
+
+    def capture(path, id, offset_us, timestamp):
+        with CaptureWriter(str(path), anchor_us=1000000) as writer:
+            for second in range(100):
+                # One batch per second, written when its last frame was received.
+                host_us = [second * 1000000 + i * 10000 + offset_us for i in range(100)]
+                wall[0] = base_ns + host_us[-1] * 1000
+                writer.write([PLINMessage(id=id, ts_us=timestamp(us)) for us in host_us])
+        return CaptureReader(str(path))
+
+    # The clock of the first device runs 1000 ppm fast, the second device is reset after 50 seconds.
+    fast = capture(tmp_path / "a.plin", 1, 0, lambda us: 7000 + us + us // 1000)
+    reset = capture(tmp_path / "b.plin", 2, 5000, lambda us: 3000 + us - (50000000 if us >= 50000000 else 0))
+    with fast, reset, PLINMultiplexer([fast, reset], chunk_frames=256) as mux:
+        frames = list(mux)
+
+    assert mux.late == 0
+    # Both devices are aligned once the rate of the fast clock is known, after its second anchor.
+    assert [f.frame.id for f in frames[400:]] == [1, 2] * 9800
+    for f in frames:
+        # Frames were received every 10 ms, 5 ms later on the second device.
+        host_us = (f.host_ns - base_ns) / 1000 - (5000 if f.frame.id == 2 else 0)
+        assert abs(host_us - round(host_us / 10000) * 10000) < (1000 if host_us < 2000000 else 1)
@@ -0,0 +1,84 @@
+import functools
+import time
+
+import pytest
+from plin.device import PLINException
+from plin.emulator import EmulatedPLIN, PLINEmulator
+from plin.enums import PLINMode
+from plin.pipeline import FramePipeline, SharedFrameRing
+from plin.structs import PLINFrame, PLINMessage
+
+FRAMES = 2000
+
+
+def records(ids):
+    return b''.join(bytes(PLINMessage(id=i & 0x3f, ts_us=i)) for i in ids)
+
+
+def test_ring():
+    ring = SharedFrameRing(slots=4, slot_frames=2)
+    try:
+        reader = SharedFrameRing.attach(ring.name)
+        assert ring.write(records(range(3))) == 0
+        assert reader.counters() == (2, 3)
+        batch = reader.read(1)
+        assert (batch.sequence, batch.first_record, batch.count) == (1, 2, 1)
+        assert [f.ts_us for f in PLINFrame.iter_buffer(batch.data)] == [2]
+        assert reader.read(2) is None
+
+        for i in range(4):
+            ring.write(records([10 + i]))
+        # Batches 0 and 1 were overwritten.
+        assert reader.read(0) is None
+        assert reader.read(5).first_record == 6
+        reader.close()
+    finally:
+        ring.close()
+        ring.unlink()
+
+
+def open_device():
+    plin = EmulatedPLIN(PLINEmulator(time_scale=0, rx_queue_size=FRAMES))
+    plin.start(mode=PLINMode.SLAVE, baudrate=19200)
+    plin.emulator.inject(PLINMessage(id=i & 0x3f, ts_us=i) for i in range(FRAMES))
+    return plin
+
+
+def persist(directory, batch):
+    # Worker i of 2 handles the batches with sequence % 2 == i.
+    with open(f"{directory}/worker{batch.sequence % 2}.txt", 'a') as file:
+        for frame in PLINFrame.iter_buffer(batch.data):
+            file.write(f"{batch.sequence} {batch.missed} {frame.ts_us}\n")
+
+
+def test_pipeline(tmp_path):
+    pipeline = FramePipeline(open_device, functools.partial(persist, str(tmp_path)), workers=2,
+                             slots=64, slot_frames=32)
+    pipeline.start()
+    deadline = time.monotonic() + 10
+    while pipeline.ring.counters()[1] < FRAMES and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pipeline.stop()
+
+    lines = [line.split() for i in range(2) for line in (tmp_path / f"worker{i}.txt").read_text().splitlines()]
+    assert sorted(int(ts_us) for _, _, ts_us in lines) == list(range(FRAMES))
+    assert all(missed == "0" for _, missed, _ in lines)
+    assert {int(sequence) % 2 for sequence, _, _ in lines} == {0, 1}
+
+
+def fail(batch):
+    raise ValueError(f"bad batch {batch.sequence}")
+
+
+def test_worker_error():
+    pipeline = FramePipeline(open_device, fail, workers=1, slots=64, slot_frames=32)
+    with pytest.raises(PLINException, match="Pipeline not started"):
+        pipeline.stop()
+    pipeline.start()
+    deadline = time.monotonic() + 10
+    while not pipeline.failed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert pipeline.failed
+    with pytest.raises(PLINException, match="(?s)plin-pipeline-worker-0 failed:.*ValueError: bad batch 0"):
+        pipeline.stop()
+    assert pipeline.ring is None
@@ -0,0 +1,200 @@
+import errno
+import os
+import threading
+import time
+
+import pytest
+from plin.device import PLIN, PLINIoctlError
+from plin.enums import PLINLossSource, PLINMessageType, PLINOverflowPolicy
+from plin.instrumentation import PLINInstrumentation
+from plin.receiver import LossWindow, PLINReceiver
+from plin.structs import PLINMessage
+
+
+@pytest.fixture
+def plin_pipe():
+    plin = PLIN("/dev/plin0")
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    plin.fd = read_fd
+    yield plin, write_fd
+    os.close(read_fd)
+    os.close(write_fd)
+
+
+def write_frames(write_fd, ids, type=PLINMessageType.FRAME):
+    os.write(write_fd, b''.join(bytes(PLINMessage(type=type, id=i, ts_us=i * 1000)) for i in ids))
+
+
+def test_dispatch(plin_pipe):
+    plin, write_fd = plin_pipe
+    receiver = PLINReceiver(plin, poll_ms=10)
+    by_id = []
+    by_type = []
+    receiver.subscribe_id(0x22, lambda m: by_id.append(m.id))
+    receiver.subscribe_type(PLINMessageType.WAKEUP, lambda m: by_type.append(m.type))
+
+    receiver.start()
+    write_frames(write_fd, [0x21, 0x22, 0x22])
+    write_frames(write_fd, [0], type=PLINMessageType.WAKEUP)
+    deadline = time.monotonic() + 1
+    while receiver.received < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    receiver.stop()
+
+    assert by_id == [0x22, 0x22]
+    assert by_type == [PLINMessageType.WAKEUP]
+    assert receiver.dropped == 0
+
+
+def test_read_error():
+    plin = PLIN("/dev/plin0")
+    read_fd, write_fd = os.pipe()
+    os.set_blocking(read_fd, False)
+    plin.fd = read_fd
+    receiver = PLINReceiver(plin, poll_ms=10)
+    receiver.start()
+    os.close(write_fd)
+    deadline = time.monotonic() + 1
+    while receiver.error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    receiver.stop()
+    os.close(read_fd)
+    assert "end of file" in str(receiver.error)
+
+
+def test_drop_oldest(plin_pipe):
+    plin, write_fd = plin_pipe
+    receiver = PLINReceiver(plin, capacity=4, overflow=PLINOverflowPolicy.DROP_OLDEST, max_frames=4, poll_ms=10)
+    ids = []
+    losses = []
+    receiver.subscribe_type(PLINMessageType.FRAME, lambda m: ids.append(m.id))
+    receiver.subscribe_loss(losses.append)
+    write_frames(write_fd, range(10))
+
+    # Run the reader alone so the ring overflows before anything is dispatched.
+    receiver._running = True
+    reader = threading.Thread(target=receiver._read_loop)
+    reader.start()
+    deadline = time.monotonic() + 1
+    while receiver._head < 10 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    receiver._running = False
+    reader.join()
+    receiver._dispatch_pending()
+
+    assert ids == [6, 7, 8, 9]
+    assert receiver.dropped == 6
+    assert losses == [LossWindow(PLINLossSource.RING_OVERFLOW, None, 6000, 6)]
+
+
+def test_block(plin_pipe):
+    plin, write_fd = plin_pipe
+    receiver = PLINReceiver(plin, capacity=4, overflow=PLINOverflowPolicy.BLOCK, max_frames=4, poll_ms=10)
+    write_frames(write_fd, range(10))
+
+    receiver._running = True
+    reader = threading.Thread(target=receiver._read_loop)
+    reader.start()
+    time.sleep(0.05)
+    receiver._running = False
+    reader.join()
+
+    assert receiver._head == 4
+    assert plin.read_many(16, timeout_ms=0)[0].id == 4
+
+
+def test_overrun_message(plin_pipe):
+    plin, write_fd = plin_pipe
+    receiver = PLINReceiver(plin, poll_ms=10)
+    losses = []
+    optional = []
+    receiver.subscribe_loss(losses.append)
+    receiver.subscribe_type(PLINMessageType.FRAME, optional.append, optional=True)
+    write_frames(write_fd, [1, 2])
+    write_frames(write_fd, [3], type=PLINMessageType.OVERRUN)
+    write_frames(write_fd, [5])
+
+    receiver.start()
+    deadline = time.monotonic() + 1
+    while receiver.received < 4 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    receiver.stop()
+
+    assert losses == [LossWindow(PLINLossSource.DEVICE_OVERRUN, 2000, 5000, None)]
+    # The overrun put the receiver under pressure, so the optional callback missed the frame after it.
+    assert receiver.pressure
+    assert [m.id for m in optional] == [1, 2]
+
+
+def test_usb_overrun(emulator, slave):
+    receiver = PLINReceiver(slave, poll_ms=10, status_interval_ms=10)
+    losses = []
+    receiver.subscribe_loss(losses.append)
+
+    receiver.start()
+    time.sleep(0.05)
+    emulator.usb_rx_ovr += 2
+    deadline = time.monotonic() + 1
+    while not losses and time.monotonic() < deadline:
+        time.sleep(0.01)
+    receiver.stop()
+
+    assert [(loss.source, loss.count) for loss in losses] == [(PLINLossSource.USB_OVERRUN, 2)]
+
+
+def test_status_errors(plin_pipe, monkeypatch):
+    plin, _ = plin_pipe
+    receiver = PLINReceiver(plin)
+    errors = [errno.EBUSY, errno.ENOTTY]
+
+    def ioctl(request, *args):
+        raise PLINIoctlError(request, errors.pop(0))
+    monkeypatch.setattr(plin, "_ioctl", ioctl)
+
+    # Retried after a transient error, disabled if the device does not support it.
+    receiver._sample_status()
+    assert (receiver.status_interval_ms, receiver.status_errors) == (1000, 1)
+    receiver._sample_status()
+    assert receiver.status_interval_ms is None
+
+
+def test_sync_id_filter(emulator, slave):
+    slave.instrumentation = PLINInstrumentation()
+    slave.clear_id_filter()
+    receiver = PLINReceiver(slave, poll_ms=10, status_interval_ms=None, sync_id_filter=True)
+    # Nothing is blocked until the first subscription.
+    assert slave._id_filter == (1 << 64) - 1
+    before = slave.instrumentation.snapshot().get("PLIOSETIDFILTER", {}).get("calls", 0)
+    ids = []
+    optional = []
+    receiver.subscribe_ids([0x10, 0x11], ids.append)
+    receiver.subscribe_id(0x11, optional.append, optional=True)
+    assert receiver.id_mask == slave._id_filter == 0x30000
+
+    receiver.start()
+    emulator.inject(PLINMessage(id=i) for i in (0x10, 0x20, 0x11))
+    deadline = time.monotonic() + 1
+    while receiver.received < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    receiver.stop()
+    # 0x20 was dropped by the filter of the device.
+    assert [m.id for m in ids] == [0x10, 0x11]
+    assert receiver.received == 2
+
+    receiver.unsubscribe_ids([0x10, 0x11], ids.append)
+    assert slave._id_filter == 0x20000
+    receiver.subscribe_type(PLINMessageType.FRAME, lambda message: None)
+    assert slave._id_filter == (1 << 64) - 1
+    # Two changes of the union and the type subscription; the optional subscription and start() changed nothing.
+    assert slave.instrumentation.snapshot()["PLIOSETIDFILTER"]["calls"] == before + 3
+
+
+def test_sync_id_filter_at_start(slave):
+    slave.clear_id_filter()
+    receiver = PLINReceiver(slave, poll_ms=10, status_interval_ms=None, sync_id_filter=True)
+    assert slave._id_filter == (1 << 64) - 1
+    # Without subscriptions, the receiver takes over the filter when started.
+    receiver.start()
+    receiver.stop()
+    assert slave._id_filter == 0
@@ -0,0 +1,67 @@
+from unittest.mock import MagicMock
+
+import pytest
+from plin.enums import PLINUSBSlotType
+from plin.schedule import ScheduleSlot, ScheduleTable
+from plin.structs import PLINUSBAddScheduleSlot
+
+
+@pytest.fixture
+def device():
+    device = MagicMock()
+    device.delete_schedule.return_value = 0
+    handles = iter(range(100, 200))
+    device.add_schedule_slot.side_effect = lambda **kwargs: PLINUSBAddScheduleSlot(handle=next(handles))
+    return device
+
+
+@pytest.fixture
+def table():
+    return ScheduleTable({
+        0: [ScheduleSlot.unconditional(10, 0x22), ScheduleSlot.unconditional(10, 0x23)],
+        1: [ScheduleSlot.master_request(20), ScheduleSlot.slave_response(20)],
+    })
+
+
+def test_from_dict():
+    slot = {"schedule": 0, "slot_idx": 0, "err": 0, "type": PLINUSBSlotType.SPORADIC, "count_resolve": 0,
+            "delay": 10, "id": [1, 2, 0, 0, 0, 0, 0, 0], "handle": 7}
+    assert ScheduleSlot.from_dict(slot) == ScheduleSlot.sporadic(10, [1, 2])
+    slot.update(type=PLINUSBSlotType.MASTER_REQ, id=[0x3c] + [0] * 7)
+    assert ScheduleSlot.from_dict(slot).key() == ScheduleSlot.master_request(10).key()
+
+
+def test_apply_from_empty(device, table):
+    assert table.apply(device, current=ScheduleTable()) == 4
+    device.delete_schedule.assert_not_called()
+    assert table.handles[0] == [100, 101]
+    assert table.handles[1] == [102, 103]
+
+
+def test_apply_minimal_diff(device, table):
+    table.apply(device, current=ScheduleTable())
+    device.reset_mock()
+
+    new = ScheduleTable({
+        0: table[0] + [ScheduleSlot.unconditional(10, 0x24)],
+        1: table[1],
+        2: [ScheduleSlot.event_triggered(10, 0x10, 3)],
+    })
+    assert new.apply(device, current=table) == 2
+    device.delete_schedule.assert_not_called()
+    assert new.handles[0] == [100, 101, 104]
+    assert new.handles[1] == [102, 103]
+
+    device.reset_mock()
+    changed = ScheduleTable({0: [ScheduleSlot.unconditional(5, 0x22)]})
+    assert changed.apply(device, current=new) == 1
+    assert [c.args[0] for c in device.delete_schedule.mock_calls] == [0, 1, 2]
+
+    changed.set_breakpoint(device, schedule=0, slot=0)
+    device.set_schedule_breakpoint.assert_called_once_with(106, True)
+
+
+def test_apply_reads_device(device, table):
+    device.get_schedule_slots.return_value = []
+    table.apply(device)
+    assert device.get_schedule_slots.call_count == 8
@@ -0,0 +1,47 @@
+import pytest
+from plin.enums import *
+from plin.lin import frame_time_us
+from plin.statistics import BusStatistics
+from plin.structs import PLINFrame, PLINMessage
+
+
+def frame(id, ts_us, flags=0, len=8, cs_type=PLINFrameChecksumType.ENHANCED):
+    return PLINMessage(type=PLINMessageType.FRAME, id=id, ts_us=ts_us, flags=flags, len=len, cs_type=cs_type)
+
+
+def test_bus_statistics():
+    statistics = BusStatistics(baudrate=19200)
+    statistics.update_many([frame(0x10, 0), frame(0x20, 5000, flags=PLINFrameErrorFlag.SLV_NOT_RSP),
+                            frame(0x10, 10000), frame(0x10, 30000, flags=PLINFrameErrorFlag.BAD_CS,
+                                                      cs_type=PLINFrameChecksumType.CLASSIC)])
+    statistics.update(PLINMessage(type=PLINMessageType.OVERRUN))
+    statistics.update(PLINMessage(type=PLINMessageType.SLEEP))
+    snapshot = statistics.snapshot()
+
+    assert snapshot.frames == 4
+    assert (snapshot.overruns, snapshot.sleeps, snapshot.wakeups) == (1, 1, 0)
+    assert snapshot.span_us == 30000
+    assert snapshot.bus_time_us == pytest.approx(frame_time_us(0, 19200) + 2 * frame_time_us(8, 19200))
+    assert snapshot.bus_load == pytest.approx(snapshot.bus_time_us / 30000)
+
+    id_snapshot = snapshot.ids[0x10]
+    assert id_snapshot.frames == 3
+    assert id_snapshot.interval_mean_us == 15000
+    assert id_snapshot.interval_jitter_us == 5000
+    assert id_snapshot.interval_max_us == 20000
+    assert id_snapshot.rate_hz == pytest.approx(1000000 / 15000)
+    assert id_snapshot.errors == {PLINFrameErrorFlag.BAD_CS: 1}
+    assert id_snapshot.checksum_types == {PLINFrameChecksumType.ENHANCED: 2, PLINFrameChecksumType.CLASSIC: 1}
+    assert snapshot.ids[0x20].errors == {PLINFrameErrorFlag.SLV_NOT_RSP: 1}
+
+
+def test_bus_statistics_clock_reset():
+    statistics = BusStatistics()
+    statistics.update_many(PLINFrame.from_buffer(bytes(frame(0x10, ts_us))) for ts_us in (100000, 110000, 0, 10000))
+    snapshot = statistics.snapshot()
+    # The interval across the clock reset is skipped.
+    assert snapshot.ids[0x10].interval_max_us == 10000
+    assert snapshot.span_us == 10000
+
+    statistics.reset()
+    assert statistics.snapshot().ids == {}
@@ -0,0 +1,54 @@
+import pytest
+from plin.receiver import PLINReceiver
+from plin.transport import LINTPError, LINTPReassembler, LINTransport, segment
+
+
+def test_segment():
+    assert segment(0x22, b'\x22\xf1\x90') == [bytes([0x22, 0x03, 0x22, 0xf1, 0x90, 0xff, 0xff, 0xff])]
+    frames = segment(0x22, bytes(range(20)))
+    assert frames[0] == bytes([0x22, 0x10, 20, 0, 1, 2, 3, 4])
+    assert frames[1] == bytes([0x22, 0x21, 5, 6, 7, 8, 9, 10])
+    assert frames[-1] == bytes([0x22, 0x23, 17, 18, 19, 0xff, 0xff, 0xff])
+    with pytest.raises(ValueError):
+        segment(0x22, bytes(4096))
+
+
+def test_reassembler():
+    payload = bytes(range(256)) * 4
+    reassembler = LINTPReassembler(0x22)
+    results = [reassembler.feed(frame) for frame in segment(0x22, payload)]
+    assert results[-1] == (0x22, payload)
+    assert results[:-1] == [None] * (len(results) - 1)
+
+    # Frames of other nodes are ignored, a missing consecutive frame is an error.
+    assert reassembler.feed(segment(0x33, b'\x01')[0]) is None
+    frames = segment(0x22, bytes(20))
+    reassembler.feed(frames[0])
+    with pytest.raises(LINTPError):
+        reassembler.feed(frames[2])
+
+
+def test_request(diagnostic_master, slave_nodes):
+    slave_nodes({0x22}, lambda request: [bytes([request[0] + 0x40]) + request[1:] * 50])
+    transport = LINTransport(diagnostic_master)
+    transport.setup()
+    request = bytes([0x22]) + bytes(range(40))
+    assert transport.request(0x22, request) == bytes([0x62]) + bytes(range(40)) * 50
+
+
+def test_request_pending(diagnostic_master, slave_nodes):
+    slave_nodes({0x22}, lambda request: [bytes([0x7f, request[0], 0x78]), bytes([0x6e, 0xf1, 0x90])])
+    receiver = PLINReceiver(diagnostic_master, poll_ms=10, status_interval_ms=None)
+    receiver.start()
+    transport = LINTransport(diagnostic_master, receiver=receiver, p2_ms=200)
+    transport.setup()
+    assert transport.request(0x22, bytes([0x2e, 0xf1, 0x90, 0x01])) == bytes([0x6e, 0xf1, 0x90])
+    transport.close()
+    receiver.stop()
+
+
+def test_timeout(diagnostic_master):
+    transport = LINTransport(diagnostic_master, p2_ms=50)
+    transport.setup()
+    with pytest.raises(LINTPError, match="P2"):
+        transport.request(0x22, bytes([0x22, 0xf1, 0x90]))